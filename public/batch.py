@@ -0,0 +1,145 @@
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+
+from public.pack import Box, BoxCatalog, ItemGroup, PackedBox, pack
+
+
+@dataclass
+class OrderResult:
+    order_idx: int
+    packed_boxes: list[PackedBox] | None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# Set once per worker process by `_init_worker` so the catalog is only shipped
+# to each worker once, rather than with every chunk of orders
+_worker_catalog: BoxCatalog | None = None
+
+
+def _init_worker(catalog: BoxCatalog) -> None:
+    global _worker_catalog
+    _worker_catalog = catalog
+
+
+def _pack_order(
+    catalog: BoxCatalog,
+    order_idx: int,
+    item_groups: list[ItemGroup],
+    empty_space_ratio: float,
+) -> OrderResult:
+    try:
+        packed_boxes = pack(catalog, item_groups, empty_space_ratio)
+    except Exception as e:
+        # A single bad order shouldn't take the rest of the batch down with it
+        return OrderResult(order_idx, None, f"{type(e).__name__}: {e}")
+    return OrderResult(order_idx, packed_boxes)
+
+
+def _pack_chunk(
+    start_idx: int,
+    orders: list[list[ItemGroup]],
+    empty_space_ratio: float,
+) -> list[OrderResult]:
+    return [
+        _pack_order(_worker_catalog, start_idx + idx, item_groups, empty_space_ratio)
+        for idx, item_groups in enumerate(orders)
+    ]
+
+
+def pack_many(
+    boxes: list[Box] | BoxCatalog,
+    orders: list[list[ItemGroup]],
+    empty_space_ratio: float,
+    workers: int | None = None,
+    chunk_size: int | None = None,
+) -> list[OrderResult]:
+    """Pack many orders against the same boxes, spread across processes
+
+    Results are returned in the same order as `orders`. Orders that fail to
+    pack are reported through `OrderResult.error` instead of raising.
+    """
+    catalog = boxes if isinstance(boxes, BoxCatalog) else BoxCatalog(boxes)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(orders)))
+
+    if workers == 1:
+        return [
+            _pack_order(catalog, idx, item_groups, empty_space_ratio)
+            for idx, item_groups in enumerate(orders)
+        ]
+
+    if chunk_size is None:
+        # A few chunks per worker keeps them busy when order sizes are uneven
+        chunk_size = max(1, -(-len(orders) // (workers * 4)))
+
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(catalog,),
+    ) as executor:
+        futures = [
+            executor.submit(_pack_chunk, start_idx, orders[start_idx:start_idx + chunk_size], empty_space_ratio)
+            for start_idx in range(0, len(orders), chunk_size)
+        ]
+        # Futures are in submission order, so results stay in input order
+        for future in futures:
+            results.extend(future.result())
+
+    return results
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def pack_stream(
+    boxes: list[Box] | BoxCatalog,
+    orders: Iterable[list[ItemGroup]],
+    empty_space_ratio: float,
+    workers: int | None = None,
+    chunk_size: int = 64,
+    max_pending: int | None = None,
+) -> Iterator[OrderResult]:
+    """Lazily pack a stream of orders, yielding results in input order
+
+    Orders are only pulled from `orders` as earlier chunks finish, with at most
+    `max_pending` chunks in flight, so memory use doesn't grow with the input.
+    """
+    catalog = boxes if isinstance(boxes, BoxCatalog) else BoxCatalog(boxes)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        for order_idx, item_groups in enumerate(orders):
+            yield _pack_order(catalog, order_idx, item_groups, empty_space_ratio)
+        return
+
+    if max_pending is None:
+        max_pending = workers * 2
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(catalog,),
+    ) as executor:
+        pending = deque()
+        start_idx = 0
+        for chunk in chunked(orders, chunk_size):
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(_pack_chunk, start_idx, chunk, empty_space_ratio))
+            start_idx += len(chunk)
+        while pending:
+            yield from pending.popleft().result()
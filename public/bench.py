@@ -0,0 +1,719 @@
+"""Benchmarks for `pack` and `SolverService`
+
+Run from the repository root:
+
+    python -m public.bench suite                    # Run the suite
+    python -m public.bench suite --save-baseline    # Record a new baseline
+    python -m public.bench suite --compare          # Fail on regressions
+    python -m public.bench micro                    # Time/memory per call
+    python -m public.bench mip                      # Compare MIP formulations
+    python -m public.bench encode                   # Compare result encodings
+    python -m public.bench check                    # Fail on wrong results
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from public.pack import Box, BoxCatalog, Dimensions, DoesNotFitError, Engine, Item, ItemGroup, PackedBox, PackedItems, Pattern, Point, pack
+from public.validate import ViolationKind, cuboids_overlap, overlapping_pairs, validate_packed_boxes, validate_placements
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+
+
+@dataclass
+class PackMeasurement:
+    orders: int
+    seconds_per_call: float
+    peak_kib_per_call: float
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    orders: int
+    failures: int
+    throughput: float  # Orders per second
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    boxes_per_order: float
+    fill_ratio: float  # Packed item volume over used box volume
+    # Mean time to validate each result, which isn't included in the
+    # timings above, and how many results were invalid
+    validate_ms: float = 0.0
+    invalid: int = 0
+
+
+def random_boxes(rng: random.Random, count: int) -> list[Box]:
+    return [
+        Box(f"Box {idx}", f"Box {idx}", Dimensions(*(float(rng.randrange(200, 1000, 50)) for _ in range(3))))
+        for idx in range(count)
+    ]
+
+
+def random_items(rng: random.Random, count: int) -> list[Item]:
+    return [
+        Item(f"Item {idx}", f"Item {idx}", Dimensions(*(float(rng.randrange(20, 300, 10)) for _ in range(3))))
+        for idx in range(count)
+    ]
+
+
+def random_order(rng: random.Random, lines: int, max_quantity: int) -> list[ItemGroup]:
+    return [
+        ItemGroup(item, rng.randint(1, max_quantity))
+        for item in random_items(rng, lines)
+    ]
+
+
+# Order mixes, each drawing from a shared pool of SKUs so that shapes repeat
+# across orders like they would in production
+
+def standard_order(rng: random.Random, skus: list[Item]) -> list[ItemGroup]:
+    # ~90% of orders are a single item, ~8% are two and the rest are more
+    roll = rng.random()
+    if roll < 0.9:
+        return [ItemGroup(rng.choice(skus), 1)]
+    elif roll < 0.98:
+        if rng.random() < 0.5:
+            return [ItemGroup(rng.choice(skus), 2)]
+        return [ItemGroup(item, 1) for item in rng.sample(skus, 2)]
+    return [ItemGroup(item, rng.randint(1, 3)) for item in rng.sample(skus, rng.randint(3, 10))]
+
+
+def bulk_order(rng: random.Random, skus: list[Item]) -> list[ItemGroup]:
+    # Wholesale orders of lots of the same SKU
+    return [ItemGroup(item, rng.randint(20, 200)) for item in rng.sample(skus, rng.randint(1, 2))]
+
+
+def long_tail_order(rng: random.Random, skus: list[Item]) -> list[ItemGroup]:
+    # Many different SKUs, skewed towards the most popular ones
+    weights = [1 / (rank + 1) for rank in range(len(skus))]
+    lines = {id(item): item for item in rng.choices(skus, weights, k=rng.randint(5, 40))}
+    return [ItemGroup(item, rng.randint(1, 3)) for item in lines.values()]
+
+
+ORDER_MIXES: dict[str, Callable[[random.Random, list[Item]], list[ItemGroup]]] = {
+    "standard": standard_order,
+    "bulk": bulk_order,
+    "long_tail": long_tail_order,
+}
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def packed_volume(packed_boxes: list[PackedBox]) -> tuple[float, float]:
+    # Returns the volume of the packed items, and of the boxes they're in
+    item_volume = sum(
+        packed_items.dimensions.volume
+        for packed_box in packed_boxes
+        for packed_items in packed_box.packed_items
+    )
+    box_volume = sum(packed_box.box.dimensions.volume for packed_box in packed_boxes)
+    return item_volume, box_volume
+
+
+def run_pack_scenario(
+    name: str,
+    catalog: BoxCatalog,
+    orders: list[list[ItemGroup]],
+    empty_space_ratio: float,
+    **pack_kwargs,
+) -> ScenarioResult:
+    latencies = []
+    failures = 0
+    boxes_used = 0
+    item_volume = 0.0
+    box_volume = 0.0
+    results = []
+    start = time.perf_counter()
+    for item_groups in orders:
+        order_start = time.perf_counter()
+        try:
+            packed_boxes = pack(catalog, item_groups, empty_space_ratio, **pack_kwargs)
+        except Exception:
+            failures += 1
+            continue
+        finally:
+            latencies.append(time.perf_counter() - order_start)
+        results.append((packed_boxes, item_groups))
+        boxes_used += len(packed_boxes)
+        order_item_volume, order_box_volume = packed_volume(packed_boxes)
+        item_volume += order_item_volume
+        box_volume += order_box_volume
+    seconds = time.perf_counter() - start
+
+    # Validated after packing everything, so it doesn't slow down the timings
+    invalid = 0
+    validate_start = time.perf_counter()
+    for packed_boxes, item_groups in results:
+        if validate_packed_boxes(packed_boxes, item_groups):
+            invalid += 1
+    validate_seconds = time.perf_counter() - validate_start
+
+    result = scenario_result(name, latencies, seconds, failures, boxes_used, item_volume, box_volume)
+    result.validate_ms = validate_seconds / max(1, len(results)) * 1000
+    result.invalid = invalid
+    return result
+
+
+def random_solver_instance(rng: random.Random, items_per_instance: int):
+    from public.mip import Box as SolverBox, Item as SolverItem
+
+    box = SolverBox("Box", *(float(rng.randrange(200, 600, 50)) for _ in range(3)))
+    items = [
+        SolverItem(f"Item {idx}", *(float(rng.randrange(50, 300, 10)) for _ in range(3)))
+        for idx in range(items_per_instance)
+    ]
+    return box, items
+
+
+def run_solver_scenario(
+    name: str,
+    rng: random.Random,
+    instances: int,
+    items_per_instance: int,
+    formulation: str = "full",
+) -> ScenarioResult | None:
+    try:
+        from public.mip import SolverService, dims_of
+    except ImportError:
+        return None
+
+    latencies = []
+    item_volume = 0.0
+    box_volume = 0.0
+    invalid = 0
+    validate_seconds = 0.0
+    start = time.perf_counter()
+    for _ in range(instances):
+        box, items = random_solver_instance(rng, items_per_instance)
+        service = SolverService(box, items, verbose=False, formulation=formulation)
+        instance_start = time.perf_counter()
+        service.optimise()
+        latencies.append(time.perf_counter() - instance_start)
+
+        placements = service.placements()
+        validate_start = time.perf_counter()
+        if validate_placements(dims_of(box), [dims_of(item) for item in items], placements):
+            invalid += 1
+        validate_seconds += time.perf_counter() - validate_start
+
+        box_volume += box.volume
+        for placement in placements:
+            item_volume += placement.dims[0] * placement.dims[1] * placement.dims[2]
+    seconds = time.perf_counter() - start - validate_seconds
+
+    result = scenario_result(name, latencies, seconds, 0, instances, item_volume, box_volume)
+    result.validate_ms = validate_seconds / max(1, instances) * 1000
+    result.invalid = invalid
+    return result
+
+
+def scenario_result(
+    name: str,
+    latencies: list[float],
+    seconds: float,
+    failures: int,
+    boxes_used: int,
+    item_volume: float,
+    box_volume: float,
+) -> ScenarioResult:
+    latencies = sorted(latencies)
+    return ScenarioResult(
+        name=name,
+        orders=len(latencies),
+        failures=failures,
+        throughput=len(latencies) / seconds if seconds else 0.0,
+        p50_ms=percentile(latencies, 0.50) * 1000,
+        p95_ms=percentile(latencies, 0.95) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        boxes_per_order=boxes_used / max(1, len(latencies) - failures),
+        fill_ratio=item_volume / box_volume if box_volume else 0.0,
+    )
+
+
+def run_suite(
+    seed: int,
+    orders: int,
+    catalog_sizes: list[int],
+    skus: int,
+    empty_space_ratio: float,
+    solver_instances: int,
+) -> list[ScenarioResult]:
+    results = []
+    for catalog_size in catalog_sizes:
+        for mix_name, make_order in ORDER_MIXES.items():
+            # Seeded per scenario, so adding scenarios doesn't change others
+            rng = random.Random(f"{seed}-{catalog_size}-{mix_name}")
+            catalog = BoxCatalog(random_boxes(rng, catalog_size))
+            sku_pool = random_items(rng, skus)
+            scenario_orders = [make_order(rng, sku_pool) for _ in range(orders)]
+            # Bulk orders are much bigger, so fewer keep the suite quick
+            if mix_name == "bulk":
+                scenario_orders = scenario_orders[:max(1, orders // 20)]
+            results.append(run_pack_scenario(
+                f"pack/{mix_name}/{catalog_size}_boxes",
+                catalog,
+                scenario_orders,
+                empty_space_ratio,
+            ))
+
+    if solver_instances:
+        for formulation, suffix in (("full", ""), ("reduced", "/reduced")):
+            solver_result = run_solver_scenario(
+                f"solver/single_box/5_items{suffix}",
+                random.Random(f"{seed}-solver"),
+                solver_instances,
+                5,
+                formulation,
+            )
+            if solver_result is not None:
+                results.append(solver_result)
+
+    return results
+
+
+def compare_to_baseline(
+    results: list[ScenarioResult],
+    baseline: dict[str, dict],
+    tolerance: float,
+) -> list[str]:
+    # Timings are allowed to drift by the tolerance, but packing quality
+    # should only ever change on purpose
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.throughput < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{result.name}: throughput {result.throughput:.1f}/s < {base['throughput']:.1f}/s")
+        if result.p95_ms > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{result.name}: p95 {result.p95_ms:.2f}ms > {base['p95_ms']:.2f}ms")
+        if result.boxes_per_order > base["boxes_per_order"] + 1e-9:
+            regressions.append(f"{result.name}: boxes/order {result.boxes_per_order:.3f} > {base['boxes_per_order']:.3f}")
+        if result.fill_ratio < base["fill_ratio"] - 1e-9:
+            regressions.append(f"{result.name}: fill ratio {result.fill_ratio:.3f} < {base['fill_ratio']:.3f}")
+        if result.failures > base["failures"]:
+            regressions.append(f"{result.name}: failures {result.failures} > {base['failures']}")
+        if result.invalid > base.get("invalid", 0):
+            regressions.append(f"{result.name}: invalid results {result.invalid} > {base.get('invalid', 0)}")
+    return regressions
+
+
+def print_results(results: list[ScenarioResult]) -> None:
+    print(
+        f"{'scenario':<32} {'orders':>6} {'fail':>4} {'orders/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'boxes':>6} {'fill':>6} {'valid ms':>8} {'invalid':>7}"
+    )
+    for result in results:
+        print(
+            f"{result.name:<32} {result.orders:>6} {result.failures:>4} {result.throughput:>9.1f} "
+            f"{result.p50_ms:>8.2f} {result.p95_ms:>8.2f} {result.p99_ms:>8.2f} "
+            f"{result.boxes_per_order:>6.2f} {result.fill_ratio:>6.3f} {result.validate_ms:>8.3f} {result.invalid:>7}"
+        )
+
+
+def measure_pack(
+    boxes: list[Box] | BoxCatalog,
+    orders: list[list[ItemGroup]],
+    empty_space_ratio: float,
+) -> PackMeasurement:
+    start = time.perf_counter()
+    for item_groups in orders:
+        pack(boxes, item_groups, empty_space_ratio)
+    seconds = time.perf_counter() - start
+
+    # Traced separately as tracing slows everything down
+    peak_bytes = 0
+    tracemalloc.start()
+    try:
+        for item_groups in orders:
+            tracemalloc.reset_peak()
+            start_bytes, _ = tracemalloc.get_traced_memory()
+            pack(boxes, item_groups, empty_space_ratio)
+            _, call_peak_bytes = tracemalloc.get_traced_memory()
+            peak_bytes += call_peak_bytes - start_bytes
+    finally:
+        tracemalloc.stop()
+
+    return PackMeasurement(len(orders), seconds / len(orders), peak_bytes / len(orders) / 1024)
+
+
+def compare_formulations(
+    seed: int,
+    instances: int,
+    item_counts: list[int],
+    warm_start: bool = False,
+    max_seconds: float | None = None,
+) -> None:
+    # Model size and solve time of each MIP formulation on the same instances
+    from public.mip import Formulation, SolverService
+
+    print(
+        f"{'items':>5} {'formulation':<11} {'vars':>7} {'binary':>7} {'rows':>7} {'start':>7} {'picked':>7} "
+        f"{'gap':>6} {'build ms':>8} {'mean s':>8} {'max s':>8}"
+    )
+    for item_count in item_counts:
+        rng = random.Random(f"{seed}-mip-{item_count}")
+        solver_instances = [random_solver_instance(rng, item_count) for _ in range(instances)]
+        for formulation in Formulation:
+            sizes = []
+            started = 0
+            picked = 0
+            gaps = []
+            build_seconds = []
+            latencies = []
+            for box, items in solver_instances:
+                service = SolverService(box, items, verbose=False, formulation=formulation)
+                start = time.perf_counter()
+                placements = service.heuristic_start() if warm_start else None
+                result = service.optimise(placements, max_seconds)
+                latencies.append(time.perf_counter() - start)
+                sizes.append(service.model_size())
+                started += len(placements or [])
+                picked += result.picked
+                gaps.append(result.gap)
+                build_seconds.append(result.build_seconds)
+            print(
+                f"{item_count:>5} {formulation:<11} "
+                f"{statistics.mean(size.variables for size in sizes):>7.0f} "
+                f"{statistics.mean(size.binary_variables for size in sizes):>7.0f} "
+                f"{statistics.mean(size.constraints for size in sizes):>7.0f} "
+                f"{started / instances:>7.2f} {picked / instances:>7.2f} {statistics.mean(gaps):>6.2f} "
+                f"{statistics.mean(build_seconds) * 1000:>8.2f} "
+                f"{statistics.mean(latencies):>8.3f} {max(latencies):>8.3f}"
+            )
+
+
+def compare_encodings(seed: int, boxes: int, orders: int, max_lines: int, empty_space_ratio: float) -> None:
+    # Time and size of encoding the same packed orders per order as JSON,
+    # and in bulk as columns
+    from public.columnar import ColumnarPacking
+    from public.serialize import packed_box_to_dict
+
+    rng = random.Random(seed)
+    catalog = BoxCatalog(random_boxes(rng, boxes))
+    packed_orders = [
+        pack(catalog, random_order(rng, rng.randint(1, max_lines), 10), empty_space_ratio)
+        for _ in range(orders)
+    ]
+
+    def per_order_json() -> bytes:
+        return "\n".join(
+            json.dumps([packed_box_to_dict(packed_box) for packed_box in packed_boxes])
+            for packed_boxes in packed_orders
+        ).encode()
+
+    encoders = [
+        ("json per order", per_order_json),
+        ("columnar json", lambda: ColumnarPacking.from_orders(packed_orders).to_json().encode()),
+        ("columnar binary", lambda: ColumnarPacking.from_orders(packed_orders).to_bytes()),
+    ]
+    print(f"{'encoding':<16} {'encode ms':>10} {'KiB':>9}")
+    for name, encode in encoders:
+        start = time.perf_counter()
+        encoded = encode()
+        seconds = time.perf_counter() - start
+        print(f"{name:<16} {seconds * 1000:>10.1f} {len(encoded) / 1024:>9.1f}")
+
+    encoded = ColumnarPacking.from_orders(packed_orders).to_bytes()
+    start = time.perf_counter()
+    ColumnarPacking.from_bytes(encoded)
+    print(f"{'binary decode':<16} {(time.perf_counter() - start) * 1000:>10.1f}")
+
+
+def check_engines(seed: int, boxes: int, orders: int, empty_space_ratio: float) -> list[str]:
+    # The numpy engine should find exactly the same spaces as the python one
+    from public.serialize import packed_box_to_dict
+
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return []
+
+    rng = random.Random(f"{seed}-engines")
+    catalog = BoxCatalog(random_boxes(rng, boxes))
+    failures = []
+    for order_idx in range(orders):
+        item_groups = random_order(rng, rng.randint(3, 60), 10)
+        expected = [packed_box_to_dict(packed_box) for packed_box in pack(catalog, item_groups, empty_space_ratio)]
+        try:
+            packed_boxes = pack(catalog, item_groups, empty_space_ratio, engine=Engine.NUMPY)
+        except Exception as e:
+            failures.append(f"engines: order {order_idx} failed with the numpy engine: {e!r}")
+            continue
+        if [packed_box_to_dict(packed_box) for packed_box in packed_boxes] != expected:
+            failures.append(f"engines: order {order_idx} packed differently by the numpy engine")
+    return failures
+
+
+def check_validator(seed: int) -> list[str]:
+    failures = []
+    box = Box("box", "Box", Dimensions(10, 10, 10))
+    item = Item("item", "Item", Dimensions(5, 10, 10))
+
+    def packed_box(*xs: float) -> PackedBox:
+        return PackedBox(box, [
+            PackedItems(0, [ItemGroup(item, 1)], Point(x, 0, 0), item.dimensions, Pattern(1, 1, 1))
+            for x in xs
+        ])
+
+    # Touching faces is fine, but half an item's overlap isn't
+    cases = (
+        ("side by side", packed_box(0, 5), set()),
+        ("overlapping", packed_box(0, 2.5), {ViolationKind.OVERLAP}),
+        ("outside the box", packed_box(0, 7.5), {ViolationKind.OUTSIDE_BOX}),
+        ("missing an item", packed_box(0), {ViolationKind.QUANTITY}),
+    )
+    for name, case, expected in cases:
+        kinds = {violation.kind for violation in validate_packed_boxes([case], [ItemGroup(item, 2)])}
+        if kinds != expected:
+            failures.append(f"validator: {name} found {sorted(kinds)}, not {sorted(expected)}")
+
+    # The sweep should find exactly the pairs checking every pair does
+    rng = random.Random(f"{seed}-validator")
+    for case_idx in range(200):
+        cuboids = [
+            (*(rng.randint(0, 20) for _ in range(3)), *(rng.choice((0, 1, 2, 5, 30)) for _ in range(3)))
+            for _ in range(rng.randint(0, 80))
+        ]
+        expected = [
+            (a_idx, b_idx)
+            for a_idx in range(len(cuboids))
+            for b_idx in range(a_idx + 1, len(cuboids))
+            if cuboids_overlap(cuboids[a_idx], cuboids[b_idx])
+        ]
+        if sorted(overlapping_pairs(cuboids)) != expected:
+            failures.append(f"validator: case {case_idx} found different overlapping pairs to checking every pair")
+    return failures
+
+
+def check_does_not_fit() -> list[str]:
+    # Items too big for every box are reported as such whichever way the
+    # order is packed, so callers can tell them apart from other errors
+    boxes = [Box("box", "Box", Dimensions(100, 100, 100))]
+    small = ItemGroup(Item("a", "A", Dimensions(10, 10, 10)), 1)
+    big = ItemGroup(Item("b", "B", Dimensions(10, 10, 200)), 3)
+    failures = []
+    for name, item_groups, beam_width in [
+        ("small order", [big], None),
+        ("general", [small, big], None),
+        ("beam", [small, big], 2),
+    ]:
+        try:
+            pack(boxes, item_groups, 1.1, beam_width=beam_width)
+        except DoesNotFitError:
+            continue
+        except Exception as e:
+            failures.append(f"does not fit: {name} raised {type(e).__name__}: {e}")
+        else:
+            failures.append(f"does not fit: {name} packed an item bigger than every box")
+    return failures
+
+
+def check_cache() -> list[str]:
+    # One item in two of an order's item groups, then a hit for an order
+    # with a different item in each
+    from public.cache import PackingCache
+
+    boxes = [Box("box", "Box", Dimensions(100, 100, 100))]
+    cache = PackingCache()
+    item = Item("a", "A", Dimensions(10, 20, 30))
+    cache.pack(boxes, [ItemGroup(item, 1), ItemGroup(item, 5)], 1.1)
+    item_groups = [ItemGroup(Item("b", "B", Dimensions(10, 20, 30)), 1), ItemGroup(Item("c", "C", Dimensions(30, 20, 10)), 5)]
+    violations = validate_packed_boxes(cache.pack(boxes, item_groups, 1.1), item_groups)
+    return [f"cache: {violation.message}" for violation in violations]
+
+
+def check_session() -> list[str]:
+    # The largest box by volume isn't always one an item fits, and an
+    # arrival that can't be placed must leave the session as it was
+    import public.session
+    from public.session import PackingSession
+
+    failures = []
+    boxes = [Box("A", "A", Dimensions(300, 300, 300)), Box("B", "B", Dimensions(200, 600, 650))]
+    item = Item("item", "Item", Dimensions(290, 280, 290))
+    for quantity, expected_volume in ((2, None), (1, 5e7)):
+        session = PackingSession(boxes, expected_volume=expected_volume)
+        try:
+            session.add(ItemGroup(item, quantity))
+        except ValueError as e:
+            failures.append(f"session: adding {quantity} failed: {e}")
+            continue
+        box_ids = [box.id for box in session.used_boxes]
+        if box_ids != ["A"] * quantity:
+            failures.append(f"session: adding {quantity} opened {box_ids}")
+
+    session = PackingSession(boxes)
+    session.add(ItemGroup(item, 1))
+    before = session.to_dict()
+    place_congruency_group = public.session.place_congruency_group
+    calls = 0
+
+    def failing_place(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise ValueError("Placement failed")
+        return place_congruency_group(*args, **kwargs)
+
+    public.session.place_congruency_group = failing_place
+    try:
+        session.add(ItemGroup(item, 2))
+    except ValueError:
+        pass
+    finally:
+        public.session.place_congruency_group = place_congruency_group
+    if session.to_dict() != before:
+        failures.append("session: a failed arrival changed the session")
+    return failures
+
+
+def check_multi_box() -> list[str]:
+    # Items in different boxes must be free to sit anywhere in their own
+    # box. Here a fits in C or D and b in D or E, and the best packing puts
+    # them in C and E
+    from public.mip import Box as SolverBox, Item as SolverItem, MultiBoxMode, MultiBoxSolverService
+
+    boxes = [SolverBox("C", 1000, 20, 20), SolverBox("D", 100, 500, 500), SolverBox("E", 95, 455, 455)]
+    items = [SolverItem("a", 400, 10, 10), SolverItem("b", 90, 450, 450)]
+    failures = []
+    for mode in MultiBoxMode:
+        result = MultiBoxSolverService(boxes, items, verbose=False, mode=mode, workers=1).optimise()
+        box_names = sorted(box_solution.box.name for box_solution in result.boxes)
+        if mode == MultiBoxMode.MONOLITHIC and box_names != ["C", "E"]:
+            failures.append(f"multi-box: {mode} packed into {box_names}, not ['C', 'E']")
+        if result.optimal and result.volume > 20067375:
+            failures.append(f"multi-box: {mode} claimed volume {result.volume} is optimal")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    suite_parser = subparsers.add_parser("suite", help="Run the order mix scenarios")
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("--orders", type=int, default=1000)
+    suite_parser.add_argument("--catalog-sizes", type=int, nargs="+", default=[10, 200])
+    suite_parser.add_argument("--skus", type=int, default=500)
+    suite_parser.add_argument("--empty-space-ratio", type=float, default=1.1)
+    suite_parser.add_argument("--solver-instances", type=int, default=5)
+    suite_parser.add_argument("--baseline", default=BASELINE_PATH)
+    suite_parser.add_argument("--save-baseline", action="store_true")
+    suite_parser.add_argument("--compare", action="store_true")
+    suite_parser.add_argument("--tolerance", type=float, default=0.25)
+    suite_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    micro_parser = subparsers.add_parser("micro", help="Time and peak memory per call on large orders")
+    micro_parser.add_argument("--seed", type=int, default=0)
+    micro_parser.add_argument("--boxes", type=int, default=50)
+    micro_parser.add_argument("--orders", type=int, default=20)
+    micro_parser.add_argument("--lines", type=int, nargs="+", default=[10, 50, 200])
+    micro_parser.add_argument("--max-quantity", type=int, default=10)
+    micro_parser.add_argument("--empty-space-ratio", type=float, default=1.1)
+
+    mip_parser = subparsers.add_parser("mip", help="Model size and solve time of each MIP formulation")
+    mip_parser.add_argument("--seed", type=int, default=0)
+    mip_parser.add_argument("--instances", type=int, default=5)
+    mip_parser.add_argument("--items", type=int, nargs="+", default=[4, 5, 6])
+    mip_parser.add_argument("--warm-start", action="store_true", help="Start from the heuristic packing")
+    mip_parser.add_argument("--max-seconds", type=float, help="Time limit per solve")
+
+    encode_parser = subparsers.add_parser("encode", help="Time and size of each result encoding")
+    encode_parser.add_argument("--seed", type=int, default=0)
+    encode_parser.add_argument("--boxes", type=int, default=50)
+    encode_parser.add_argument("--orders", type=int, default=2000)
+    encode_parser.add_argument("--max-lines", type=int, default=20)
+    encode_parser.add_argument("--empty-space-ratio", type=float, default=1.1)
+
+    check_parser = subparsers.add_parser("check", help="Check results are valid and engines agree")
+    check_parser.add_argument("--seed", type=int, default=0)
+    check_parser.add_argument("--boxes", type=int, default=50)
+    check_parser.add_argument("--orders", type=int, default=400)
+    check_parser.add_argument("--empty-space-ratio", type=float, default=1.1)
+
+    args = parser.parse_args()
+
+    if args.command == "check":
+        failures = check_engines(args.seed, args.boxes, args.orders, args.empty_space_ratio)
+        failures += check_validator(args.seed)
+        failures += check_does_not_fit()
+        failures += check_cache()
+        failures += check_session()
+        failures += check_multi_box()
+        for failure in failures:
+            print(f"FAILED {failure}")
+        if failures:
+            sys.exit(1)
+        print("All checks passed")
+        return
+
+    if args.command == "encode":
+        compare_encodings(args.seed, args.boxes, args.orders, args.max_lines, args.empty_space_ratio)
+        return
+
+    if args.command == "mip":
+        compare_formulations(args.seed, args.instances, args.items, args.warm_start, args.max_seconds)
+        return
+
+    if args.command == "micro":
+        rng = random.Random(args.seed)
+        boxes = BoxCatalog(random_boxes(rng, args.boxes))
+        for lines in args.lines:
+            orders = [random_order(rng, lines, args.max_quantity) for _ in range(args.orders)]
+            measurement = measure_pack(boxes, orders, args.empty_space_ratio)
+            print(
+                f"{lines:>5} lines: {measurement.seconds_per_call * 1000:8.2f} ms/call, "
+                f"{measurement.peak_kib_per_call:8.1f} KiB peak/call"
+            )
+        return
+
+    # Keep any output from the engines out of the results table
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_suite(
+            args.seed,
+            args.orders,
+            args.catalog_sizes,
+            args.skus,
+            args.empty_space_ratio,
+            args.solver_instances,
+        )
+
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({result.name: asdict(result) for result in results}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import math
+from dataclasses import dataclass
+
+from public.pack import Box, BoxCatalog, Dimensions, ItemGroup, PackedBox, pack
+
+# Volumes are products of dimensions, so may be out by rounding
+VOLUME_EPSILON = 1e-6
+
+
+@dataclass
+class PackingBounds:
+    # No packing of the items into boxes from the catalog uses fewer boxes,
+    # or less total box volume, than these
+    boxes: int
+    volume: float
+
+
+@dataclass
+class BoundedResult:
+    packed_boxes: list[PackedBox]
+    bounds: PackingBounds
+
+    @property
+    def boxes_optimal(self) -> bool:
+        return len(self.packed_boxes) <= self.bounds.boxes
+
+    @property
+    def optimal(self) -> bool:
+        return meets_bounds(self.bounds, self.packed_boxes)
+
+
+def meets_bounds(bounds: PackingBounds, packed_boxes: list[PackedBox]) -> bool:
+    # Provably the fewest boxes and the least box volume
+    return len(packed_boxes) <= bounds.boxes and packed_boxes_volume(packed_boxes) <= bounds.volume + VOLUME_EPSILON
+
+
+def packed_boxes_volume(packed_boxes: list[PackedBox]) -> float:
+    return sum(packed_box.box.dimensions.volume for packed_box in packed_boxes)
+
+
+def items_volume(item_groups: list[ItemGroup]) -> float:
+    return sum(item_group.item.dimensions.volume * item_group.quantity for item_group in item_groups)
+
+
+def volume_bound(catalog: BoxCatalog, item_groups: list[ItemGroup]) -> int:
+    # Every box holds at most the volume of the largest box
+    return max(0, math.ceil(items_volume(item_groups) / catalog.volumes[-1] - VOLUME_EPSILON))
+
+
+def dimension_bound(catalog: BoxCatalog, item_groups: list[ItemGroup]) -> int:
+    # Two items in a box are side by side along some axis, so one side of
+    # each adds up to at most the box's longest side. Items whose shortest
+    # side is over half the longest side of any box can't be side by side
+    # with each other, so each needs a box of its own (after Martello,
+    # Pisinger and Vigo's bounds for large items, allowing for rotation)
+    longest_side = max(box_dims[2] for box_dims in catalog.sorted_dimensions)
+    bound = 0
+    smallest_large_side = math.inf
+    largest_other_side = 0.0
+    for item_group in item_groups:
+        shortest_side = item_group.item.dimensions.sorted_axes[0]
+        if shortest_side > longest_side / 2:
+            bound += item_group.quantity
+            smallest_large_side = min(smallest_large_side, shortest_side)
+        else:
+            largest_other_side = max(largest_other_side, shortest_side)
+
+    # Nor can an item too long to be beside even the smallest large item
+    if bound and largest_other_side and largest_other_side + smallest_large_side > longest_side:
+        bound += 1
+    return bound
+
+
+def box_volume_bound(catalog: BoxCatalog, item_groups: list[ItemGroup], boxes: int) -> float:
+    # Least total volume of boxes holding the items, when at least `boxes`
+    # boxes are needed. Each item needs a box it fits in, and a single box
+    # needs to fit every item and their volume
+    volume = items_volume(item_groups)
+    largest_item_box_volume = 0.0
+    for item_group in item_groups:
+        box_idx = catalog.smallest_box_idx(item_group.item.dimensions)
+        if box_idx is not None:
+            largest_item_box_volume = max(largest_item_box_volume, catalog.volumes[box_idx])
+
+    # The box with the largest item, and the smallest boxes for the rest
+    several_boxes = max(volume, largest_item_box_volume + (max(boxes, 2) - 1) * catalog.volumes[0])
+    if boxes > 1:
+        return several_boxes
+
+    max_sorted_axes = Dimensions(*(
+        max(item_group.item.dimensions.sorted_axes[axis] for item_group in item_groups)
+        for axis in range(3)
+    ))
+    box_idx = catalog.smallest_box_idx(max_sorted_axes, volume)
+    one_box = math.inf if box_idx is None else catalog.volumes[box_idx]
+    return min(max(volume, largest_item_box_volume, one_box), several_boxes)
+
+
+def packing_bounds(boxes: list[Box] | BoxCatalog, item_groups: list[ItemGroup]) -> PackingBounds:
+    catalog = boxes if isinstance(boxes, BoxCatalog) else BoxCatalog(boxes)
+    item_groups = [item_group for item_group in item_groups if item_group.quantity > 0]
+    if not item_groups:
+        return PackingBounds(0, 0.0)
+    box_count = max(1, volume_bound(catalog, item_groups), dimension_bound(catalog, item_groups))
+    return PackingBounds(box_count, box_volume_bound(catalog, item_groups, box_count))
+
+
+def pack_bounded(
+    boxes: list[Box] | BoxCatalog,
+    item_groups: list[ItemGroup],
+    empty_space_ratio: float,
+    **kwargs,
+) -> BoundedResult:
+    """`pack`, along with bounds telling how far the result is from optimal"""
+    catalog = boxes if isinstance(boxes, BoxCatalog) else BoxCatalog(boxes)
+    packed_boxes = pack(catalog, item_groups, empty_space_ratio, **kwargs)
+    return BoundedResult(packed_boxes, packing_bounds(catalog, item_groups))
+
+
+def item_count_bound(box: Dimensions, items: list[Dimensions]) -> int:
+    """Most of the items that could fit in the box together
+
+    Only items that fit on their own count, at most one of those too long
+    to be side by side with each other, and only as many as the box has
+    volume for, smallest first.
+    """
+    box_axes = box.sorted_axes
+    fitting = [
+        item for item in items
+        if item.sorted_axes[0] <= box_axes[0] and item.sorted_axes[1] <= box_axes[1] and item.sorted_axes[2] <= box_axes[2]
+    ]
+    large = [item for item in fitting if item.sorted_axes[0] > box_axes[2] / 2]
+    volumes = sorted(item.volume for item in fitting if item.sorted_axes[0] <= box_axes[2] / 2)
+    if large:
+        volumes = sorted(volumes + [min(item.volume for item in large)])
+
+    count = 0
+    remaining_volume = box.volume + VOLUME_EPSILON
+    for volume in volumes:
+        if volume > remaining_volume:
+            break
+        remaining_volume -= volume
+        count += 1
+    return count
@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from typing import NamedTuple
+
+from public.pack import (
+    Box,
+    BoxCatalog,
+    Dimensions,
+    Item,
+    ItemGroup,
+    PackedBox,
+    PackedItems,
+    Pattern,
+    Point,
+    catalog_version,
+    pack,
+)
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+# Items in a cached layout are stored by their position ("slot") in the
+# canonical ordering of the order, so they can be swapped for the caller's
+# items on a hit
+CachedPackedItems = tuple[int, Point, Dimensions, Pattern, tuple[tuple[int, float], ...]]
+CachedLayout = tuple[tuple[Box, tuple[CachedPackedItems, ...]], ...]
+
+
+def item_group_signature(item_group: ItemGroup) -> tuple[tuple[float, float, float], float]:
+    dimensions = item_group.item.dimensions
+    return tuple(sorted((dimensions.width, dimensions.height, dimensions.depth))), item_group.quantity
+
+
+def canonical_item_groups(item_groups: list[ItemGroup]) -> list[ItemGroup]:
+    return list(sorted(item_groups, key=item_group_signature))
+
+
+def order_signature(
+    item_groups: list[ItemGroup],
+    version: int,
+    empty_space_ratio: float,
+) -> tuple:
+    return (
+        tuple(item_group_signature(item_group) for item_group in canonical_item_groups(item_groups)),
+        version,
+        empty_space_ratio,
+    )
+
+
+class PackingCache:
+    """LRU cache in front of `pack`
+
+    Orders with the same item shapes and quantities share a cached layout,
+    regardless of the items' names, ids, listed order or orientation.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._layouts: OrderedDict[tuple, CachedLayout] = OrderedDict()
+
+    def pack(
+        self,
+        boxes: list[Box] | BoxCatalog,
+        item_groups: list[ItemGroup],
+        empty_space_ratio: float,
+        version: int | None = None,
+    ) -> list[PackedBox]:
+        if version is None:
+            version = boxes.version if isinstance(boxes, BoxCatalog) else catalog_version(boxes)
+        key = order_signature(item_groups, version, empty_space_ratio)
+        slot_item_groups = canonical_item_groups(item_groups)
+        slot_items = [item_group.item for item_group in slot_item_groups]
+
+        layout = self._layouts.get(key)
+        if layout is not None:
+            self.hits += 1
+            self._layouts.move_to_end(key)
+            return self._restore_layout(layout, slot_items)
+
+        self.misses += 1
+        packed_boxes = pack(boxes, item_groups, empty_space_ratio)
+        self._layouts[key] = self._store_layout(packed_boxes, slot_item_groups)
+        if len(self._layouts) > self.maxsize:
+            self._layouts.popitem(last=False)
+        return packed_boxes
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._layouts))
+
+    def cache_clear(self) -> None:
+        self._layouts.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _store_layout(packed_boxes: list[PackedBox], slot_item_groups: list[ItemGroup]) -> CachedLayout:
+        # An item can be in several of the order's item groups, so its packed
+        # quantities fill the slots of those groups in turn
+        unfilled_slots: dict[int, list[list]] = {}
+        for slot, item_group in enumerate(slot_item_groups):
+            unfilled_slots.setdefault(id(item_group.item), []).append([slot, item_group.quantity])
+
+        def take_slots(item_group: ItemGroup) -> list[tuple[int, float]]:
+            slots = []
+            quantity = item_group.quantity
+            for slot_quantity in unfilled_slots[id(item_group.item)]:
+                taken = min(slot_quantity[1], quantity)
+                if taken > 0:
+                    slots.append((slot_quantity[0], taken))
+                    slot_quantity[1] -= taken
+                    quantity -= taken
+            return slots
+
+        return tuple(
+            (
+                packed_box.box,
+                tuple(
+                    (
+                        packed_items.box_idx,
+                        packed_items.offset,
+                        packed_items.dimensions,
+                        packed_items.pattern,
+                        tuple(
+                            slot
+                            for item_group in packed_items.item_groups
+                            for slot in take_slots(item_group)
+                        ),
+                    )
+                    for packed_items in packed_box.packed_items
+                ),
+            )
+            for packed_box in packed_boxes
+        )
+
+    @staticmethod
+    def _restore_layout(layout: CachedLayout, slot_items: list[Item]) -> list[PackedBox]:
+        return [
+            PackedBox(
+                box,
+                [
+                    PackedItems(
+                        box_idx=box_idx,
+                        item_groups=[ItemGroup(slot_items[slot], quantity) for slot, quantity in slots],
+                        offset=offset,
+                        dimensions=dimensions,
+                        pattern=pattern,
+                    )
+                    for box_idx, offset, dimensions, pattern, slots in cached_packed_items
+                ],
+            )
+            for box, cached_packed_items in layout
+        ]
@@ -0,0 +1,298 @@
+"""Packing results as flat columns, for encoding many orders at once
+
+`ColumnarPacking.from_orders` flattens orders of `PackedBox` into a handful
+of typed arrays: one row per box, per block of packed items, per item
+group and per distinct item. These encode in bulk to JSON with `to_json`,
+or to a compact binary form with `to_bytes`. `from_bytes` reads the binary
+form back without copying the numeric columns, which are then memoryviews
+into the buffer (or NumPy arrays with `as_numpy`). `orders` and `order`
+rebuild the `PackedBox` view.
+"""
+import json
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from public.pack import Box, Dimensions, Item, ItemGroup, PackedBox, PackedItems, Pattern, Point
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"PKC1"
+# Magic, then the number of orders, boxes, packed items, item groups and
+# items, and the length of the strings, padded so the columns after it
+# are aligned
+HEADER = struct.Struct("<4s6I4x")
+
+# (name, typecode, values per row) of the numeric columns, in the order
+# they're written. Doubles come first so every column stays aligned
+NUMERIC_COLUMNS = (
+    ("box_dimensions", "d", 3),
+    ("offsets", "d", 3),
+    ("dimensions", "d", 3),
+    ("item_dimensions", "d", 3),
+    ("order_starts", "i", 1),
+    ("packed_box_idxs", "i", 1),
+    ("patterns", "i", 3),
+    ("item_group_starts", "i", 1),
+    ("item_idxs", "i", 1),
+    ("quantities", "i", 1),
+    ("string_ends", "i", 1),
+)
+
+
+@dataclass
+class ColumnarPacking:
+    # Into the box rows, for each order and one past the last, so the boxes
+    # of order i are rows order_starts[i] to order_starts[i + 1]
+    order_starts: array | memoryview
+    # Per box, with dimensions as width, height and depth one after another
+    box_ids: list[str]
+    box_names: list[str]
+    box_dimensions: array | memoryview
+    # Per block of packed items, the box row it's in
+    packed_box_idxs: array | memoryview
+    offsets: array | memoryview
+    dimensions: array | memoryview
+    patterns: array | memoryview
+    # Into the item group rows, for each block and one past the last
+    item_group_starts: array | memoryview
+    # Per item group, the item row
+    item_idxs: array | memoryview
+    quantities: array | memoryview
+    # Per distinct item
+    item_ids: list[str]
+    item_names: list[str]
+    item_dimensions: array | memoryview
+
+    @classmethod
+    def from_orders(cls, orders: list[list[PackedBox]]) -> "ColumnarPacking":
+        columns = cls(
+            array("i", [0]), [], [], array("d"),
+            array("i"), array("d"), array("d"), array("i"),
+            array("i", [0]), array("i"), array("i"),
+            [], [], array("d"),
+        )
+        # Items are shared by every block they're packed in, so are stored
+        # once and referred to by row
+        item_idxs: dict[int, int] = {}
+        # Bound once, as these are called for every row
+        add_box_dimensions = columns.box_dimensions.extend
+        add_packed_box_idx = columns.packed_box_idxs.append
+        add_offset = columns.offsets.extend
+        add_dimensions = columns.dimensions.extend
+        add_pattern = columns.patterns.extend
+        add_item_group_start = columns.item_group_starts.append
+        add_item_idx = columns.item_idxs.append
+        add_quantity = columns.quantities.append
+        for packed_boxes in orders:
+            for packed_box in packed_boxes:
+                box_idx = len(columns.box_ids)
+                columns.box_ids.append(packed_box.box.id)
+                columns.box_names.append(packed_box.box.name)
+                add_box_dimensions(packed_box.box.dimensions.axes)
+                for packed_items in packed_box.packed_items:
+                    add_packed_box_idx(box_idx)
+                    offset = packed_items.offset
+                    add_offset((offset.x, offset.y, offset.z))
+                    add_dimensions(packed_items.dimensions.axes)
+                    pattern = packed_items.pattern
+                    add_pattern((int(pattern.wide), int(pattern.high), int(pattern.deep)))
+                    for item_group in packed_items.item_groups:
+                        item = item_group.item
+                        item_idx = item_idxs.get(id(item))
+                        if item_idx is None:
+                            item_idx = item_idxs[id(item)] = len(columns.item_ids)
+                            columns.item_ids.append(item.id)
+                            columns.item_names.append(item.name)
+                            columns.item_dimensions.extend(item.dimensions.axes)
+                        add_item_idx(item_idx)
+                        add_quantity(int(item_group.quantity))
+                    add_item_group_start(len(columns.item_idxs))
+            columns.order_starts.append(len(columns.box_ids))
+        return columns
+
+    @classmethod
+    def from_packed_boxes(cls, packed_boxes: list[PackedBox]) -> "ColumnarPacking":
+        return cls.from_orders([packed_boxes])
+
+    def __len__(self) -> int:
+        return len(self.order_starts) - 1
+
+    def orders(self) -> list[list[PackedBox]]:
+        items = [
+            Item(item_id, item_name, Dimensions(*self.item_dimensions[item_idx*3:item_idx*3+3]))
+            for item_idx, (item_id, item_name) in enumerate(zip(self.item_ids, self.item_names))
+        ]
+        return [self._order(order_idx, items) for order_idx in range(len(self))]
+
+    def order(self, order_idx: int) -> list[PackedBox]:
+        # Only the items in this order are built
+        items = {}
+        packed_items_start, packed_items_end = self._packed_items_range(order_idx)
+        for item_group_idx in range(self.item_group_starts[packed_items_start], self.item_group_starts[packed_items_end]):
+            item_idx = self.item_idxs[item_group_idx]
+            if item_idx not in items:
+                items[item_idx] = Item(
+                    self.item_ids[item_idx],
+                    self.item_names[item_idx],
+                    Dimensions(*self.item_dimensions[item_idx*3:item_idx*3+3]),
+                )
+        return self._order(order_idx, items)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "item_ids": self.item_ids,
+            "item_names": self.item_names,
+            "box_ids": self.box_ids,
+            "box_names": self.box_names,
+            **{name: getattr(self, name).tolist() for name, _, _ in NUMERIC_COLUMNS if name != "string_ends"},
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "ColumnarPacking":
+        data = json.loads(data)
+        return cls(
+            **{name: array(typecode, data[name]) for name, typecode, _ in NUMERIC_COLUMNS if name != "string_ends"},
+            box_ids=data["box_ids"],
+            box_names=data["box_names"],
+            item_ids=data["item_ids"],
+            item_names=data["item_names"],
+        )
+
+    def to_bytes(self) -> bytes:
+        strings = [*self.box_ids, *self.box_names, *self.item_ids, *self.item_names]
+        encoded = [string.encode() for string in strings]
+        string_ends = array("i")
+        end = 0
+        for string in encoded:
+            end += len(string)
+            string_ends.append(end)
+        string_bytes = b"".join(encoded)
+
+        columns = {name: getattr(self, name) for name, _, _ in NUMERIC_COLUMNS if name != "string_ends"}
+        columns["string_ends"] = string_ends
+        parts = [HEADER.pack(
+            MAGIC,
+            len(self),
+            len(self.box_ids),
+            len(self.packed_box_idxs),
+            len(self.item_idxs),
+            len(self.item_ids),
+            len(string_bytes),
+        )]
+        for name, typecode, _ in NUMERIC_COLUMNS:
+            column = columns[name]
+            if sys.byteorder != "little":
+                column = array(typecode, column)
+                column.byteswap()
+            parts.append(memoryview(column).cast("B"))
+        parts.append(string_bytes)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> "ColumnarPacking":
+        buffer = memoryview(data).cast("B")
+        magic, n_orders, n_boxes, n_packed_items, n_item_groups, n_items, n_string_bytes = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"Not a columnar packing: {bytes(magic)!r}")
+        rows = {
+            "box_dimensions": n_boxes,
+            "offsets": n_packed_items,
+            "dimensions": n_packed_items,
+            "item_dimensions": n_items,
+            "order_starts": n_orders + 1,
+            "packed_box_idxs": n_packed_items,
+            "patterns": n_packed_items,
+            "item_group_starts": n_packed_items + 1,
+            "item_idxs": n_item_groups,
+            "quantities": n_item_groups,
+            "string_ends": 2 * n_boxes + 2 * n_items,
+        }
+
+        columns = {}
+        position = HEADER.size
+        for name, typecode, width in NUMERIC_COLUMNS:
+            size = rows[name] * width * array(typecode).itemsize
+            column = buffer[position:position+size]
+            if len(column) != size:
+                raise ValueError("Columnar packing is truncated")
+            if sys.byteorder != "little":
+                column = array(typecode, column.tobytes())
+                column.byteswap()
+                columns[name] = column
+            else:
+                columns[name] = column.cast(typecode)
+            position += size
+
+        string_bytes = bytes(buffer[position:position+n_string_bytes])
+        if len(string_bytes) != n_string_bytes:
+            raise ValueError("Columnar packing is truncated")
+        strings = []
+        start = 0
+        for end in columns.pop("string_ends"):
+            strings.append(string_bytes[start:end].decode())
+            start = end
+        return cls(
+            **columns,
+            box_ids=strings[:n_boxes],
+            box_names=strings[n_boxes:2*n_boxes],
+            item_ids=strings[2*n_boxes:2*n_boxes+n_items],
+            item_names=strings[2*n_boxes+n_items:],
+        )
+
+    def as_numpy(self) -> dict:
+        """The numeric columns as NumPy arrays, sharing memory with them
+
+        Columns with three values per row are shaped (rows, 3).
+        """
+        if np is None:
+            raise RuntimeError("as_numpy requires numpy")
+        columns = {}
+        for name, typecode, width in NUMERIC_COLUMNS:
+            if name == "string_ends":
+                continue
+            column = np.frombuffer(getattr(self, name), dtype=np.float64 if typecode == "d" else np.intc)
+            columns[name] = column.reshape(-1, 3) if width == 3 else column
+        return columns
+
+    def _packed_items_range(self, order_idx: int) -> tuple[int, int]:
+        # Blocks are stored in box order, so an order's blocks are those from
+        # its first box's to the next order's first box's
+        box_start, box_end = self.order_starts[order_idx], self.order_starts[order_idx + 1]
+        start = bisect_left(self.packed_box_idxs, box_start)
+        return start, bisect_left(self.packed_box_idxs, box_end, start)
+
+    def _order(self, order_idx: int, items: list[Item] | dict[int, Item]) -> list[PackedBox]:
+        box_start, box_end = self.order_starts[order_idx], self.order_starts[order_idx + 1]
+        packed_boxes = [
+            PackedBox(
+                Box(self.box_ids[box_idx], self.box_names[box_idx], Dimensions(*self.box_dimensions[box_idx*3:box_idx*3+3])),
+                [],
+            )
+            for box_idx in range(box_start, box_end)
+        ]
+        packed_items_start, packed_items_end = self._packed_items_range(order_idx)
+        for packed_items_idx in range(packed_items_start, packed_items_end):
+            box_idx = self.packed_box_idxs[packed_items_idx]
+            values = slice(packed_items_idx * 3, packed_items_idx * 3 + 3)
+            item_groups = [
+                ItemGroup(items[self.item_idxs[item_group_idx]], self.quantities[item_group_idx])
+                for item_group_idx in range(
+                    self.item_group_starts[packed_items_idx],
+                    self.item_group_starts[packed_items_idx + 1],
+                )
+            ]
+            packed_boxes[box_idx - box_start].packed_items.append(PackedItems(
+                box_idx=box_idx - box_start,
+                item_groups=item_groups,
+                offset=Point(*self.offsets[values]),
+                dimensions=Dimensions(*self.dimensions[values]),
+                pattern=Pattern(*self.patterns[values]),
+            ))
+        return packed_boxes
+
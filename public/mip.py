@@ -1,5 +1,18 @@
-import public.mip as mip
-from dataclasses import dataclass
+# python-mip. Run from the repository root (e.g. `python -m public.bench`) so
+# this isn't shadowed by this file
+import math
+import mip
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from enum import StrEnum
+from itertools import permutations
+from time import perf_counter
+
+from public.bounds import item_count_bound, packing_bounds
+from public.pack import Box as PackBox, Dimensions, DoesNotFitError, Item as PackItem, ItemGroup, PackedBox, pack
 
 
 @dataclass
@@ -27,159 +40,884 @@ class Item:
             return [self.width_cm, self.height_cm, self.depth_cm][axis]
 
 
+class Formulation(StrEnum):
+    FULL = "full"  # 9 axis binaries per item and 6 binaries per pair
+    REDUCED = "reduced"  # Fewer variables and constraints for the same answers
+
+
+@dataclass
+class Placement:
+    idx: int
+    origin: tuple[float, float, float]
+    dims: tuple[float, float, float]
+
+
+@dataclass
+class ModelSize:
+    variables: int
+    binary_variables: int
+    constraints: int
+
+
+@dataclass
+class SolveResult:
+    status: mip.OptimizationStatus
+    placements: list[Placement]
+    # Upper bound on how many items could be picked, and how far the
+    # placements are from it relative to their count
+    bound: float
+    gap: float
+    seconds: float
+    # Whether the placements are the start, as the solver found nothing better
+    from_start: bool
+    # Time spent building the model, which isn't included in `seconds`
+    build_seconds: float = 0.0
+
+    @property
+    def picked(self) -> int:
+        return len(self.placements)
+
+    @property
+    def optimal(self) -> bool:
+        return self.gap <= 0
+
+
+SOLVED_STATUSES = (mip.OptimizationStatus.OPTIMAL, mip.OptimizationStatus.FEASIBLE)
+DEFAULT_MAX_MIP_GAP = 1e-4
+
+
+def dims_of(box_or_item: Box | Item) -> tuple[float, float, float]:
+    return (box_or_item.width_cm, box_or_item.height_cm, box_or_item.depth_cm)
+
+
+def fits(box: Box, item: Item) -> bool:
+    return all(item_dim <= box_dim for item_dim, box_dim in zip(sorted(dims_of(item)), sorted(dims_of(box))))
+
+
+def pickable_bound(box: Box, items: list[Item]) -> int:
+    # Most items that could be picked. As a row, it gives the solver this
+    # bound from the start, so it stops as soon as a solution reaches it
+    return item_count_bound(Dimensions(*dims_of(box)), [Dimensions(*dims_of(item)) for item in items])
+
+
+# `pack` works on its own types. Ids are the index into the solver's lists
+def to_pack_box(idx: int, box: Box) -> PackBox:
+    return PackBox(str(idx), box.name, Dimensions(*dims_of(box)))
+
+
+def to_pack_item(idx: int, item: Item) -> PackItem:
+    return PackItem(str(idx), item.name, Dimensions(*dims_of(item)))
+
+
+def packed_box_placements(packed_box: PackedBox, items: list[Item]) -> list[Placement]:
+    # Where each item of a box from `pack` is, where items were `to_pack_item`
+    placements = []
+    for packed_items in packed_box.packed_items:
+        pattern = packed_items.pattern
+        cell_dims = (
+            packed_items.dimensions.width / pattern.wide,
+            packed_items.dimensions.height / pattern.high,
+            packed_items.dimensions.depth / pattern.deep,
+        )
+        cells = [
+            (wide, high, deep)
+            for wide in range(int(pattern.wide))
+            for high in range(int(pattern.high))
+            for deep in range(int(pattern.deep))
+        ]
+        idxs = [
+            int(item_group.item.id)
+            for item_group in packed_items.item_groups
+            for _ in range(int(item_group.quantity))
+        ]
+        offset = packed_items.offset
+        for idx, cell in zip(idxs, cells):
+            # The item's own dimensions, rather than the rounded cell's
+            dims = min(
+                permutations(dims_of(items[idx])),
+                key=lambda dims: sum(abs(dim - cell_dim) for dim, cell_dim in zip(dims, cell_dims)),
+            )
+            origin = (
+                offset.x + cell[0] * cell_dims[0],
+                offset.y + cell[1] * cell_dims[1],
+                offset.z + cell[2] * cell_dims[2],
+            )
+            placements.append(Placement(idx, origin, dims))
+    return placements
+
+
+# Models of the full formulation are only built once per box and item
+# count, then reused with the items' dimensions swapped in
+MODEL_TEMPLATE_CACHE_MAX_SIZE = 64
+
+
+@dataclass
+class ModelTemplate:
+    model: mip.Model
+    v_picked: list[mip.Var]
+    # [idx][item_axis][box_axis], 1 if the item axis is along the box axis
+    v_item_box_axis: list[list[list[mip.Var]]]
+    v_item_origin: list[list[mip.Var]]
+    v_item_length: list[list[mip.Var]]
+    # [idx_a][idx_b][box_axis][sign] for idx_a < idx_b, see `SEPARATION_SIGNS`
+    v_non_intersection: list[list[list[list[mip.Var | None]] | None]]
+    # The only rows that depend on the items: those defining their lengths,
+    # and the bound on how many can be picked
+    item_constrs: list[mip.Constr]
+    # Held while the rows are set for a service's items and solved
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+model_templates: dict[tuple[float, float, float, int], ModelTemplate] = {}
+
+# Separation binaries are 1 when a is before b along the axis ("-"), or b
+# is before a ("+")
+A_BEFORE_B = 0
+B_BEFORE_A = 1
+
+
+def build_model_template(box: Box, n_items: int) -> ModelTemplate:
+    model = mip.Model()
+    box_dims = dims_of(box)
+    items = range(n_items)
+
+    v_picked = [model.add_var(var_type=mip.BINARY) for _ in items]
+    v_item_box_axis = [
+        [[model.add_var(var_type=mip.BINARY) for _ in range(3)] for _ in range(3)]
+        for _ in items
+    ]
+    v_item_origin = [[model.add_var() for _ in range(3)] for _ in items]
+    v_item_length = [[model.add_var() for _ in range(3)] for _ in items]
+
+    for idx in items:
+        # Each item axis is along one box axis, and each box axis has one
+        # item axis along it
+        for axis in range(3):
+            model += mip.xsum(v_item_box_axis[idx][axis]) == v_picked[idx]
+            model += mip.xsum(v_item_box_axis[idx][item_axis][axis] for item_axis in range(3)) == v_picked[idx]
+        for box_axis in range(3):
+            model += v_item_origin[idx][box_axis] + v_item_length[idx][box_axis] <= box_dims[box_axis] * v_picked[idx]
+
+    v_non_intersection = [[None] * n_items for _ in items]
+    for idx_a in items:
+        for idx_b in range(idx_a + 1, n_items):
+            pair = [[model.add_var(var_type=mip.BINARY) for _ in range(2)] for _ in range(3)]
+            v_non_intersection[idx_a][idx_b] = pair
+            for box_axis in range(3):
+                # Either can be 1 to switch off its condition
+                model += (
+                    v_item_origin[idx_a][box_axis] + v_item_length[idx_a][box_axis]
+                    <= v_item_origin[idx_b][box_axis] + box_dims[box_axis] * (1 - pair[box_axis][A_BEFORE_B])
+                )
+                model += (
+                    v_item_origin[idx_b][box_axis] + v_item_length[idx_b][box_axis]
+                    <= v_item_origin[idx_a][box_axis] + box_dims[box_axis] * (1 - pair[box_axis][B_BEFORE_A])
+                )
+            # Picked items are apart along at least one axis
+            model += mip.xsum(v for axis_pair in pair for v in axis_pair) >= v_picked[idx_a] + v_picked[idx_b] - 1
+
+    model.objective = mip.maximize(mip.xsum(v_picked))
+    return ModelTemplate(model, v_picked, v_item_box_axis, v_item_origin, v_item_length, v_non_intersection, [])
+
+
+def model_template(box: Box, n_items: int) -> ModelTemplate:
+    key = (*dims_of(box), n_items)
+    template = model_templates.get(key)
+    if template is None:
+        if len(model_templates) >= MODEL_TEMPLATE_CACHE_MAX_SIZE:
+            model_templates.clear()
+        template = model_templates[key] = build_model_template(box, n_items)
+    return template
+
+
+def set_template_items(template: ModelTemplate, box: Box, items: list[Item]) -> None:
+    # Only call while holding the template's lock
+    model = template.model
+    if template.item_constrs:
+        model.remove(template.item_constrs)
+    template.item_constrs = [
+        model.add_constr(
+            template.v_item_length[idx][box_axis]
+            == mip.xsum(template.v_item_box_axis[idx][item_axis][box_axis] * dim for item_axis, dim in enumerate(dims_of(item)))
+        )
+        for idx, item in enumerate(items)
+        for box_axis in range(3)
+    ]
+    template.item_constrs.append(model.add_constr(mip.xsum(template.v_picked) <= pickable_bound(box, items)))
+
+
 class SolverService:
-    def __init__(self, box: Box, items: list[Item]) -> None:
+    """Finds the most items that fit in a box
+
+    Full models are shared by every service with the same box and item
+    count, and are only solved by one service at a time.
+    """
+
+    def __init__(
+        self,
+        box: Box,
+        items: list[Item],
+        verbose: bool = True,
+        formulation: Formulation = Formulation.FULL,
+    ) -> None:
         self.box = box
         self.items = items
         self.n_items = len(items)
+        self.verbose = verbose
+        self.formulation = formulation
+        self._placements: list[Placement] = []
 
         self._reset_model()
 
-    def optimise(self):
-        self._reset_model()
-        self._create_variables()
-        self._create_constraints()
-        self._create_objective()
-        self._solve()
-        self._output()
+    def optimise(
+        self,
+        start: list[Placement] | None = None,
+        max_seconds: float | None = None,
+        max_gap: float | None = None,
+    ) -> SolveResult:
+        """Solve, optionally from a feasible `start` and within limits
 
-    def _reset_model(self):
-        self.model = mip.Model()
-        self.v_picked = {}
-        self.v_item_box_axis = {}
-        self.v_item_origin = {}
-
-    def _create_variables(self):
-        self._create_picked_variables()
-        self._create_item_axis_variables()
-        self._create_item_origin_variables()
-
-    def _create_picked_variables(self):
-        self.v_picked = {
-            idx: self.model.add_var(var_type=mip.BINARY)
-            for idx in range(self.n_items)
-        }
-
-    def _create_item_axis_variables(self):
-        for idx in range(self.n_items):
-            for item_axis in range(3):
-                for box_axis in range(3):
-                    key = f"{idx}_{item_axis}_{box_axis}"
-                    self.v_item_box_axis[key] = self.model.add_var(var_type=mip.BINARY)
+        With a time or gap limit, the best solution found so far is returned
+        when the limit is hit. The result is never worse than `start`, and
+        the model isn't solved at all when `start` picks as many items as
+        could possibly fit.
+        """
+        bound = pickable_bound(self.box, self.items)
+        if start and len(start) >= bound:
+            result = SolveResult(mip.OptimizationStatus.OPTIMAL, start, float(bound), 0.0, 0.0, True)
+            self._placements = start
+            if self.verbose:
+                self._output(result)
+            return result
+
+        build_start = perf_counter()
+        template = None
+        if self.formulation == Formulation.REDUCED:
+            self._reset_model()
+            self._create_reduced_model()
+        else:
+            template = model_template(self.box, self.n_items)
+        with nullcontext() if template is None else template.lock:
+            if template is not None:
+                set_template_items(template, self.box, self.items)
+                self._use_template(template)
+            self.model.verbose = int(self.verbose)
+            self.model.max_mip_gap = DEFAULT_MAX_MIP_GAP if max_gap is None else max_gap
+
+            # A shared model keeps the last start it was given, which the
+            # solver drops unless it's feasible for these items. An empty
+            # start would clear it, but makes the solver twice as slow
+            if start:
+                start = self._canonical_start(start)
+                self.model.start = self._start_values(start)
+            build_seconds = perf_counter() - build_start
+            result = self._solve(start, max_seconds)
+        result.build_seconds = build_seconds
+        # Kept, as a shared model may since have been solved for other items
+        self._placements = result.placements
+        if self.verbose:
+            self._output(result)
+        return result
+
+    def heuristic_start(self) -> list[Placement]:
+        """Placements in the box from `pack`, to use as a start
+
+        Only the box `pack` put the most items in is used, as the model has
+        just the one box.
+        """
+        pack_items = [to_pack_item(idx, item) for idx, item in enumerate(self.items) if fits(self.box, item)]
+        if not pack_items:
+            return []
+
+        packed_boxes = pack([to_pack_box(0, self.box)], [ItemGroup(item, 1) for item in pack_items], 1.0, downsize=False)
+        packed_box = max(packed_boxes, key=lambda packed_box: sum(packed_items.quantity for packed_items in packed_box.packed_items))
+        return packed_box_placements(packed_box, self.items)
+
+    def model_size(self) -> ModelSize:
+        return ModelSize(
+            self.model.num_cols,
+            sum(1 for var in self.model.vars if var.var_type == mip.BINARY),
+            self.model.num_rows,
+        )
+
+    def placements(self) -> list[Placement]:
+        # Where each picked item ended up when last optimised
+        return self._placements
+
+    def _solution_placements(self) -> list[Placement]:
+        placements = []
+        for idx, v_picked in enumerate(self.v_picked):
+            if v_picked is None or (v_picked.x or 0) < 0.5:
+                continue
+            origin = tuple(v_origin.x for v_origin in self.v_item_origin[idx])
+            placements.append(Placement(idx, origin, self._placed_dims(idx)))
+        return placements
+
+    def _use_template(self, template: ModelTemplate):
+        self.model = template.model
+        self.v_picked = template.v_picked
+        self.v_item_box_axis = template.v_item_box_axis
+        self.v_item_origin = template.v_item_origin
+        self.v_item_length = template.v_item_length
+        self.v_item_orientation = None
+        self.v_non_intersection = template.v_non_intersection
+        self.item_orientations = None
 
-    def _create_item_origin_variables(self):
-        for idx in range(self.n_items):
+    def _canonical_start(self, start: list[Placement]) -> list[Placement]:
+        # Identical items are interchangeable, so give each group's placements
+        # to its first items sorted along the width, as the reduced model's
+        # symmetry breaking needs
+        groups: dict[tuple[float, ...], list[int]] = {}
+        for idx, item in enumerate(self.items):
+            groups.setdefault(tuple(sorted(dims_of(item))), []).append(idx)
+
+        group_placements: dict[tuple[float, ...], list[Placement]] = {}
+        for placement in start:
+            group_placements.setdefault(tuple(sorted(placement.dims)), []).append(placement)
+
+        canonical = []
+        for key, placements in group_placements.items():
+            placements = sorted(placements, key=lambda placement: placement.origin[0])
+            for idx, placement in zip(groups[key], placements):
+                canonical.append(Placement(idx, placement.origin, placement.dims))
+        return sorted(canonical, key=lambda placement: placement.idx)
+
+    def _item_axes(self, idx: int, dims: tuple[float, float, float]) -> list[int]:
+        # The item axis along each box axis, for an item placed with `dims`
+        free_item_axes = [0, 1, 2]
+        item_axes = []
+        for dim in dims:
+            item_axis = next(item_axis for item_axis in free_item_axes if self.items[idx].dim_from_axis(item_axis) == dim)
+            free_item_axes.remove(item_axis)
+            item_axes.append(item_axis)
+        return item_axes
+
+    def _start_values(self, start: list[Placement]) -> list[tuple[mip.Var, float]]:
+        placements = {placement.idx: placement for placement in start}
+        values = []
+        for idx, v_picked in enumerate(self.v_picked):
+            if v_picked is None:
+                continue
+            placement = placements.get(idx)
+            values.append((v_picked, float(placement is not None)))
             for box_axis in range(3):
-                key = f"{idx}_{box_axis}"
-                self.v_item_origin[key] = self.model.add_var()
-
-    def _create_constraints(self):
-        self._create_orthogonality_constraints()
-        self._create_domain_boundaries_constraints()
-        self._create_non_intersection_constraints()
-
-    def _create_orthogonality_constraints(self):
-        # For each axis of an item, only one box axis can be selected
-        for idx in range(self.n_items):
-            for item_axis in range(3):
-                box_axes_expr = [
-                    self.v_item_box_axis[f"{idx}_{item_axis}_{box_axis}"]
-                    for box_axis in range(3)
-                ]
-                self.model += mip.xsum(box_axes_expr) == self.v_picked[idx]
-
-        # For each box axis, only one item axis can be selected
-        for idx in range(self.n_items):
+                origin = placement.origin[box_axis] if placement is not None else 0.0
+                values.append((self.v_item_origin[idx][box_axis], origin))
+
+            if self.formulation == Formulation.REDUCED:
+                for v_orientation, orientation_dims in zip(self.v_item_orientation[idx], self.item_orientations[idx]):
+                    if v_orientation is not v_picked:
+                        used = placement is not None and orientation_dims == tuple(placement.dims)
+                        values.append((v_orientation, float(used)))
+            else:
+                item_axes = self._item_axes(idx, placement.dims) if placement is not None else [None, None, None]
+                for item_axis in range(3):
+                    for box_axis in range(3):
+                        used = item_axes[box_axis] == item_axis
+                        values.append((self.v_item_box_axis[idx][item_axis][box_axis], float(used)))
+                for box_axis in range(3):
+                    length = placement.dims[box_axis] if placement is not None else 0.0
+                    values.append((self.v_item_length[idx][box_axis], length))
+
+        for idx_a, placement_a in placements.items():
+            for idx_b, placement_b in placements.items():
+                pair = self.v_non_intersection[idx_a][idx_b] if idx_a < idx_b else None
+                if pair is None:
+                    continue
+                for box_axis in range(3):
+                    a_before_b = placement_a.origin[box_axis] + placement_a.dims[box_axis] <= placement_b.origin[box_axis] + 1e-6
+                    b_before_a = placement_b.origin[box_axis] + placement_b.dims[box_axis] <= placement_a.origin[box_axis] + 1e-6
+                    for v_non_intersection, before in zip(pair[box_axis], (a_before_b, b_before_a)):
+                        if v_non_intersection is not None:
+                            values.append((v_non_intersection, float(before)))
+        return values
+
+    def _placed_dims(self, idx: int) -> tuple[float, float, float]:
+        if self.formulation == Formulation.REDUCED:
+            for v_orientation, orientation_dims in zip(self.v_item_orientation[idx], self.item_orientations[idx]):
+                if (v_orientation.x or 0) > 0.5:
+                    return orientation_dims
+        dims = [0.0, 0.0, 0.0]
+        for item_axis, dim in enumerate(dims_of(self.items[idx])):
             for box_axis in range(3):
-                self.model += mip.xsum(
-                    self.v_item_box_axis[f"{idx}_{item_axis}_{box_axis}"]
-                    for item_axis in range(3)
-                ) == self.v_picked[idx]
+                if (self.v_item_box_axis[idx][item_axis][box_axis].x or 0) > 0.5:
+                    dims[box_axis] = dim
+        return tuple(dims)
 
-    def _create_domain_boundaries_constraints(self):
-        for idx in range(self.n_items):
+    def _reset_model(self):
+        self.model = mip.Model()
+        self.v_picked = [None] * self.n_items
+        self.v_item_box_axis = None
+        self.v_item_origin = [None] * self.n_items
+        self.v_item_length = None
+        self.v_item_orientation = [None] * self.n_items
+        self.v_non_intersection = [[None] * self.n_items for _ in range(self.n_items)]
+        self.item_orientations = [None] * self.n_items
+
+    def _create_reduced_model(self):
+        # Items are grouped by congruency, like `pack`. Each item only gets a
+        # binary per distinct orientation that fits in the box, items that
+        # can't fit at all are left out, and identical items are packed in
+        # order to cut out symmetric solutions
+        box_dims = dims_of(self.box)
+
+        congruency_groups: dict[tuple[float, float, float], list[int]] = {}
+        for idx, item in enumerate(self.items):
+            orientations = [
+                dims
+                for dims in dict.fromkeys(permutations(dims_of(item)))
+                if all(dims[box_axis] <= box_dims[box_axis] for box_axis in range(3))
+            ]
+            if orientations:
+                self.item_orientations[idx] = orientations
+                congruency_groups.setdefault(tuple(sorted(dims_of(item))), []).append(idx)
+        idxs = sorted(idx for group in congruency_groups.values() for idx in group)
+
+        # Smallest length each item can have along each box axis
+        min_lengths = [None] * self.n_items
+        lengths = [None] * self.n_items
+        for idx in idxs:
+            orientations = self.item_orientations[idx]
+            min_lengths[idx] = [min(dims[box_axis] for dims in orientations) for box_axis in range(3)]
+
+            self.v_picked[idx] = self.model.add_var(var_type=mip.BINARY)
+            if len(orientations) == 1:
+                # The only orientation is used whenever the item is picked
+                self.v_item_orientation[idx] = [self.v_picked[idx]]
+            else:
+                self.v_item_orientation[idx] = [self.model.add_var(var_type=mip.BINARY) for _ in orientations]
+                self.model += mip.xsum(self.v_item_orientation[idx]) == self.v_picked[idx]
+
+            lengths[idx] = [
+                mip.xsum(
+                    v_orientation * dims[box_axis]
+                    for v_orientation, dims in zip(self.v_item_orientation[idx], orientations)
+                )
+                for box_axis in range(3)
+            ]
+            self.v_item_origin[idx] = [
+                self.model.add_var(ub=box_dims[box_axis] - min_lengths[idx][box_axis])
+                for box_axis in range(3)
+            ]
             for box_axis in range(3):
-                origin_key = f"{idx}_{box_axis}"
-                origin_expr = self.v_item_origin[origin_key]
-                max_point_expr = origin_expr + mip.xsum(
-                    self.v_item_box_axis[f"{idx}_{item_axis}_{box_axis}"] * self.items[idx].dim_from_axis(item_axis)
-                    for item_axis in range(3)
+                self.model += (
+                    self.v_item_origin[idx][box_axis] + lengths[idx][box_axis]
+                    <= box_dims[box_axis] * self.v_picked[idx]
                 )
-                self.model += 0 <= origin_expr
-                self.model += origin_expr <= max_point_expr
-                self.model += max_point_expr <= self.v_picked[idx] * self.box.dim_from_axis(box_axis)
-
-    def _create_non_intersection_constraints(self):
-        # Vars to help indicate intersection between items a and b (a < b)
-        v_non_intersection = {}
-        for idx_a in range(self.n_items):
-            for idx_b in range(idx_a + 1, self.n_items):
-                for box_axis in range(3):
-                    v_non_intersection[f"{idx_a}_{idx_b}_{box_axis}_+"] = self.model.add_var(var_type=mip.BINARY)
-                    v_non_intersection[f"{idx_a}_{idx_b}_{box_axis}_-"] = self.model.add_var(var_type=mip.BINARY)
-
-        # Generate expressions to represent that a lies outside of b
-        # and vice versa.
-        # Both expressions are negatable by the v_non_intersection_+/- vars
-        for idx_a in range(self.n_items):
-            for idx_b in range(idx_a + 1, self.n_items):
-                for box_axis in range(3):
-                    a_b_origin_distance = self.v_item_origin[f"{idx_a}_{box_axis}"] - self.v_item_origin[f"{idx_b}_{box_axis}"]
-                    b_a_origin_distance = self.v_item_origin[f"{idx_b}_{box_axis}"] - self.v_item_origin[f"{idx_a}_{box_axis}"]
-                    a_length_along_box_axis = mip.xsum(
-                        self.v_item_box_axis[f"{idx_a}_{item_axis}_{box_axis}"] * self.items[idx_a].dim_from_axis(item_axis)
-                        for item_axis in range(3)
-                    )
-                    b_length_along_box_axis = mip.xsum(
-                        self.v_item_box_axis[f"{idx_b}_{item_axis}_{box_axis}"] * self.items[idx_b].dim_from_axis(item_axis)
-                        for item_axis in range(3)
-                    )
-                    # v_non_intersection_+/- can be 1 to negate the condition
-                    a_b_negate = self.box.dim_from_axis(box_axis) * (1 - v_non_intersection[f"{idx_a}_{idx_b}_{box_axis}_+"])
-                    b_a_negate = self.box.dim_from_axis(box_axis) * (1 - v_non_intersection[f"{idx_a}_{idx_b}_{box_axis}_-"])
-
-                    self.model += a_b_origin_distance >= b_length_along_box_axis - a_b_negate
-                    self.model += b_a_origin_distance >= a_length_along_box_axis - b_a_negate
-
-        # If a is picked, exactly one of the non-intersection vars must be 1
-        for idx_a in range(self.n_items):
-            for idx_b in range(idx_a + 1, self.n_items):
-                non_intersection_expr = mip.xsum(
-                    v_non_intersection[f"{idx_a}_{idx_b}_{box_axis}_+"] + v_non_intersection[f"{idx_a}_{idx_b}_{box_axis}_-"]
-                    for box_axis in range(3)
+
+        # Identical items are picked in order, and sorted along the width,
+        # so no two solutions only differ by swapping identical items
+        item_groups = [None] * self.n_items
+        for group_idx, group in enumerate(congruency_groups.values()):
+            for idx in group:
+                item_groups[idx] = group_idx
+            for idx, next_idx in zip(group, group[1:]):
+                self.model += self.v_picked[idx] >= self.v_picked[next_idx]
+                self.model += (
+                    self.v_item_origin[idx][0]
+                    <= self.v_item_origin[next_idx][0] + box_dims[0] * (1 - self.v_picked[next_idx])
                 )
-                self.model += non_intersection_expr >= self.v_picked[idx_a] + self.v_picked[idx_b] - 1
 
-    def _create_objective(self):
-        self.model.objective = mip.maximize(mip.xsum(self.v_picked.values()))
+        for a_position, idx_a in enumerate(idxs):
+            for idx_b in idxs[a_position + 1:]:
+                pair = [[None, None] for _ in range(3)]
+                identical = item_groups[idx_a] == item_groups[idx_b]
+                for box_axis in range(3):
+                    # Items too long to be side by side along an axis can't
+                    # be separated along it
+                    if min_lengths[idx_a][box_axis] + min_lengths[idx_b][box_axis] > box_dims[box_axis]:
+                        continue
+                    for sign, (first, second) in ((A_BEFORE_B, (idx_a, idx_b)), (B_BEFORE_A, (idx_b, idx_a))):
+                        # Identical items sorted along the width are never
+                        # the other way round along it
+                        if identical and box_axis == 0 and sign == B_BEFORE_A:
+                            continue
+                        v_separation = self.model.add_var(var_type=mip.BINARY)
+                        pair[box_axis][sign] = v_separation
+                        self.model += (
+                            self.v_item_origin[first][box_axis] + lengths[first][box_axis]
+                            <= self.v_item_origin[second][box_axis] + box_dims[box_axis] * (1 - v_separation)
+                        )
+
+                v_separations = [v for axis_pair in pair for v in axis_pair if v is not None]
+                if v_separations:
+                    self.v_non_intersection[idx_a][idx_b] = pair
+                    self.model += mip.xsum(v_separations) >= self.v_picked[idx_a] + self.v_picked[idx_b] - 1
+                else:
+                    self.model += self.v_picked[idx_a] + self.v_picked[idx_b] <= 1
 
-    def _solve(self) -> mip.OptimizationStatus:
-        self.model.optimize()
+        self.model.objective = mip.maximize(mip.xsum(v for v in self.v_picked if v is not None))
+        self.model += mip.xsum(v for v in self.v_picked if v is not None) <= pickable_bound(self.box, self.items)
 
-    def _output(self):
-        status = self.model.status
-        objective = self.model.objective_value
+    def _solve(self, start: list[Placement] | None, max_seconds: float | None) -> SolveResult:
+        solve_start = perf_counter()
+        status = self.model.optimize(max_seconds=mip.INF if max_seconds is None else max_seconds)
+        seconds = perf_counter() - solve_start
 
-        if status == mip.OptimizationStatus.OPTIMAL:
-            print(f"Optimal solution found: {objective}")
+        placements = self._solution_placements() if status in SOLVED_STATUSES else []
+        from_start = bool(start) and len(start) > len(placements)
+        if from_start:
+            placements = start
+
+        picked = len(placements)
+        # Only whole items can be picked, so the bound can be rounded down
+        bound = self.model.objective_bound
+        pickable = sum(1 for v_picked in self.v_picked if v_picked is not None)
+        bound = float(pickable) if bound is None or math.isinf(bound) else math.floor(bound + 1e-6)
+        bound = max(bound, float(picked))
+        if picked:
+            gap = (bound - picked) / picked
+        else:
+            gap = math.inf if bound > 0 else 0.0
+        return SolveResult(status, placements, bound, gap, seconds, from_start)
+
+    def _output(self, result: SolveResult):
+        if result.optimal:
+            print(f"Optimal solution found: {result.picked}")
         else:
-            print(f"Optimal solution not found: {status}")
+            print(f"Optimal solution not found: {result.status}, {result.picked} picked of at most {result.bound:.0f}")
 
-        if status == mip.OptimizationStatus.OPTIMAL or status == mip.OptimizationStatus.FEASIBLE:
+        if result.placements or result.status in SOLVED_STATUSES:
             print(f"Solution for box: {self.box}")
+            placements = {placement.idx: placement for placement in result.placements}
             for idx in range(self.n_items):
-                print(f"Item {idx} picked: {self.v_picked[idx].x}")
+                placement = placements.get(idx)
+                print(f"Item {idx} picked: {float(placement is not None)}")
+                if placement is not None:
+                    print(f"Origin: {list(placement.origin)}, Dims: {list(placement.dims)}")
 
-                dim = []
-                for box_axis in range(3):
-                    for item_axis in range(3):
-                        key = f"{idx}_{item_axis}_{box_axis}"
-                        if self.v_item_box_axis[key].x:
-                            dim.append(self.items[idx].dim_from_axis(item_axis))
 
-                origin = []
+class MultiBoxMode(StrEnum):
+    MONOLITHIC = "monolithic"  # One model assigning and placing every item
+    DECOMPOSED = "decomposed"  # Assign with `pack`, then a model per box in parallel
+
+
+@dataclass
+class BoxSolution:
+    box: Box
+    # Indexes are into the items of the multi-box solver
+    placements: list[Placement]
+
+
+@dataclass
+class MultiBoxResult:
+    boxes: list[BoxSolution]
+    # Whether no packing uses less box volume: the monolithic model was
+    # solved with no gap, or the boxes meet the lower bound on volume
+    optimal: bool
+    seconds: float
+    # Whether these are `pack`'s boxes, as the solver found nothing better
+    from_start: bool
+    # Whether every box is proven the smallest its items fit in. The
+    # decomposition keeps `pack`'s assignment, so this doesn't make it
+    # optimal
+    smallest_boxes: bool
+
+    @property
+    def volume(self) -> float:
+        return sum(box_solution.box.volume for box_solution in self.boxes)
+
+
+def heuristic_packing(boxes: list[Box], items: list[Item], empty_space_ratio: float = 1.1) -> list[BoxSolution]:
+    packed_boxes = pack(
+        [to_pack_box(idx, box) for idx, box in enumerate(boxes)],
+        [ItemGroup(to_pack_item(idx, item), 1) for idx, item in enumerate(items)],
+        empty_space_ratio,
+    )
+    return [
+        BoxSolution(boxes[int(packed_box.box.id)], packed_box_placements(packed_box, items))
+        for packed_box in packed_boxes
+    ]
+
+
+def _smallest_box(
+    boxes: list[Box],
+    items: list[Item],
+    box_solution: BoxSolution,
+    formulation: Formulation,
+    max_seconds: float | None,
+) -> tuple[BoxSolution | None, bool]:
+    # Try the items of a box in each smaller box, smallest first, returning
+    # the first they all fit in, or None if there isn't one. Also returns
+    # whether the box is then proven to be the smallest
+    idxs = [placement.idx for placement in box_solution.placements]
+    box_items = [items[idx] for idx in idxs]
+    items_volume = sum(item.width_cm * item.height_cm * item.depth_cm for item in box_items)
+    candidates = sorted(
+        (
+            box
+            for box in boxes
+            if items_volume <= box.volume < box_solution.box.volume
+            and pickable_bound(box, box_items) == len(box_items)
+        ),
+        key=lambda box: box.volume,
+    )
+
+    start = perf_counter()
+    proven = True
+    for box in candidates:
+        remaining_seconds = None
+        if max_seconds is not None:
+            remaining_seconds = max_seconds - (perf_counter() - start)
+            if remaining_seconds <= 0:
+                return None, False
+        service = SolverService(box, box_items, verbose=False, formulation=formulation)
+        result = service.optimise(max_seconds=remaining_seconds)
+        if result.picked == len(box_items):
+            placements = [
+                Placement(idxs[placement.idx], placement.origin, placement.dims)
+                for placement in result.placements
+            ]
+            return BoxSolution(box, placements), proven
+        # Not fitting in a smaller box only proves this one is the smallest
+        # if the solver finished
+        proven = proven and result.optimal
+    return None, proven
+
+
+class MultiBoxSolverService:
+    """Packs every item into boxes from a catalog, using the least box volume
+
+    Any box can be used as many times as needed. The monolithic model
+    assigns and places all items at once, so it's only practical for small
+    orders. The decomposition keeps `pack`'s assignment of items to boxes
+    and solves each box on its own in parallel, to find the smallest box
+    those items fit in.
+    """
+
+    def __init__(
+        self,
+        boxes: list[Box],
+        items: list[Item],
+        verbose: bool = True,
+        mode: MultiBoxMode = MultiBoxMode.DECOMPOSED,
+        formulation: Formulation = Formulation.REDUCED,
+        workers: int | None = None,
+    ) -> None:
+        for item in items:
+            if not any(fits(box, item) for box in boxes):
+                raise DoesNotFitError(f"Item {item.name} doesn't fit in any box")
+        self.boxes = boxes
+        self.items = items
+        self.verbose = verbose
+        self.mode = mode
+        self.formulation = formulation
+        self.workers = workers or os.cpu_count() or 1
+
+    def optimise(self, max_seconds: float | None = None, max_gap: float | None = None) -> MultiBoxResult:
+        """Solve within an optional time and gap limit
+
+        Starts from `pack`'s boxes, so the result is never worse than them.
+        Nothing is solved when they already use no more volume than any
+        packing could. For the decomposition, `max_seconds` is per box.
+        """
+        start = perf_counter()
+        heuristic = heuristic_packing(self.boxes, self.items)
+        bounds = packing_bounds(
+            [to_pack_box(idx, box) for idx, box in enumerate(self.boxes)],
+            [ItemGroup(to_pack_item(idx, item), 1) for idx, item in enumerate(self.items)],
+        )
+        if sum(box_solution.box.volume for box_solution in heuristic) <= bounds.volume + 1e-6:
+            box_solutions, optimal, smallest_boxes = None, True, True
+        elif self.mode == MultiBoxMode.MONOLITHIC:
+            box_solutions, optimal = self._optimise_monolithic(heuristic, max_seconds, max_gap)
+            smallest_boxes = optimal
+        else:
+            box_solutions, smallest_boxes = self._optimise_decomposed(heuristic, max_seconds)
+            optimal = False
+
+        from_start = box_solutions is None
+        if from_start:
+            box_solutions = heuristic
+        volume = sum(box_solution.box.volume for box_solution in box_solutions)
+        optimal = optimal or volume <= bounds.volume + 1e-6
+        result = MultiBoxResult(box_solutions, optimal, perf_counter() - start, from_start, smallest_boxes)
+        if self.verbose:
+            self._output(result)
+        return result
+
+    def _optimise_decomposed(
+        self,
+        heuristic: list[BoxSolution],
+        max_seconds: float | None,
+    ) -> tuple[list[BoxSolution] | None, bool]:
+        args = [(self.boxes, self.items, box_solution, self.formulation, max_seconds) for box_solution in heuristic]
+        workers = min(self.workers, len(heuristic))
+        if workers <= 1:
+            results = [_smallest_box(*box_args) for box_args in args]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_smallest_box, *zip(*args)))
+
+        optimal = all(proven for _, proven in results)
+        if all(box_solution is None for box_solution, _ in results):
+            return None, optimal
+        box_solutions = [
+            heuristic_box if box_solution is None else box_solution
+            for (box_solution, _), heuristic_box in zip(results, heuristic)
+        ]
+        return box_solutions, optimal
+
+    def _optimise_monolithic(
+        self,
+        heuristic: list[BoxSolution],
+        max_seconds: float | None,
+        max_gap: float | None,
+    ) -> tuple[list[BoxSolution] | None, bool]:
+        # A better packing uses less volume than `pack`'s, which caps the
+        # copies of each box, as does needing an item in every copy
+        heuristic_volume = sum(box_solution.box.volume for box_solution in heuristic)
+        instances = [
+            box
+            for box in self.boxes
+            for _ in range(min(
+                int((heuristic_volume + 1e-6) // box.volume),
+                sum(fits(box, item) for item in self.items),
+            ))
+        ]
+        self.model = mip.Model()
+        self.model.verbose = int(self.verbose)
+        if max_gap is not None:
+            self.model.max_mip_gap = max_gap
+
+        v_used = [self.model.add_var(var_type=mip.BINARY) for _ in instances]
+        # Copies of a box are used in order
+        for instance_idx in range(len(instances) - 1):
+            if instances[instance_idx] is instances[instance_idx + 1]:
+                self.model += v_used[instance_idx] >= v_used[instance_idx + 1]
+
+        item_instances = {}
+        v_in = {}
+        orientations = {}
+        v_orientations = {}
+        v_origin = {}
+        lengths = {}
+        min_lengths = {}
+        max_dims = {}
+        for idx, item in enumerate(self.items):
+            item_instances[idx] = [
+                instance_idx for instance_idx, box in enumerate(instances) if fits(box, item)
+            ]
+            for instance_idx in item_instances[idx]:
+                v_in[(idx, instance_idx)] = self.model.add_var(var_type=mip.BINARY)
+                self.model += v_used[instance_idx] >= v_in[(idx, instance_idx)]
+            self.model += mip.xsum(v_in[(idx, instance_idx)] for instance_idx in item_instances[idx]) == 1
+
+            max_dims[idx] = [max(dims_of(instances[instance_idx])[box_axis] for instance_idx in item_instances[idx]) for box_axis in range(3)]
+            orientations[idx] = [
+                dims
+                for dims in dict.fromkeys(permutations(dims_of(item)))
+                if any(
+                    all(dim <= box_dim for dim, box_dim in zip(dims, dims_of(instances[instance_idx])))
+                    for instance_idx in item_instances[idx]
+                )
+            ]
+            v_orientations[idx] = [self.model.add_var(var_type=mip.BINARY) for _ in orientations[idx]]
+            self.model += mip.xsum(v_orientations[idx]) == 1
+            min_lengths[idx] = [min(dims[box_axis] for dims in orientations[idx]) for box_axis in range(3)]
+
+            for box_axis in range(3):
+                lengths[(idx, box_axis)] = mip.xsum(
+                    v_orientation * dims[box_axis]
+                    for v_orientation, dims in zip(v_orientations[idx], orientations[idx])
+                )
+                v_origin[(idx, box_axis)] = self.model.add_var(ub=max_dims[idx][box_axis] - min_lengths[idx][box_axis])
+                # Inside whichever box the item is in
+                self.model += v_origin[(idx, box_axis)] + lengths[(idx, box_axis)] <= mip.xsum(
+                    v_in[(idx, instance_idx)] * dims_of(instances[instance_idx])[box_axis]
+                    for instance_idx in item_instances[idx]
+                )
+
+        # Items only need separating when they're in the same box, so the
+        # separation binaries are shared by every box a pair could share
+        v_separation = {}
+        for idx_a in range(len(self.items)):
+            for idx_b in range(idx_a + 1, len(self.items)):
+                shared = sorted(set(item_instances[idx_a]) & set(item_instances[idx_b]))
+                if not shared:
+                    continue
+                v_separations = []
                 for box_axis in range(3):
-                    origin_key = f"{idx}_{box_axis}"
-                    origin.append(self.v_item_origin[origin_key].x)
+                    shared_max_dim = max(dims_of(instances[instance_idx])[box_axis] for instance_idx in shared)
+                    if min_lengths[idx_a][box_axis] + min_lengths[idx_b][box_axis] > shared_max_dim:
+                        continue
+                    # The rows hold whichever boxes the items are in, and
+                    # neither ends past the longest side of its own boxes
+                    big_m = max(max_dims[idx_a][box_axis], max_dims[idx_b][box_axis])
+                    for sign, (first, second) in (("-", (idx_a, idx_b)), ("+", (idx_b, idx_a))):
+                        v = self.model.add_var(var_type=mip.BINARY)
+                        v_separation[(idx_a, idx_b, box_axis, sign)] = v
+                        v_separations.append(v)
+                        self.model += (
+                            v_origin[(first, box_axis)] + lengths[(first, box_axis)]
+                            <= v_origin[(second, box_axis)] + big_m * (1 - v)
+                        )
+                for instance_idx in shared:
+                    if v_separations:
+                        self.model += mip.xsum(v_separations) >= v_in[(idx_a, instance_idx)] + v_in[(idx_b, instance_idx)] - 1
+                    else:
+                        self.model += v_in[(idx_a, instance_idx)] + v_in[(idx_b, instance_idx)] <= 1
+
+        self.model.objective = mip.minimize(mip.xsum(box.volume * v for box, v in zip(instances, v_used)))
+
+        # Start from `pack`'s boxes, each as the first unused copy of its box
+        start_values = []
+        item_instance = {}
+        next_copy = {id(box): 0 for box in self.boxes}
+        placements = {}
+        for box_solution in heuristic:
+            instance_idx = next(idx for idx, box in enumerate(instances) if box is box_solution.box) + next_copy[id(box_solution.box)]
+            next_copy[id(box_solution.box)] += 1
+            for placement in box_solution.placements:
+                item_instance[placement.idx] = instance_idx
+                placements[placement.idx] = placement
+        used_instances = set(item_instance.values())
+        start_values += [(v, float(instance_idx in used_instances)) for instance_idx, v in enumerate(v_used)]
+        start_values += [(v, float(item_instance[idx] == instance_idx)) for (idx, instance_idx), v in v_in.items()]
+        for idx, placement in placements.items():
+            start_values += [
+                (v, float(dims == tuple(placement.dims)))
+                for v, dims in zip(v_orientations[idx], orientations[idx])
+            ]
+            start_values += [(v_origin[(idx, box_axis)], placement.origin[box_axis]) for box_axis in range(3)]
+        for (idx_a, idx_b, box_axis, sign), v in v_separation.items():
+            first, second = (placements[idx_a], placements[idx_b]) if sign == "-" else (placements[idx_b], placements[idx_a])
+            start_values.append((v, float(first.origin[box_axis] + first.dims[box_axis] <= second.origin[box_axis] + 1e-6)))
+        self.model.start = start_values
+
+        status = self.model.optimize(max_seconds=mip.INF if max_seconds is None else max_seconds)
+        if status not in SOLVED_STATUSES:
+            return None, False
+        # Stopping within `max_gap` also counts as optimal to the solver
+        optimal = (
+            status == mip.OptimizationStatus.OPTIMAL
+            and self.model.objective_value - self.model.objective_bound <= 1e-6
+        )
+        if self.model.objective_value >= heuristic_volume - 1e-6:
+            return None, optimal
+
+        box_solutions = []
+        for instance_idx, box in enumerate(instances):
+            if (v_used[instance_idx].x or 0) < 0.5:
+                continue
+            box_placements = []
+            for idx in range(len(self.items)):
+                v = v_in.get((idx, instance_idx))
+                if v is None or (v.x or 0) < 0.5:
+                    continue
+                dims = next(
+                    dims for v_orientation, dims in zip(v_orientations[idx], orientations[idx])
+                    if (v_orientation.x or 0) > 0.5
+                )
+                origin = tuple(v_origin[(idx, box_axis)].x for box_axis in range(3))
+                box_placements.append(Placement(idx, origin, dims))
+            if box_placements:
+                box_solutions.append(BoxSolution(box, box_placements))
+        return box_solutions, optimal
 
-                print(f"Origin: {origin}, Dims: {dim}")
+    def _output(self, result: MultiBoxResult):
+        print(f"{'Optimal' if result.optimal else 'Best'} packing found: {len(result.boxes)} boxes, volume {result.volume}")
+        for box_solution in result.boxes:
+            print(f"Box: {box_solution.box}")
+            for placement in box_solution.placements:
+                print(f"Item {placement.idx} origin: {list(placement.origin)}, Dims: {list(placement.dims)}")
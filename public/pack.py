@@ -1,5 +1,15 @@
-from dataclasses import dataclass
+import math
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterator
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 from enum import StrEnum
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class Orientation(StrEnum):
@@ -26,32 +36,83 @@ class Orientation(StrEnum):
             return Orientation.SIDE_90
 
 
-@dataclass
+class Engine(StrEnum):
+    PYTHON = "python"
+    NUMPY = "numpy"  # Requires numpy; evaluates every usable space at once
+
+
+class SortKey(StrEnum):
+    # Which congruency groups are packed first, largest first
+    DIAGONAL = "diagonal"  # Squared length of the diagonal
+    VOLUME = "volume"
+    LONGEST_SIDE = "longest_side"
+
+
+class FillOrder(StrEnum):
+    # Which axes items are lined up along first when filling a space
+    WIDTH_DEPTH_HEIGHT = "width_depth_height"
+    WIDTH_HEIGHT_DEPTH = "width_height_depth"
+    HEIGHT_WIDTH_DEPTH = "height_width_depth"
+    HEIGHT_DEPTH_WIDTH = "height_depth_width"
+    DEPTH_WIDTH_HEIGHT = "depth_width_height"
+    DEPTH_HEIGHT_WIDTH = "depth_height_width"
+    ALL = "all"  # Every one of the above, keeping the best
+
+
+FILL_ORDER_AXES: dict[FillOrder, tuple[int, int, int]] = {
+    FillOrder.WIDTH_DEPTH_HEIGHT: (0, 2, 1),
+    FillOrder.WIDTH_HEIGHT_DEPTH: (0, 1, 2),
+    FillOrder.HEIGHT_WIDTH_DEPTH: (1, 0, 2),
+    FillOrder.HEIGHT_DEPTH_WIDTH: (1, 2, 0),
+    FillOrder.DEPTH_WIDTH_HEIGHT: (2, 0, 1),
+    FillOrder.DEPTH_HEIGHT_WIDTH: (2, 1, 0),
+}
+
+
+# Fill patterns by (space axes, item axes, quantity, fill order). The same
+# items go into the same boxes and spaces over and over across orders, so
+# most lookups are hits. Cleared when full to bound memory
+fill_pattern_memo: dict[tuple, tuple[tuple[tuple[float, float, float], "Pattern"], ...]] = {}
+FILL_PATTERN_MEMO_MAX_SIZE = 65536
+
+
+# For each orientation, which of (width, height, depth) ends up along each
+# axis, so rotations can be checked without creating new Dimensions
+ROTATION_PERMUTATIONS: dict[Orientation, tuple[int, int, int]] = {
+    Orientation.FRONT: (0, 1, 2),
+    Orientation.FRONT_90: (2, 1, 0),
+    Orientation.SIDE: (1, 0, 2),
+    Orientation.SIDE_90: (2, 0, 1),
+    Orientation.TOP: (0, 2, 1),
+    Orientation.TOP_90: (1, 2, 0),
+}
+
+
+@dataclass(frozen=True, slots=True)
 class Dimensions:
     width: float
     height: float
     depth: float
-
-    @property
-    def volume(self):
-        return self.width * self.height * self.depth
+    # Derived once on creation, as these are read far more often than
+    # dimensions are created
+    axes: tuple[float, float, float] = field(init=False, repr=False, compare=False)
+    sorted_axes: tuple[float, float, float] = field(init=False, repr=False, compare=False)
+    volume: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        axes = (self.width, self.height, self.depth)
+        object.__setattr__(self, "axes", axes)
+        object.__setattr__(self, "sorted_axes", tuple(sorted(axes)))
+        object.__setattr__(self, "volume", self.width * self.height * self.depth)
 
     def copy(self) -> "Dimensions":
-        return Dimensions(self.width, self.height, self.depth)
+        # Immutable, so there's no need for an actual copy
+        return self
 
     def rotate(self, orientation: Orientation) -> "Dimensions":
-        if orientation == Orientation.FRONT:
-            return Dimensions(self.width, self.height, self.depth)
-        elif orientation == Orientation.FRONT_90:
-            return Dimensions(self.depth, self.height, self.width)
-        elif orientation == Orientation.SIDE:
-            return Dimensions(self.height, self.width, self.depth)
-        elif orientation == Orientation.SIDE_90:
-            return Dimensions(self.depth, self.width, self.height)
-        elif orientation == Orientation.TOP:
-            return Dimensions(self.width, self.depth, self.height)
-        elif orientation == Orientation.TOP_90:
-            return Dimensions(self.height, self.depth, self.width)
+        axes = self.axes
+        width_axis, height_axis, depth_axis = ROTATION_PERMUTATIONS[orientation]
+        return Dimensions(axes[width_axis], axes[height_axis], axes[depth_axis])
 
     def fits_strictly(self, other: "Dimensions") -> bool:
         return (
@@ -60,34 +121,53 @@ class Dimensions:
             and self.depth >= other.depth
         )
 
+    def fits_any_orientation(self, other: "Dimensions") -> bool:
+        self_axes = self.sorted_axes
+        other_axes = other.sorted_axes
+        return (
+            self_axes[0] >= other_axes[0]
+            and self_axes[1] >= other_axes[1]
+            and self_axes[2] >= other_axes[2]
+        )
+
     def fit_orientations(self, other: "Dimensions") -> list[Orientation]:
-        if self.volume < other.volume:
+        if self.volume < other.volume or not self.fits_any_orientation(other):
             return []
 
-        fit_orientations = []
-        for orientation in Orientation:
-            if self.fits_strictly(other.rotate(orientation)):
-                fit_orientations.append(orientation)
-        return fit_orientations
+        width, height, depth = self.axes
+        other_axes = other.axes
+        return [
+            orientation
+            for orientation, (width_axis, height_axis, depth_axis) in ROTATION_PERMUTATIONS.items()
+            if (
+                width >= other_axes[width_axis]
+                and height >= other_axes[height_axis]
+                and depth >= other_axes[depth_axis]
+            )
+        ]
 
     def orientation_to_be_same(self, other: "Dimensions") -> Orientation | None:
-        if self.volume != other.volume:
+        if self.volume != other.volume or self.sorted_axes != other.sorted_axes:
             return None
 
-        for orientation in Orientation:
-            if self.rotate(orientation) == other:
+        other_axes = other.axes
+        for orientation, (width_axis, height_axis, depth_axis) in ROTATION_PERMUTATIONS.items():
+            if self.axes == (other_axes[width_axis], other_axes[height_axis], other_axes[depth_axis]):
                 return orientation
 
         return None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Point:
     x: float
     y: float
     z: float
 
 
+ORIGIN = Point(0.0, 0.0, 0.0)
+
+
 @dataclass
 class Box:
     id: str
@@ -118,7 +198,7 @@ class CongruencyGroup:
         return sum(item_group.quantity for item_group in self.item_groups)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Space:
     box_idx: int
     dimensions: Dimensions
@@ -126,17 +206,17 @@ class Space:
 
     @classmethod
     def from_box(cls, box, box_idx):
-        return cls(box_idx, box.dimensions.copy(), Point(0.0, 0.0, 0.0))
+        return cls(box_idx, box.dimensions, ORIGIN)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Pattern:
     wide: int
     high: int
     deep: int
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PackedItems:
     box_idx: int
     item_groups: list[ItemGroup]
@@ -155,75 +235,578 @@ class PackedBox:
     packed_items: list[PackedItems]
 
 
+class Phase(StrEnum):
+    GROUPING = "grouping"
+    SPACE_SELECTION = "space_selection"
+    BOX_SELECTION = "box_selection"
+    PATTERN_GENERATION = "pattern_generation"
+    NEGATIVE_SPACE_SELECTION = "negative_space_selection"
+    DOWNSIZING = "downsizing"
+
+
+class CounterName(StrEnum):
+    SPACES_SCANNED = "spaces_scanned"
+    BOXES_OPENED = "boxes_opened"
+    ROTATIONS_TRIED = "rotations_tried"
+    BEAM_STATES_EXPANDED = "beam_states_expanded"
+    BOXES_DOWNSIZED = "boxes_downsized"
+    SPACES_MERGED = "spaces_merged"
+    SPACES_PRUNED = "spaces_pruned"
+
+
+class PackObserver:
+    """Hooks for instrumenting `pack`; override the ones needed
+
+    `pack` only times phases and counts things when given an observer.
+    """
+
+    def phase(self, phase: Phase, seconds: float) -> None:
+        pass
+
+    def count(self, counter: CounterName, value: int) -> None:
+        pass
+
+    def placed(self, congruency_group: CongruencyGroup, space: Space, packed_items: PackedItems) -> None:
+        # Called before the packed items are taken out of the congruency group
+        pass
+
+    def packed(self, packed_boxes: list[PackedBox], seconds: float) -> None:
+        pass
+
+
+class MetricsCollector(PackObserver):
+    """Totals phase timings and counters across any number of `pack` calls"""
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.placements = 0
+        self.phase_seconds = {phase: 0.0 for phase in Phase}
+        self.phase_calls = {phase: 0 for phase in Phase}
+        self.counters = {counter: 0 for counter in CounterName}
+
+    def phase(self, phase: Phase, seconds: float) -> None:
+        self.phase_seconds[phase] += seconds
+        self.phase_calls[phase] += 1
+
+    def count(self, counter: CounterName, value: int) -> None:
+        self.counters[counter] += value
+
+    def placed(self, congruency_group: CongruencyGroup, space: Space, packed_items: PackedItems) -> None:
+        self.placements += 1
+
+    def packed(self, packed_boxes: list[PackedBox], seconds: float) -> None:
+        self.calls += 1
+        self.seconds += seconds
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "placements": self.placements,
+            "phase_seconds": {str(phase): seconds for phase, seconds in self.phase_seconds.items()},
+            "phase_calls": {str(phase): calls for phase, calls in self.phase_calls.items()},
+            "counters": {str(counter): value for counter, value in self.counters.items()},
+        }
+
+
+class PhaseTimer:
+    __slots__ = ("observer", "phase", "start")
+
+    def __init__(self, observer: PackObserver, phase: Phase) -> None:
+        self.observer = observer
+        self.phase = phase
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.observer.phase(self.phase, perf_counter() - self.start)
+
+
+# Shared, so `phase_timer` costs nothing extra without an observer
+NO_PHASE_TIMER = nullcontext()
+
+
+def phase_timer(observer: PackObserver | None, phase: Phase) -> PhaseTimer | nullcontext:
+    if observer is None:
+        return NO_PHASE_TIMER
+    return PhaseTimer(observer, phase)
+
+
+class SpaceStore:
+    """Usable spaces, kept in ascending volume order as they are added
+
+    Spaces of equal volume keep the order they were added in.
+    """
+
+    def __init__(self) -> None:
+        self._volumes: list[float] = []
+        self._spaces: list[Space] = []
+        # Number of spaces looked at by `pop_first_fit`, for instrumentation
+        self.scanned = 0
+
+    def __len__(self) -> int:
+        return len(self._spaces)
+
+    def __iter__(self) -> Iterator[Space]:
+        return iter(self._spaces)
+
+    def copy(self) -> "SpaceStore":
+        # Spaces are immutable, so can be shared between copies
+        usable_spaces = SpaceStore()
+        usable_spaces._volumes = self._volumes.copy()
+        usable_spaces._spaces = self._spaces.copy()
+        return usable_spaces
+
+    def add(self, space: Space) -> None:
+        volume = space.dimensions.volume
+        space_idx = bisect_right(self._volumes, volume)
+        self._volumes.insert(space_idx, volume)
+        self._spaces.insert(space_idx, space)
+
+    def remove(self, space: Space) -> None:
+        space_idx = bisect_left(self._volumes, space.dimensions.volume)
+        while self._spaces[space_idx] is not space:
+            space_idx += 1
+        del self._volumes[space_idx]
+        del self._spaces[space_idx]
+
+    def prune(self, min_dims: tuple[float, float, float]) -> int:
+        # Drops spaces too small along some axis for anything left to pack,
+        # returning how many were dropped
+        keep = [
+            space_idx
+            for space_idx, space in enumerate(self._spaces)
+            if fits_sorted(space.dimensions.sorted_axes, min_dims)
+        ]
+        pruned = len(self._spaces) - len(keep)
+        if pruned:
+            self._volumes = [self._volumes[space_idx] for space_idx in keep]
+            self._spaces = [self._spaces[space_idx] for space_idx in keep]
+        return pruned
+
+    def pop_first_fit(self, dimensions: Dimensions) -> Space | None:
+        # Spaces smaller than the item by volume can't fit it in any
+        # orientation, so start from the first one that's at least as big.
+        # From there the scan is linear in the number of spaces
+        item_dims = dimensions.sorted_axes
+        start_idx = bisect_left(self._volumes, dimensions.volume)
+        for space_idx in range(start_idx, len(self._spaces)):
+            space_dims = self._spaces[space_idx].dimensions.sorted_axes
+            if space_dims[0] >= item_dims[0] and space_dims[1] >= item_dims[1] and space_dims[2] >= item_dims[2]:
+                self.scanned += space_idx - start_idx + 1
+                del self._volumes[space_idx]
+                return self._spaces.pop(space_idx)
+        self.scanned += len(self._spaces) - start_idx
+        return None
+
+
+class ArraySpaceStore:
+    """Usable spaces held in NumPy arrays, for the numpy engine
+
+    Finds the same space as `SpaceStore`: the smallest by volume that fits,
+    earliest added on ties, but checks every space in one array operation
+    rather than walking them. Spaces are kept in the order they were added,
+    and popped spaces are only marked dead (infinite volume) until enough
+    build up to compact.
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        if np is None:
+            raise ImportError("The numpy engine requires numpy to be installed")
+        # One array per sorted axis, as comparing whole columns is much faster
+        # than reducing across rows
+        self._sorted_axes = [np.empty(capacity) for _ in range(3)]
+        self._volumes = np.empty(capacity)
+        self._spaces: list[Space | None] = []
+        self._alive_count = 0
+        # Number of spaces looked at by `pop_first_fit`, for instrumentation
+        self.scanned = 0
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    def __iter__(self) -> Iterator[Space]:
+        order = np.argsort(self._volumes[:len(self._spaces)], kind="stable")
+        return iter([self._spaces[space_idx] for space_idx in order[:self._alive_count]])
+
+    def add(self, space: Space) -> None:
+        space_idx = len(self._spaces)
+        if space_idx == len(self._volumes):
+            self._resize(len(self._volumes) * 2)
+        for axis, dim in enumerate(space.dimensions.sorted_axes):
+            self._sorted_axes[axis][space_idx] = dim
+        self._volumes[space_idx] = space.dimensions.volume
+        self._spaces.append(space)
+        self._alive_count += 1
+
+    def remove(self, space: Space) -> None:
+        for space_idx, other in enumerate(self._spaces):
+            if other is space:
+                self._kill(space_idx)
+                return
+        raise ValueError("Space is not in the store")
+
+    def prune(self, min_dims: tuple[float, float, float]) -> int:
+        space_count = len(self._spaces)
+        too_small = self._sorted_axes[0][:space_count] < min_dims[0]
+        too_small |= self._sorted_axes[1][:space_count] < min_dims[1]
+        too_small |= self._sorted_axes[2][:space_count] < min_dims[2]
+        too_small &= self._volumes[:space_count] != np.inf
+        space_idxs = np.flatnonzero(too_small)
+        # Compacting moves spaces to new indexes, so only once all are dead
+        for space_idx in space_idxs:
+            self._mark_dead(int(space_idx))
+        self._compact_if_sparse()
+        return len(space_idxs)
+
+    def pop_first_fit(self, dimensions: Dimensions) -> Space | None:
+        if self._alive_count == 0:
+            return None
+
+        # Something fits a space in some orientation exactly when its sorted
+        # dimensions are each no larger than the space's
+        space_count = len(self._spaces)
+        self.scanned += space_count
+        item_dims = dimensions.sorted_axes
+        fits = self._sorted_axes[0][:space_count] >= item_dims[0]
+        fits &= self._sorted_axes[1][:space_count] >= item_dims[1]
+        fits &= self._sorted_axes[2][:space_count] >= item_dims[2]
+        fit_volumes = np.where(fits, self._volumes[:space_count], np.inf)
+
+        # argmin takes the first of equal volumes, which is the earliest added
+        space_idx = int(fit_volumes.argmin())
+        if fit_volumes[space_idx] == np.inf:
+            return None
+
+        space = self._spaces[space_idx]
+        self._kill(space_idx)
+        return space
+
+    def _kill(self, space_idx: int) -> None:
+        self._mark_dead(space_idx)
+        self._compact_if_sparse()
+
+    def _mark_dead(self, space_idx: int) -> None:
+        self._spaces[space_idx] = None
+        self._volumes[space_idx] = np.inf
+        self._alive_count -= 1
+
+    def _compact_if_sparse(self) -> None:
+        space_count = len(self._spaces)
+        if space_count > 64 and self._alive_count * 2 < space_count:
+            self._compact()
+
+    def _resize(self, capacity: int) -> None:
+        self._sorted_axes = [np.resize(axis_dims, capacity) for axis_dims in self._sorted_axes]
+        self._volumes = np.resize(self._volumes, capacity)
+
+    def _compact(self) -> None:
+        space_idxs = np.flatnonzero(self._volumes[:len(self._spaces)] != np.inf)
+        alive_count = len(space_idxs)
+        for axis_dims in self._sorted_axes:
+            axis_dims[:alive_count] = axis_dims[space_idxs]
+        self._volumes[:alive_count] = self._volumes[space_idxs]
+        self._spaces = [self._spaces[space_idx] for space_idx in space_idxs]
+
+
+def fits_sorted(outer: tuple[float, float, float], inner: tuple[float, float, float]) -> bool:
+    return outer[0] >= inner[0] and outer[1] >= inner[1] and outer[2] >= inner[2]
+
+
+# Space edges are sums of dimensions, so may be out by rounding
+SPACE_EPSILON = 1e-6
+
+
+def merge_adjacent_spaces(space: Space, other: Space) -> Space | None:
+    # Two spaces in a box can be merged when they share a whole face, which
+    # leaves a single space covering exactly the same room
+    space_offset, other_offset = space.offset, other.offset
+    space_sizes, other_sizes = space.dimensions.axes, other.dimensions.axes
+    same_x = abs(space_offset.x - other_offset.x) <= SPACE_EPSILON and abs(space_sizes[0] - other_sizes[0]) <= SPACE_EPSILON
+    same_y = abs(space_offset.y - other_offset.y) <= SPACE_EPSILON and abs(space_sizes[1] - other_sizes[1]) <= SPACE_EPSILON
+    if not same_x and not same_y:
+        return None
+    same_z = abs(space_offset.z - other_offset.z) <= SPACE_EPSILON and abs(space_sizes[2] - other_sizes[2]) <= SPACE_EPSILON
+    if same_x + same_y + same_z != 2:
+        return None
+
+    merge_axis = 0 if not same_x else 1 if not same_y else 2
+    space_start = (space_offset.x, space_offset.y, space_offset.z)[merge_axis]
+    other_start = (other_offset.x, other_offset.y, other_offset.z)[merge_axis]
+    if abs(space_start + space_sizes[merge_axis] - other_start) <= SPACE_EPSILON:
+        offset = space_offset
+    elif abs(other_start + other_sizes[merge_axis] - space_start) <= SPACE_EPSILON:
+        offset = other_offset
+    else:
+        return None
+
+    sizes = list(space_sizes)
+    sizes[merge_axis] += other_sizes[merge_axis]
+    return Space(box_idx=space.box_idx, dimensions=Dimensions(*sizes), offset=offset)
+
+
+def merge_spaces(usable_spaces: SpaceStore | ArraySpaceStore) -> int:
+    # Replaces spaces in the same box that share a whole face with a single
+    # space, until there are none left to merge, returning how many merges
+    # were made
+    box_spaces: dict[int, list[Space]] = {}
+    for space in usable_spaces:
+        box_spaces.setdefault(space.box_idx, []).append(space)
+
+    merged_count = 0
+    for spaces in box_spaces.values():
+        space_idx = 0
+        while space_idx < len(spaces):
+            for other_idx in range(space_idx + 1, len(spaces)):
+                merged_space = merge_adjacent_spaces(spaces[space_idx], spaces[other_idx])
+                if merged_space is not None:
+                    usable_spaces.remove(spaces[space_idx])
+                    usable_spaces.remove(spaces[other_idx])
+                    usable_spaces.add(merged_space)
+                    del spaces[other_idx]
+                    spaces[space_idx] = merged_space
+                    merged_count += 1
+                    break
+            else:
+                space_idx += 1
+    return merged_count
+
+
+def sort_boxes(boxes: list[Box]) -> list[Box]:
+    return list(sorted(
+        boxes,
+        key=lambda x: x.dimensions.volume,
+    ))
+
+
+def catalog_version(boxes: list[Box]) -> int:
+    return hash(tuple(
+        (box.id, box.dimensions.width, box.dimensions.height, box.dimensions.depth)
+        for box in boxes
+    ))
+
+
+class DoesNotFitError(ValueError):
+    """Items that are too big for every box in the catalog, in any orientation"""
+
+
+class BoxCatalog:
+    """Boxes sorted by volume, for "smallest box this fits in" lookups
+
+    A lookup bisects to the first box with enough volume, then scans on
+    for one the item fits, so it's linear in the boxes past that. Results
+    are memoised per item shape, which makes repeated shapes constant time.
+    Build once and pass to `pack` in place of the list of boxes to reuse it
+    across orders.
+    """
+
+    # Bounds the lookup memo for long-lived catalogs seeing many item shapes
+    max_memo_size = 65536
+
+    def __init__(self, boxes: list[Box]) -> None:
+        self.boxes = sort_boxes(boxes)
+        self.volumes = [box.dimensions.volume for box in self.boxes]
+        self.sorted_dimensions = [box.dimensions.sorted_axes for box in self.boxes]
+        self.version = catalog_version(self.boxes)
+        self._smallest_box_idxs: dict[tuple[tuple[float, float, float], int], int | None] = {}
+
+        # Largest sorted dimensions of any box from each index onwards, so
+        # lookups for things that can't fit anywhere past the volume
+        # threshold are rejected without a scan
+        self._suffix_max_dimensions = [(0.0, 0.0, 0.0)] * (len(self.boxes) + 1)
+        for box_idx in range(len(self.boxes) - 1, -1, -1):
+            box_dims = self.sorted_dimensions[box_idx]
+            next_max = self._suffix_max_dimensions[box_idx + 1]
+            self._suffix_max_dimensions[box_idx] = (
+                max(box_dims[0], next_max[0]),
+                max(box_dims[1], next_max[1]),
+                max(box_dims[2], next_max[2]),
+            )
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def smallest_box_idx(self, dimensions: Dimensions, min_volume: float = 0.0) -> int | None:
+        # Something fits in a box in some orientation exactly when its sorted
+        # dimensions are each no larger than the box's sorted dimensions
+        start_idx = bisect_left(self.volumes, min_volume)
+        item_dims = dimensions.sorted_axes
+        key = (item_dims, start_idx)
+        if key in self._smallest_box_idxs:
+            return self._smallest_box_idxs[key]
+
+        found_idx = None
+        max_dims = self._suffix_max_dimensions[start_idx]
+        if max_dims[0] >= item_dims[0] and max_dims[1] >= item_dims[1] and max_dims[2] >= item_dims[2]:
+            for box_idx in range(start_idx, len(self.boxes)):
+                box_dims = self.sorted_dimensions[box_idx]
+                if box_dims[0] >= item_dims[0] and box_dims[1] >= item_dims[1] and box_dims[2] >= item_dims[2]:
+                    found_idx = box_idx
+                    break
+
+        if len(self._smallest_box_idxs) >= self.max_memo_size:
+            self._smallest_box_idxs.clear()
+        self._smallest_box_idxs[key] = found_idx
+        return found_idx
+
+
 def pack(
-    boxes: list[Box],
+    boxes: list[Box] | BoxCatalog,
     item_groups: list[ItemGroup],
     empty_space_ratio: float,
+    tolerance: float | None = None,
+    engine: Engine = Engine.PYTHON,
+    observer: PackObserver | None = None,
+    downsize: bool = True,
+    beam_width: int | None = None,
+    deadline_ms: float | None = None,
+    sort_key: SortKey = SortKey.DIAGONAL,
+    fill_order: FillOrder = FillOrder.ALL,
 ) -> list[PackedBox]:
-    congruency_groups = gather_congruency_groups(item_groups)
-    sorted_congruency_groups = list(sorted(
-        congruency_groups,
-        key=lambda x: x.dimensions.width**2 + x.dimensions.height**2 + x.dimensions.depth**2,
-        reverse=True,
-    ))
+    if tolerance is not None and not tolerance > 0:
+        # Dimensions are rounded up to multiples of it, so it has to be positive
+        raise ValueError(f"Tolerance must be positive: {tolerance!r}")
+
+    if observer is not None:
+        start = perf_counter()
+
+    catalog = boxes if isinstance(boxes, BoxCatalog) else BoxCatalog(boxes)
+
+    if beam_width is not None:
+        packed_boxes = pack_beam(
+            catalog,
+            item_groups,
+            empty_space_ratio,
+            beam_width,
+            deadline_ms,
+            tolerance,
+            observer,
+            sort_key,
+            fill_order,
+        )
+    # Most orders are one or two items, which don't need the general search
+    elif (
+        len(item_groups) <= 2
+        and all(item_group.quantity >= 1 for item_group in item_groups)
+        and sum(item_group.quantity for item_group in item_groups) <= 2
+    ):
+        packed_boxes = pack_small_order(catalog, item_groups, empty_space_ratio, tolerance, observer, sort_key, fill_order)
+    else:
+        packed_boxes = pack_general(
+            catalog,
+            item_groups,
+            empty_space_ratio,
+            tolerance,
+            engine,
+            observer,
+            sort_key,
+            fill_order,
+        )
 
-    sorted_boxes = list(sorted(
-        boxes,
-        key=lambda x: x.dimensions.volume,
-    ))
+    if downsize:
+        with phase_timer(observer, Phase.DOWNSIZING):
+            downsized = downsize_packed_boxes(catalog, packed_boxes)
+        if observer is not None:
+            observer.count(CounterName.BOXES_DOWNSIZED, downsized)
+
+    if observer is not None:
+        observer.packed(packed_boxes, perf_counter() - start)
+    return packed_boxes
+
+
+def pack_general(
+    catalog: BoxCatalog,
+    item_groups: list[ItemGroup],
+    empty_space_ratio: float,
+    tolerance: float | None = None,
+    engine: Engine = Engine.PYTHON,
+    observer: PackObserver | None = None,
+    sort_key: SortKey = SortKey.DIAGONAL,
+    fill_order: FillOrder = FillOrder.ALL,
+) -> list[PackedBox]:
+    with phase_timer(observer, Phase.GROUPING):
+        congruency_groups = gather_congruency_groups(item_groups, tolerance)
+        sorted_congruency_groups = sort_congruency_groups(congruency_groups, sort_key)
 
-    usable_spaces = []
+    usable_spaces = ArraySpaceStore() if engine == Engine.NUMPY else SpaceStore()
 
     smallest_item_volume = sorted_congruency_groups[-1].dimensions.volume
+    min_dims = remaining_min_dims(sorted_congruency_groups)
 
+    merged_count = 0
+    pruned_count = 0
     all_packed_items = []
     used_boxes = []
     for congruency_group_idx, congruency_group in enumerate(sorted_congruency_groups):
-        while congruency_group.quantity > 0:
-            space_to_use = None
+        if congruency_group_idx > 0 and min_dims[congruency_group_idx] != min_dims[congruency_group_idx - 1]:
+            pruned_count += usable_spaces.prune(min_dims[congruency_group_idx])
 
+        while congruency_group.quantity > 0:
             # Select space from used box spaces
-            space_to_use_idx = None
-            for space_idx, space in enumerate(usable_spaces):
-                orientations_in_space = space.dimensions.fit_orientations(congruency_group.dimensions)
-                if orientations_in_space:
-                    space_to_use_idx = space_idx
-                    break
-            if space_to_use_idx is not None:
-                space_to_use = usable_spaces.pop(space_idx)
+            with phase_timer(observer, Phase.SPACE_SELECTION):
+                space_to_use = usable_spaces.pop_first_fit(congruency_group.dimensions)
+                # Before opening another box, merge spaces that were split
+                # apart, as the room needed may already be in a box
+                if space_to_use is None and len(usable_spaces) > 1:
+                    new_merged_count = merge_spaces(usable_spaces)
+                    if new_merged_count:
+                        merged_count += new_merged_count
+                        space_to_use = usable_spaces.pop_first_fit(congruency_group.dimensions)
 
             # Select space from an unused box
             if space_to_use is None:
-                box_to_use = next_box_to_use(
-                    sorted_boxes,
-                    congruency_group,
-                    sorted_congruency_groups[congruency_group_idx+1:],
-                    empty_space_ratio,
-                )
+                with phase_timer(observer, Phase.BOX_SELECTION):
+                    box_to_use = next_box_to_use(
+                        catalog,
+                        congruency_group,
+                        sorted_congruency_groups[congruency_group_idx+1:],
+                        empty_space_ratio,
+                    )
                 used_boxes.append(box_to_use)
                 space_to_use = Space.from_box(box_to_use, len(used_boxes)-1)
 
-            cg_names = ",".join([item_group.item.name for item_group in congruency_group.item_groups])
-            print(f"Packing CG [{cg_names}] ({congruency_group.dimensions.width}x{congruency_group.dimensions.height}x{congruency_group.dimensions.depth})")
-            print(f" Spaces to use: {len(usable_spaces)}")
-            for space in usable_spaces:
-                print(f"  Space ({space.box_idx}): {space.dimensions.width}x{space.dimensions.height}x{space.dimensions.depth}")
-            print(f"Using space ({space_to_use.box_idx}): {space_to_use.dimensions.width}x{space_to_use.dimensions.height}x{space_to_use.dimensions.depth}")
-            print()
-
-            potential_packed_items = get_potential_packed_items(congruency_group, space_to_use)
-            packed_items, new_spaces = select_packed_items_and_negative_space(potential_packed_items, space_to_use)
-
+            packed_items, new_spaces = place_congruency_group(congruency_group, space_to_use, observer, fill_order)
             all_packed_items.append(packed_items)
-            update_congruency_group(congruency_group, packed_items)
-            print(f"Just packed: {packed_items} with qty {packed_items.quantity}")
-            print(f"Updated CG: {congruency_group}")
 
             for new_space in new_spaces:
-                if new_space.dimensions.volume >= smallest_item_volume:
-                    usable_spaces.append(new_space)
-            usable_spaces.sort(key=lambda x: x.dimensions.volume)
+                if (
+                    new_space.dimensions.volume >= smallest_item_volume
+                    and fits_sorted(new_space.dimensions.sorted_axes, min_dims[congruency_group_idx])
+                ):
+                    usable_spaces.add(new_space)
+
+    if observer is not None:
+        observer.count(CounterName.SPACES_SCANNED, usable_spaces.scanned)
+        observer.count(CounterName.BOXES_OPENED, len(used_boxes))
+        observer.count(CounterName.SPACES_MERGED, merged_count)
+        observer.count(CounterName.SPACES_PRUNED, pruned_count)
+
+    return build_packed_boxes(used_boxes, all_packed_items)
+
+
+def remaining_min_dims(sorted_congruency_groups: list[CongruencyGroup]) -> list[tuple[float, float, float]]:
+    # Smallest sorted dimensions of anything in each congruency group onwards.
+    # Spaces that aren't at least this big along every axis can't be used
+    # again, so are dropped as groups get packed
+    min_dims = [(0.0, 0.0, 0.0)] * len(sorted_congruency_groups)
+    next_min_dims = (math.inf, math.inf, math.inf)
+    for congruency_group_idx in range(len(sorted_congruency_groups) - 1, -1, -1):
+        group_dims = sorted_congruency_groups[congruency_group_idx].dimensions.sorted_axes
+        next_min_dims = (
+            min(group_dims[0], next_min_dims[0]),
+            min(group_dims[1], next_min_dims[1]),
+            min(group_dims[2], next_min_dims[2]),
+        )
+        min_dims[congruency_group_idx] = next_min_dims
+    return min_dims
 
+
+def build_packed_boxes(used_boxes: list[Box], all_packed_items: list[PackedItems]) -> list[PackedBox]:
     packed_boxes = []
     for box in used_boxes:
         packed_boxes.append(PackedBox(box, []))
@@ -234,24 +817,386 @@ def pack(
     return packed_boxes
 
 
-def gather_congruency_groups(item_groups: list[ItemGroup]) -> list[CongruencyGroup]:
-    congruency_groups = []
-    for item_group in item_groups:
-        found_congruency_group = False
-        for congruency_group in congruency_groups:
-            orientation_for_congruency = congruency_group.dimensions.orientation_to_be_same(item_group.item.dimensions)
-            if orientation_for_congruency:
-                congruency_group.item_groups.append(item_group)
-                found_congruency_group = True
+def pack_small_order(
+    catalog: BoxCatalog,
+    item_groups: list[ItemGroup],
+    empty_space_ratio: float,
+    tolerance: float | None = None,
+    observer: PackObserver | None = None,
+    sort_key: SortKey = SortKey.DIAGONAL,
+    fill_order: FillOrder = FillOrder.ALL,
+) -> list[PackedBox]:
+    # Follows the same steps as `pack_general` for at most two items, but
+    # uses the catalog index for boxes and skips the space bookkeeping
+    with phase_timer(observer, Phase.GROUPING):
+        sorted_congruency_groups = sort_congruency_groups(gather_congruency_groups(item_groups, tolerance), sort_key)
+    smallest_item_volume = sorted_congruency_groups[-1].dimensions.volume
+
+    congruency_group = sorted_congruency_groups[0]
+    with phase_timer(observer, Phase.BOX_SELECTION):
+        used_boxes = [
+            next_box_to_use(catalog, congruency_group, sorted_congruency_groups[1:], empty_space_ratio),
+        ]
+    packed_items, new_spaces = place_congruency_group(
+        congruency_group,
+        Space.from_box(used_boxes[0], 0),
+        observer,
+        fill_order,
+    )
+    all_packed_items = [packed_items]
+
+    if congruency_group.quantity <= 0 and len(sorted_congruency_groups) > 1:
+        congruency_group = sorted_congruency_groups[1]
+    if congruency_group.quantity > 0:
+        with phase_timer(observer, Phase.SPACE_SELECTION):
+            usable_spaces = SpaceStore()
+            for new_space in new_spaces:
+                if new_space.dimensions.volume >= smallest_item_volume:
+                    usable_spaces.add(new_space)
+            space = usable_spaces.pop_first_fit(congruency_group.dimensions)
+        if space is None:
+            with phase_timer(observer, Phase.BOX_SELECTION):
+                used_boxes.append(next_box_to_use(catalog, congruency_group, [], empty_space_ratio))
+            space = Space.from_box(used_boxes[-1], 1)
+
+        packed_items, _ = place_congruency_group(congruency_group, space, observer, fill_order)
+        all_packed_items.append(packed_items)
+
+        if observer is not None:
+            observer.count(CounterName.SPACES_SCANNED, usable_spaces.scanned)
+
+    if observer is not None:
+        observer.count(CounterName.BOXES_OPENED, len(used_boxes))
+
+    return build_packed_boxes(used_boxes, all_packed_items)
+
+
+@dataclass
+class BeamState:
+    # Congruency groups are copied before being packed from, so states can
+    # share the ones they haven't touched
+    congruency_groups: list[CongruencyGroup]
+    congruency_group_idx: int
+    usable_spaces: SpaceStore
+    used_boxes: list[Box]
+    all_packed_items: list[PackedItems]
+    box_volume: float = 0.0
+    packed_volume: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        return self.congruency_group_idx == len(self.congruency_groups)
+
+    @property
+    def score(self) -> tuple[int, float]:
+        # Fewest boxes first, then the least room lost in them, which is the
+        # volume of the boxes that's neither packed nor still usable
+        free_volume = sum(space.dimensions.volume for space in self.usable_spaces)
+        return len(self.used_boxes), self.box_volume - self.packed_volume - free_volume
+
+    def packed_box_score(self) -> tuple[int, float]:
+        return len(self.used_boxes), self.box_volume
+
+
+def pack_beam(
+    catalog: BoxCatalog,
+    item_groups: list[ItemGroup],
+    empty_space_ratio: float,
+    beam_width: int,
+    deadline_ms: float | None = None,
+    tolerance: float | None = None,
+    observer: PackObserver | None = None,
+    sort_key: SortKey = SortKey.DIAGONAL,
+    fill_order: FillOrder = FillOrder.ALL,
+) -> list[PackedBox]:
+    """Beam search over the choices `pack_general` makes greedily
+
+    Keeps the `beam_width` best partial packings at each step, branching on
+    every orientation and split of the space chosen, and on a few boxes when
+    a new one is needed. Starts from the greedy packing, so is never worse,
+    and returns the best complete packing found once `deadline_ms` is up.
+    """
+    start = perf_counter()
+    deadline = math.inf if deadline_ms is None else start + deadline_ms / 1000
+
+    best_used_boxes = None
+    best_all_packed_items = None
+    best_score = (math.inf, math.inf)
+    greedy_packed_boxes = pack_general(
+        catalog,
+        item_groups,
+        empty_space_ratio,
+        tolerance,
+        sort_key=sort_key,
+        fill_order=fill_order,
+    )
+    if greedy_packed_boxes:
+        best_score = (len(greedy_packed_boxes), sum(packed_box.box.dimensions.volume for packed_box in greedy_packed_boxes))
+
+    sorted_congruency_groups = sort_congruency_groups(gather_congruency_groups(item_groups, tolerance), sort_key)
+    smallest_item_volume = sorted_congruency_groups[-1].dimensions.volume
+    min_dims = remaining_min_dims(sorted_congruency_groups)
+
+    expanded = 0
+    beam = [BeamState(sorted_congruency_groups, 0, SpaceStore(), [], [])]
+    while beam and perf_counter() < deadline:
+        children = []
+        for state in beam:
+            if perf_counter() >= deadline:
                 break
-        if not found_congruency_group:
-            congruency_groups.append(CongruencyGroup(item_group.item.dimensions, [item_group]))
+            expanded += 1
+            children.extend(expand_beam_state(
+                catalog,
+                state,
+                empty_space_ratio,
+                smallest_item_volume,
+                min_dims,
+                fill_order,
+            ))
+
+        beam = []
+        for child in children:
+            if not child.complete:
+                beam.append(child)
+            elif child.packed_box_score() < best_score:
+                best_score = child.packed_box_score()
+                best_used_boxes = child.used_boxes
+                best_all_packed_items = child.all_packed_items
+        beam = sorted(beam, key=lambda state: state.score)[:beam_width]
+
+    if observer is not None:
+        observer.count(CounterName.BEAM_STATES_EXPANDED, expanded)
+        observer.count(CounterName.BOXES_OPENED, best_score[0])
+
+    if best_used_boxes is None:
+        return greedy_packed_boxes
+    return build_packed_boxes(best_used_boxes, best_all_packed_items)
+
+
+def expand_beam_state(
+    catalog: BoxCatalog,
+    state: BeamState,
+    empty_space_ratio: float,
+    smallest_item_volume: float,
+    min_dims: list[tuple[float, float, float]],
+    fill_order: FillOrder = FillOrder.ALL,
+) -> list[BeamState]:
+    # Every way of placing the next lot of the current congruency group
+    congruency_group_idx = state.congruency_group_idx
+    congruency_group = state.congruency_groups[congruency_group_idx]
+
+    # The space is picked the same way as `pack_general`, but with a choice of
+    # boxes when a new one is needed
+    usable_spaces = state.usable_spaces.copy()
+    space = usable_spaces.pop_first_fit(congruency_group.dimensions)
+    if space is None and len(usable_spaces) > 1 and merge_spaces(usable_spaces):
+        space = usable_spaces.pop_first_fit(congruency_group.dimensions)
+    if space is not None:
+        space_options = [(space, None)]
+    else:
+        space_options = [
+            (Space.from_box(box, len(state.used_boxes)), box)
+            for box in beam_box_options(catalog, state, empty_space_ratio)
+        ]
+
+    children = []
+    for space, box in space_options:
+        used_boxes = state.used_boxes if box is None else state.used_boxes + [box]
+        box_volume = state.box_volume if box is None else state.box_volume + box.dimensions.volume
+        for packed_items in get_potential_packed_items(congruency_group, space, fill_order):
+            remaining_congruency_group = CongruencyGroup(congruency_group.dimensions, congruency_group.item_groups)
+            update_congruency_group(remaining_congruency_group, packed_items)
+            congruency_groups = state.congruency_groups.copy()
+            congruency_groups[congruency_group_idx] = remaining_congruency_group
+
+            next_congruency_group_idx = congruency_group_idx
+            while (
+                next_congruency_group_idx < len(congruency_groups)
+                and congruency_groups[next_congruency_group_idx].quantity <= 0
+            ):
+                next_congruency_group_idx += 1
+
+            packed_volume = state.packed_volume + packed_items.dimensions.volume
+            for split in range(3):
+                child_spaces = usable_spaces.copy()
+                if next_congruency_group_idx < len(congruency_groups):
+                    if min_dims[next_congruency_group_idx] != min_dims[congruency_group_idx]:
+                        child_spaces.prune(min_dims[next_congruency_group_idx])
+                    for new_space in negative_spaces(packed_items, space, split):
+                        if (
+                            new_space.dimensions.volume >= smallest_item_volume
+                            and fits_sorted(new_space.dimensions.sorted_axes, min_dims[next_congruency_group_idx])
+                        ):
+                            child_spaces.add(new_space)
+
+                children.append(BeamState(
+                    congruency_groups,
+                    next_congruency_group_idx,
+                    child_spaces,
+                    used_boxes,
+                    state.all_packed_items + [packed_items],
+                    box_volume,
+                    packed_volume,
+                ))
+                # Splits only matter for what's left to pack
+                if next_congruency_group_idx == len(congruency_groups):
+                    break
+
+    return children
+
+
+def beam_box_options(catalog: BoxCatalog, state: BeamState, empty_space_ratio: float) -> list[Box]:
+    # The box `pack_general` would use, the smallest box for everything left
+    # without any extra room, and the smallest box for the items in hand
+    congruency_group_idx = state.congruency_group_idx
+    congruency_group = state.congruency_groups[congruency_group_idx]
+    remaining_congruency_groups = state.congruency_groups[congruency_group_idx+1:]
+    boxes = [
+        next_box_to_use(catalog, congruency_group, remaining_congruency_groups, empty_space_ratio),
+        next_box_to_use(catalog, congruency_group, remaining_congruency_groups, 1.0),
+    ]
+    box_idx = catalog.smallest_box_idx(congruency_group.dimensions)
+    if box_idx is not None:
+        boxes.append(catalog.boxes[box_idx])
+
+    unique_boxes = []
+    for box in boxes:
+        if box.dimensions.fits_any_orientation(congruency_group.dimensions) and all(box is not other for other in unique_boxes):
+            unique_boxes.append(box)
+    return unique_boxes
+
+
+def downsize_packed_boxes(catalog: BoxCatalog, packed_boxes: list[PackedBox]) -> int:
+    # Boxes are picked for everything left to pack, so can end up larger than
+    # what was actually packed into them. Moves the contents of each box into
+    # the smallest box that fits them, rotating them to fit, and returns how
+    # many boxes were swapped
+    downsized = 0
+    for packed_box in packed_boxes:
+        extent = packed_extent(packed_box.packed_items)
+        box_idx = catalog.smallest_box_idx(extent)
+        if box_idx is None:
+            continue
+        box = catalog.boxes[box_idx]
+        if box.dimensions.volume >= packed_box.box.dimensions.volume:
+            continue
+
+        orientations = box.dimensions.fit_orientations(extent)
+        if not orientations:
+            continue
+        packed_box.box = box
+        packed_box.packed_items = [
+            rotate_packed_items(packed_items, orientations[0])
+            for packed_items in packed_box.packed_items
+        ]
+        downsized += 1
+
+    return downsized
+
+
+def packed_extent(packed_items: list[PackedItems]) -> Dimensions:
+    # Bounding dimensions of everything packed, measured from the box's origin
+    width = height = depth = 0.0
+    for items in packed_items:
+        width = max(width, items.offset.x + items.dimensions.width)
+        height = max(height, items.offset.y + items.dimensions.height)
+        depth = max(depth, items.offset.z + items.dimensions.depth)
+    return Dimensions(width, height, depth)
+
+
+def rotate_packed_items(packed_items: PackedItems, orientation: Orientation) -> PackedItems:
+    # Rotates packed items along with the box they're in, so their position
+    # relative to everything else in the box is kept
+    if orientation == Orientation.FRONT:
+        return packed_items
+    width_axis, height_axis, depth_axis = ROTATION_PERMUTATIONS[orientation]
+    offset = (packed_items.offset.x, packed_items.offset.y, packed_items.offset.z)
+    pattern = (packed_items.pattern.wide, packed_items.pattern.high, packed_items.pattern.deep)
+    return PackedItems(
+        box_idx=packed_items.box_idx,
+        item_groups=packed_items.item_groups,
+        offset=Point(offset[width_axis], offset[height_axis], offset[depth_axis]),
+        dimensions=packed_items.dimensions.rotate(orientation),
+        pattern=Pattern(pattern[width_axis], pattern[height_axis], pattern[depth_axis]),
+    )
+
+
+def place_congruency_group(
+    congruency_group: CongruencyGroup,
+    space: Space,
+    observer: PackObserver | None = None,
+    fill_order: FillOrder = FillOrder.ALL,
+) -> tuple[PackedItems, list[Space]]:
+    # Packs as much of the congruency group into the space as possible,
+    # returning what was packed and the spaces left around it
+    with phase_timer(observer, Phase.PATTERN_GENERATION):
+        potential_packed_items = get_potential_packed_items(congruency_group, space, fill_order)
+    with phase_timer(observer, Phase.NEGATIVE_SPACE_SELECTION):
+        packed_items, new_spaces = select_packed_items_and_negative_space(potential_packed_items, space)
+
+    if observer is not None:
+        # Every orientation is checked against the space
+        observer.count(CounterName.ROTATIONS_TRIED, len(ROTATION_PERMUTATIONS))
+        observer.placed(congruency_group, space, packed_items)
+
+    update_congruency_group(congruency_group, packed_items)
+    return packed_items, new_spaces
+
+
+def sort_congruency_groups(
+    congruency_groups: list[CongruencyGroup],
+    sort_key: SortKey = SortKey.DIAGONAL,
+) -> list[CongruencyGroup]:
+    if sort_key == SortKey.VOLUME:
+        key = lambda x: x.dimensions.volume
+    elif sort_key == SortKey.LONGEST_SIDE:
+        key = lambda x: (x.dimensions.sorted_axes[2], x.dimensions.volume)
+    else:
+        key = lambda x: x.dimensions.width**2 + x.dimensions.height**2 + x.dimensions.depth**2
+
+    return list(sorted(
+        congruency_groups,
+        key=key,
+        reverse=True,
+    ))
 
-    return congruency_groups
+
+def gather_congruency_groups(
+    item_groups: list[ItemGroup],
+    tolerance: float | None = None,
+) -> list[CongruencyGroup]:
+    # Items are congruent when their sorted dimensions match, so group on those.
+    # With a tolerance, sorted dimensions are instead rounded up to multiples
+    # of it, and the group takes the largest dimensions of its items so that
+    # the slightly smaller ones are packed as if they were the largest
+    congruency_groups: dict[tuple, CongruencyGroup] = {}
+    for item_group in item_groups:
+        item_dims = item_group.item.dimensions.sorted_axes
+        if tolerance is None:
+            key = item_dims
+        else:
+            key = tuple(math.ceil(dim / tolerance) for dim in item_dims)
+
+        congruency_group = congruency_groups.get(key)
+        if congruency_group is None:
+            congruency_groups[key] = CongruencyGroup(item_group.item.dimensions, [item_group])
+        else:
+            congruency_group.item_groups.append(item_group)
+
+    if tolerance is not None:
+        for congruency_group in congruency_groups.values():
+            if len(congruency_group.item_groups) > 1:
+                all_item_dims = [
+                    item_group.item.dimensions.sorted_axes
+                    for item_group in congruency_group.item_groups
+                ]
+                congruency_group.dimensions = Dimensions(*(max(dims) for dims in zip(*all_item_dims)))
+
+    return list(congruency_groups.values())
 
 
 def next_box_to_use(
-    sorted_boxes: list[Box],
+    catalog: BoxCatalog,
     congruency_group: CongruencyGroup,
     remaining_congruency_groups: list[CongruencyGroup],
     empty_space_ratio: float,
@@ -265,58 +1210,140 @@ def next_box_to_use(
         )
     )
 
-    for box in sorted_boxes:
-        if box.dimensions.volume < remaining_volume:
-            continue
+    box_idx = catalog.smallest_box_idx(congruency_group.dimensions, remaining_volume)
+    if box_idx is not None:
+        return catalog.boxes[box_idx]
 
-        if box.dimensions.fit_orientations(congruency_group.dimensions):
-            return box
+    if catalog.smallest_box_idx(congruency_group.dimensions) is None:
+        item_ids = ", ".join(item_group.item.id for item_group in congruency_group.item_groups)
+        raise DoesNotFitError(f"Item {item_ids} doesn't fit in any box")
 
     # TODO this is potentially dangerous if we have a really realy big box
-    return sorted_boxes[-1]
+    return catalog.boxes[-1]
 
 
 def get_potential_packed_items(
     congruency_group: CongruencyGroup,
     space: Space,
+    fill_order: FillOrder = FillOrder.ALL,
 ) -> list[PackedItems]:
-    potential_packed_items = []
-    for orientation in space.dimensions.fit_orientations(congruency_group.dimensions):
-        rotated_dims = congruency_group.dimensions.rotate(orientation)
-        # TODO can do packable dimensions in all orders to get better packing
-        # TODO can also simplify when quantity is 1
-        # TODO how should this be packed?
-        # TODO should this instead first pack in the most-available dimensions? Comes with some assumptions
-        packable_widths = min(space.dimensions.width // rotated_dims.width, congruency_group.quantity)
-        packable_depths = min(space.dimensions.depth // rotated_dims.depth, congruency_group.quantity // packable_widths)
-        packable_heights = min(space.dimensions.height // rotated_dims.height, congruency_group.quantity // (packable_widths * packable_depths))
-        # packable_heights = min(space.dimensions.height // rotated_dims.height, item_group.quantity)
-        # packable_depths = min(space.dimensions.depth // rotated_dims.depth, item_group.quantity // packable_heights)
-        # packable_widths = min(space.dimensions.width // rotated_dims.width, item_group.quantity // (packable_heights * packable_depths))
-        packable_quantity = packable_widths * packable_heights * packable_depths
-
-        packed_items = PackedItems(
-            box_idx=space.box_idx,
-            item_groups=[],
-            offset=space.offset,
-            dimensions=Dimensions(
-                rotated_dims.width * packable_widths,
-                rotated_dims.height * packable_heights,
-                rotated_dims.depth * packable_depths,
-            ),
-            pattern=Pattern(packable_widths, packable_heights, packable_depths),
+    patterns = fill_patterns(space.dimensions.axes, congruency_group.dimensions.axes, congruency_group.quantity, fill_order)
+    if not patterns:
+        raise ValueError("Items don't fit in the space in any orientation")
+    return [
+        build_packed_items(congruency_group, space, rotated_axes, pattern)
+        for rotated_axes, pattern in patterns
+    ]
+
+
+def fill_patterns(
+    space_axes: tuple[float, float, float],
+    item_axes: tuple[float, float, float],
+    quantity: int,
+    fill_order: FillOrder = FillOrder.ALL,
+) -> tuple[tuple[tuple[float, float, float], "Pattern"], ...]:
+    # The rotated item axes and patterns packing the most items into the
+    # space, over every orientation and the fill order(s) asked for
+    key = (space_axes, item_axes, quantity, fill_order)
+    patterns = fill_pattern_memo.get(key)
+    if patterns is not None:
+        return patterns
+
+    if fill_order == FillOrder.ALL:
+        axis_orders = FILL_ORDER_AXES.values()
+    else:
+        axis_orders = [FILL_ORDER_AXES[fill_order]]
+
+    candidates = []
+    max_quantity = 0
+    seen_rotated_axes = set()
+    # Patterns taking up the same room leave the same spaces, so only the
+    # first of them can be picked
+    seen_packed_axes = set()
+    for width_axis, height_axis, depth_axis in ROTATION_PERMUTATIONS.values():
+        rotated_axes = (item_axes[width_axis], item_axes[height_axis], item_axes[depth_axis])
+        if rotated_axes in seen_rotated_axes:
+            # Items with matching sides have orientations that are the same
+            continue
+        seen_rotated_axes.add(rotated_axes)
+
+        # How many items fit along each axis of the space
+        fits = (
+            space_axes[0] // rotated_axes[0],
+            space_axes[1] // rotated_axes[1],
+            space_axes[2] // rotated_axes[2],
         )
-        for item_group in congruency_group.item_groups:
-            if item_group.quantity + packed_items.quantity >= packable_quantity:
-                parital_item_group = ItemGroup(item_group.item, packable_quantity - packed_items.quantity)
-                packed_items.item_groups.append(parital_item_group)
-                break
-            packed_items.item_groups.append(item_group)
+        if not (fits[0] and fits[1] and fits[2]):
+            continue
+        if quantity == 1:
+            orientation_patterns = [(1, 1, 1)]
+        elif fits[0] * fits[1] * fits[2] <= quantity:
+            # The space is filled whichever way it's filled
+            orientation_patterns = [fits]
+        else:
+            orientation_patterns = []
+            for first_axis, second_axis, third_axis in axis_orders:
+                # Fill along the first axis as far as possible, then stack
+                # those rows along the second, then those layers along the third
+                packable = [0, 0, 0]
+                packable[first_axis] = min(fits[first_axis], quantity)
+                packable[second_axis] = min(fits[second_axis], quantity // packable[first_axis])
+                packable[third_axis] = min(fits[third_axis], quantity // (packable[first_axis] * packable[second_axis]))
+                packable = tuple(packable)
+                if packable not in orientation_patterns:
+                    orientation_patterns.append(packable)
+
+        for packable in orientation_patterns:
+            pattern_quantity = packable[0] * packable[1] * packable[2]
+            if pattern_quantity > max_quantity:
+                max_quantity = pattern_quantity
+                candidates = []
+                seen_packed_axes.clear()
+            if pattern_quantity == max_quantity:
+                packed_axes = (
+                    rotated_axes[0] * packable[0],
+                    rotated_axes[1] * packable[1],
+                    rotated_axes[2] * packable[2],
+                )
+                if packed_axes not in seen_packed_axes:
+                    seen_packed_axes.add(packed_axes)
+                    candidates.append((rotated_axes, Pattern(*packable)))
+
+    patterns = tuple(candidates)
+    if len(fill_pattern_memo) >= FILL_PATTERN_MEMO_MAX_SIZE:
+        fill_pattern_memo.clear()
+    fill_pattern_memo[key] = patterns
+    return patterns
 
-        potential_packed_items.append(packed_items)
 
-    max_quantity = max(packed_items.quantity for packed_items in potential_packed_items)
-    return [packed_items for packed_items in potential_packed_items if packed_items.quantity == max_quantity]
+def build_packed_items(
+    congruency_group: CongruencyGroup,
+    space: Space,
+    rotated_axes: tuple[float, float, float],
+    pattern: Pattern,
+) -> PackedItems:
+    packable_quantity = pattern.wide * pattern.high * pattern.deep
+    packed_item_groups = []
+    packed_quantity = 0
+    for item_group in congruency_group.item_groups:
+        if item_group.quantity + packed_quantity >= packable_quantity:
+            parital_item_group = ItemGroup(item_group.item, packable_quantity - packed_quantity)
+            packed_item_groups.append(parital_item_group)
+            break
+        packed_item_groups.append(item_group)
+        packed_quantity += item_group.quantity
+
+    return PackedItems(
+        box_idx=space.box_idx,
+        item_groups=packed_item_groups,
+        offset=space.offset,
+        dimensions=Dimensions(
+            rotated_axes[0] * pattern.wide,
+            rotated_axes[1] * pattern.high,
+            rotated_axes[2] * pattern.deep,
+        ),
+        pattern=pattern,
+    )
 
 
 def select_packed_items_and_negative_space(
@@ -324,159 +1351,176 @@ def select_packed_items_and_negative_space(
     space: Space,
 ) -> tuple[PackedItems, list[Space]]:
     best_packed_items = None
-    best_negative_space_group = None
+    best_split = None
     best_negative_space_volume = -1
+    space_width, space_height, space_depth = space.dimensions.axes
     for packed_items in potential_packed_items:
-        # TODO This can be expanded to more negative spaces, but also simplified
-        negative_space_groups = [
-            [
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        space.dimensions.width - packed_items.dimensions.width,
-                        space.dimensions.height,
-                        space.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x + packed_items.dimensions.width,
-                        space.offset.y,
-                        space.offset.z,
-                    ),
+        # Only the first (largest) space of each split is needed to pick one,
+        # so the spaces themselves are only created for the best split
+        packed_width, packed_height, packed_depth = packed_items.dimensions.axes
+        first_negative_spaces = (
+            (space_width - packed_width, space_height, space_depth),
+            (space_width, space_height - packed_height, space_depth),
+            (space_width, space_height, space_depth - packed_depth),
+        )
+        split = max(
+            range(len(first_negative_spaces)),
+            key=lambda x: first_negative_spaces[x][0]**2 + first_negative_spaces[x][1]**2 + first_negative_spaces[x][2]**2,
+        )
+        width, height, depth = first_negative_spaces[split]
+        if width * height * depth > best_negative_space_volume:
+            best_packed_items = packed_items
+            best_split = split
+            best_negative_space_volume = width * height * depth
+
+    return best_packed_items, negative_spaces(best_packed_items, space, best_split)
+
+
+def negative_spaces(packed_items: PackedItems, space: Space, split: int) -> list[Space]:
+    # The space left around packed items placed at the space's offset, split
+    # into three so the first space takes the whole remainder along the width
+    # (split 0), height (split 1) or depth (split 2)
+    # TODO This can be expanded to more negative spaces, but also simplified
+    if split == 0:
+        return [
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    space.dimensions.width - packed_items.dimensions.width,
+                    space.dimensions.height,
+                    space.dimensions.depth,
                 ),
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        packed_items.dimensions.width,
-                        space.dimensions.height - packed_items.dimensions.height,
-                        space.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x,
-                        space.offset.y + packed_items.dimensions.height,
-                        space.offset.z,
-                    ),
+                offset=Point(
+                    space.offset.x + packed_items.dimensions.width,
+                    space.offset.y,
+                    space.offset.z,
                 ),
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        packed_items.dimensions.width,
-                        packed_items.dimensions.height,
-                        space.dimensions.depth - packed_items.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x,
-                        space.offset.y,
-                        space.offset.z + packed_items.dimensions.depth,
-                    ),
+            ),
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    packed_items.dimensions.width,
+                    space.dimensions.height - packed_items.dimensions.height,
+                    space.dimensions.depth,
                 ),
-            ],
-            [
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        space.dimensions.width,
-                        space.dimensions.height - packed_items.dimensions.height,
-                        space.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x,
-                        space.offset.y + packed_items.dimensions.height,
-                        space.offset.z,
-                    ),
+                offset=Point(
+                    space.offset.x,
+                    space.offset.y + packed_items.dimensions.height,
+                    space.offset.z,
                 ),
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        space.dimensions.width,
-                        packed_items.dimensions.height,
-                        space.dimensions.depth - packed_items.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x,
-                        space.offset.y,
-                        space.offset.z + packed_items.dimensions.depth,
-                    ),
+            ),
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    packed_items.dimensions.width,
+                    packed_items.dimensions.height,
+                    space.dimensions.depth - packed_items.dimensions.depth,
                 ),
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        space.dimensions.width - packed_items.dimensions.width,
-                        packed_items.dimensions.height,
-                        packed_items.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x + packed_items.dimensions.width,
-                        space.offset.y,
-                        space.offset.z,
-                    ),
+                offset=Point(
+                    space.offset.x,
+                    space.offset.y,
+                    space.offset.z + packed_items.dimensions.depth,
                 ),
-            ],
-            [
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        space.dimensions.width,
-                        space.dimensions.height,
-                        space.dimensions.depth - packed_items.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x,
-                        space.offset.y,
-                        space.offset.z + packed_items.dimensions.depth,
-                    ),
+            ),
+        ]
+    elif split == 1:
+        return [
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    space.dimensions.width,
+                    space.dimensions.height - packed_items.dimensions.height,
+                    space.dimensions.depth,
                 ),
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        space.dimensions.width - packed_items.dimensions.width,
-                        space.dimensions.height,
-                        packed_items.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x + packed_items.dimensions.width,
-                        space.offset.y,
-                        space.offset.z,
-                    ),
+                offset=Point(
+                    space.offset.x,
+                    space.offset.y + packed_items.dimensions.height,
+                    space.offset.z,
+                ),
+            ),
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    space.dimensions.width,
+                    packed_items.dimensions.height,
+                    space.dimensions.depth - packed_items.dimensions.depth,
+                ),
+                offset=Point(
+                    space.offset.x,
+                    space.offset.y,
+                    space.offset.z + packed_items.dimensions.depth,
+                ),
+            ),
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    space.dimensions.width - packed_items.dimensions.width,
+                    packed_items.dimensions.height,
+                    packed_items.dimensions.depth,
                 ),
-                Space(
-                    box_idx=space.box_idx,
-                    dimensions=Dimensions(
-                        packed_items.dimensions.width,
-                        space.dimensions.height - packed_items.dimensions.height,
-                        packed_items.dimensions.depth,
-                    ),
-                    offset=Point(
-                        space.offset.x,
-                        space.offset.y + packed_items.dimensions.height,
-                        space.offset.z,
-                    ),
+                offset=Point(
+                    space.offset.x + packed_items.dimensions.width,
+                    space.offset.y,
+                    space.offset.z,
                 ),
-            ],
+            ),
+        ]
+    else:
+        return [
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    space.dimensions.width,
+                    space.dimensions.height,
+                    space.dimensions.depth - packed_items.dimensions.depth,
+                ),
+                offset=Point(
+                    space.offset.x,
+                    space.offset.y,
+                    space.offset.z + packed_items.dimensions.depth,
+                ),
+            ),
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    space.dimensions.width - packed_items.dimensions.width,
+                    space.dimensions.height,
+                    packed_items.dimensions.depth,
+                ),
+                offset=Point(
+                    space.offset.x + packed_items.dimensions.width,
+                    space.offset.y,
+                    space.offset.z,
+                ),
+            ),
+            Space(
+                box_idx=space.box_idx,
+                dimensions=Dimensions(
+                    packed_items.dimensions.width,
+                    space.dimensions.height - packed_items.dimensions.height,
+                    packed_items.dimensions.depth,
+                ),
+                offset=Point(
+                    space.offset.x,
+                    space.offset.y + packed_items.dimensions.height,
+                    space.offset.z,
+                ),
+            ),
         ]
-        group_with_largest_volume = list(sorted(
-            negative_space_groups,
-            key=lambda x: x[0].dimensions.width**2 + x[0].dimensions.height**2 + x[0].dimensions.depth**2,
-            reverse=True,
-        ))[0]
-        if group_with_largest_volume[0].dimensions.volume > best_negative_space_volume:
-            best_packed_items = packed_items
-            best_negative_space_group = group_with_largest_volume
-            best_negative_space_volume = best_negative_space_group[0].dimensions.volume
-
-    return best_packed_items, best_negative_space_group
 
 
 def update_congruency_group(congruency_group: CongruencyGroup, packed_items: PackedItems) -> None:
     packed_quantity = 0
     remaining_item_groups = []
-    for item_group in congruency_group.item_groups:
+    for item_group_idx, item_group in enumerate(congruency_group.item_groups):
         if packed_quantity == packed_items.quantity:
-            remaining_item_groups.append(item_group)
+            remaining_item_groups.extend(congruency_group.item_groups[item_group_idx:])
             break
         elif packed_quantity + item_group.quantity > packed_items.quantity:
             required_quantity = packed_items.quantity - packed_quantity
             remaining_quantity = item_group.quantity - required_quantity
             remaining_item_groups.append(ItemGroup(item_group.item, remaining_quantity))
+            remaining_item_groups.extend(congruency_group.item_groups[item_group_idx+1:])
             packed_quantity += required_quantity
             break
         else:
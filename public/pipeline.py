@@ -0,0 +1,183 @@
+"""Pack orders from a CSV file into JSONL, in constant memory
+
+Run from the repository root:
+
+    python -m public.pipeline data/items.csv data/boxes.csv -o packed.jsonl --rejects rejects.jsonl
+
+Items use the same columns as `data/items.csv` (name,length,width,depth,quantity)
+and boxes the same as `data/boxes.csv` (name,length,width,depth). Items may also
+have an `order` column, in which case consecutive rows with the same value are
+packed together. Without it, each row is an order of its own.
+
+Each order is written to the output as soon as it's packed, as one JSON object
+per line. Rows that can't be read are written to the rejects file instead.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import TextIO
+
+from public.batch import pack_stream
+from public.pack import Item, ItemGroup
+from public.serialize import RowError, missing_columns, packed_box_to_dict, parse_dimensions, parse_name, read_boxes
+
+ITEM_COLUMNS = ("name", "length", "width", "depth", "quantity")
+ORDER_COLUMN = "order"
+
+
+@dataclass
+class Reject:
+    line: int
+    reason: str
+    row: dict[str, str]
+
+
+@dataclass
+class PipelineSummary:
+    orders: int = 0
+    packed: int = 0
+    failed: int = 0
+    rejected_rows: int = 0
+    boxes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.orders / self.seconds if self.seconds else 0.0
+
+
+def parse_item_group(row: dict[str, str]) -> ItemGroup:
+    name = parse_name(row)
+    dimensions = parse_dimensions(row)
+    try:
+        quantity = int(row["quantity"])
+    except (TypeError, ValueError):
+        raise RowError(f"quantity is not a whole number: {row['quantity']!r}")
+    if quantity < 1:
+        raise RowError(f"quantity must be at least 1: {row['quantity']!r}")
+    return ItemGroup(Item(name, name, dimensions), quantity)
+
+
+def read_orders(f: TextIO, reject: Callable[[Reject], None]) -> Iterator[tuple[str, list[ItemGroup]]]:
+    """Lazily read `(order id, item groups)` from an items CSV
+
+    Rows that can't be read are passed to `reject` and skipped. If every
+    row of an order is rejected, the order is skipped too.
+    """
+    reader = csv.DictReader(f)
+    missing = missing_columns(reader.fieldnames, ITEM_COLUMNS)
+    has_order_column = ORDER_COLUMN in (reader.fieldnames or [])
+
+    order_id = None
+    item_groups: list[ItemGroup] = []
+    for row in reader:
+        if missing:
+            reject(Reject(reader.line_num, f"missing columns: {', '.join(missing)}", row))
+            continue
+        if None in row or None in row.values():
+            reject(Reject(reader.line_num, "wrong number of columns", row))
+            continue
+
+        row_order_id = row[ORDER_COLUMN] if has_order_column else str(reader.line_num)
+        if row_order_id != order_id:
+            if item_groups:
+                yield order_id, item_groups
+            order_id = row_order_id
+            item_groups = []
+
+        try:
+            item_groups.append(parse_item_group(row))
+        except RowError as e:
+            reject(Reject(reader.line_num, str(e), row))
+
+    if item_groups:
+        yield order_id, item_groups
+
+
+def run_pipeline(
+    items_file: TextIO,
+    boxes_file: TextIO,
+    output: TextIO,
+    rejects_output: TextIO | None,
+    empty_space_ratio: float,
+    workers: int | None = None,
+    chunk_size: int = 64,
+) -> PipelineSummary:
+    summary = PipelineSummary()
+    start = time.perf_counter()
+
+    boxes = read_boxes(boxes_file)
+    # Ids of orders that have been read but not written yet. Results come back
+    # in order, so this only ever holds the orders in flight
+    order_ids = deque()
+
+    # Written as soon as they're read, so input that's all rejects doesn't
+    # build up waiting for an order to be packed
+    def write_reject(reject: Reject) -> None:
+        summary.rejected_rows += 1
+        if rejects_output is not None:
+            rejects_output.write(json.dumps({"line": reject.line, "reason": reject.reason, "row": reject.row}) + "\n")
+
+    def orders() -> Iterator[list[ItemGroup]]:
+        for order_id, item_groups in read_orders(items_file, write_reject):
+            order_ids.append(order_id)
+            yield item_groups
+
+    for result in pack_stream(boxes, orders(), empty_space_ratio, workers, chunk_size):
+        order_id = order_ids.popleft()
+        summary.orders += 1
+        if result.ok:
+            summary.packed += 1
+            summary.boxes += len(result.packed_boxes)
+            record = {"order": order_id, "packed_boxes": [packed_box_to_dict(packed_box) for packed_box in result.packed_boxes]}
+        else:
+            summary.failed += 1
+            record = {"order": order_id, "error": result.error}
+        output.write(json.dumps(record) + "\n")
+
+    summary.seconds = time.perf_counter() - start
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("items", help="Items CSV")
+    parser.add_argument("boxes", help="Boxes CSV")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output, defaults to stdout")
+    parser.add_argument("--rejects", help="JSONL file for rows that can't be read")
+    parser.add_argument("--empty-space-ratio", type=float, default=1.1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    args = parser.parse_args()
+
+    with (
+        open(args.items, newline="") as items_file,
+        open(args.boxes, newline="") as boxes_file,
+        open(args.output, "w") if args.output != "-" else open(sys.stdout.fileno(), "w", closefd=False) as output,
+        open(args.rejects, "w") if args.rejects else nullcontext() as rejects_output,
+    ):
+        summary = run_pipeline(
+            items_file,
+            boxes_file,
+            output,
+            rejects_output,
+            args.empty_space_ratio,
+            args.workers,
+            args.chunk_size,
+        )
+
+    print(
+        f"{summary.orders} orders ({summary.packed} packed, {summary.failed} failed) into {summary.boxes} boxes, "
+        f"{summary.rejected_rows} rows rejected, in {summary.seconds:.2f}s ({summary.throughput:.1f} orders/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import product
+from time import perf_counter
+
+from public.bounds import PackingBounds, meets_bounds, packing_bounds
+from public.pack import (
+    Box,
+    BoxCatalog,
+    CongruencyGroup,
+    FillOrder,
+    ItemGroup,
+    PackedBox,
+    PackedItems,
+    PackObserver,
+    SortKey,
+    Space,
+    pack,
+)
+
+
+@dataclass(frozen=True)
+class Variant:
+    sort_key: SortKey = SortKey.DIAGONAL
+    fill_order: FillOrder = FillOrder.ALL
+    empty_space_ratio: float = 1.1
+
+    @property
+    def name(self) -> str:
+        return f"{self.sort_key}/{self.fill_order}/{self.empty_space_ratio}"
+
+
+DEFAULT_VARIANT = Variant()
+
+DEFAULT_VARIANTS = [
+    Variant(sort_key, fill_order, empty_space_ratio)
+    for sort_key, fill_order, empty_space_ratio in product(
+        [SortKey.DIAGONAL, SortKey.VOLUME, SortKey.LONGEST_SIDE],
+        [FillOrder.ALL, FillOrder.WIDTH_DEPTH_HEIGHT, FillOrder.DEPTH_HEIGHT_WIDTH],
+        [1.0, 1.1, 1.3],
+    )
+]
+
+
+@dataclass
+class PortfolioResult:
+    packed_boxes: list[PackedBox]
+    variant: Variant
+    # How many variants finished in time, out of how many were run
+    finished: int
+    variants: int
+    seconds: float
+    # Whether the packing provably uses the fewest boxes and least box volume
+    optimal: bool = False
+
+    @property
+    def timed_out(self) -> bool:
+        # Variants left unrun once one was optimal weren't needed
+        return self.finished < self.variants and not self.optimal
+
+
+def packed_boxes_score(packed_boxes: list[PackedBox]) -> tuple[int, float]:
+    # Fewest boxes, then the least box volume
+    return len(packed_boxes), sum(packed_box.box.dimensions.volume for packed_box in packed_boxes)
+
+
+# Set once per worker process by `_init_worker` so the catalog is only shipped
+# to each worker once, rather than with every variant
+_worker_catalog: BoxCatalog | None = None
+# Shared with the portfolio, which moves it on once an order no longer
+# wants the variants started for it
+_worker_generation = None
+
+
+def _init_worker(catalog: BoxCatalog, generation) -> None:
+    global _worker_catalog, _worker_generation
+    _worker_catalog = catalog
+    _worker_generation = generation
+
+
+class _Superseded(Exception):
+    pass
+
+
+class _SupersededCheck(PackObserver):
+    # Stops a variant at its next placement once its order is done with, so
+    # it doesn't keep a worker busy into the next order
+    def __init__(self, generation: int) -> None:
+        self.generation = generation
+
+    def placed(self, congruency_group: CongruencyGroup, space: Space, packed_items: PackedItems) -> None:
+        if _worker_generation.value != self.generation:
+            raise _Superseded
+
+
+def _pack_variant(item_groups: list[ItemGroup], variant: Variant, generation: int) -> list[PackedBox]:
+    if _worker_generation.value != generation:
+        raise _Superseded
+    return pack(
+        _worker_catalog,
+        item_groups,
+        variant.empty_space_ratio,
+        sort_key=variant.sort_key,
+        fill_order=variant.fill_order,
+        observer=_SupersededCheck(generation),
+    )
+
+
+class Portfolio:
+    """Packs each order with several heuristic variants, keeping the best
+
+    Variants run at the same time on a pool of worker processes, which is
+    kept for the life of the portfolio, so use it as a context manager or
+    call `close`. Once the latency cap is hit, variants still queued are
+    cancelled and those running stop at their next placement, so they
+    don't hold up the next order. `wins` counts how often each variant
+    gave the best packing.
+    """
+
+    def __init__(
+        self,
+        boxes: list[Box] | BoxCatalog,
+        variants: list[Variant] | None = None,
+        workers: int | None = None,
+    ) -> None:
+        self.catalog = boxes if isinstance(boxes, BoxCatalog) else BoxCatalog(boxes)
+        self.variants = DEFAULT_VARIANTS if variants is None else variants
+        if DEFAULT_VARIANT in self.variants:
+            # Tried first, so it's the result when only one variant finishes
+            self.variants = [DEFAULT_VARIANT] + [variant for variant in self.variants if variant != DEFAULT_VARIANT]
+        self.wins: Counter[Variant] = Counter()
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = max(1, min(workers, len(self.variants)))
+        self._executor = None
+        if self.workers > 1:
+            self._generation = multiprocessing.RawValue("q", 0)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.catalog, self._generation),
+            )
+
+    def __enter__(self) -> "Portfolio":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._generation.value += 1
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def pack(self, item_groups: list[ItemGroup], latency_ms: float | None = None) -> PortfolioResult:
+        """Pack with every variant, or as many as finish within `latency_ms`
+
+        Returns once every variant has finished or the latency cap is hit.
+        If nothing has finished by the cap, waits for the first variant.
+        Variants run one at a time stop early once one is provably optimal.
+        Raises the first variant's error if every variant fails.
+        """
+        start = perf_counter()
+        bounds = packing_bounds(self.catalog, item_groups)
+        if self._executor is None:
+            results = self._pack_inline(item_groups, start, latency_ms, bounds)
+        else:
+            results = self._pack_parallel(item_groups, latency_ms)
+
+        best_variant = None
+        best_packed_boxes = None
+        first_error = None
+        for variant, result in results:
+            if isinstance(result, Exception):
+                first_error = first_error or result
+            elif best_packed_boxes is None or packed_boxes_score(result) < packed_boxes_score(best_packed_boxes):
+                best_variant, best_packed_boxes = variant, result
+
+        if best_packed_boxes is None:
+            raise first_error
+        self.wins[best_variant] += 1
+        return PortfolioResult(
+            best_packed_boxes,
+            best_variant,
+            len(results),
+            len(self.variants),
+            perf_counter() - start,
+            meets_bounds(bounds, best_packed_boxes),
+        )
+
+    def _pack_inline(
+        self,
+        item_groups: list[ItemGroup],
+        start: float,
+        latency_ms: float | None,
+        bounds: PackingBounds,
+    ) -> list[tuple[Variant, list[PackedBox] | Exception]]:
+        results = []
+        for variant in self.variants:
+            if results and latency_ms is not None and (perf_counter() - start) * 1000 >= latency_ms:
+                break
+            try:
+                packed_boxes = pack(
+                    self.catalog,
+                    item_groups,
+                    variant.empty_space_ratio,
+                    sort_key=variant.sort_key,
+                    fill_order=variant.fill_order,
+                )
+            except Exception as e:
+                results.append((variant, e))
+            else:
+                results.append((variant, packed_boxes))
+                if meets_bounds(bounds, packed_boxes):
+                    break
+        return results
+
+    def _pack_parallel(
+        self,
+        item_groups: list[ItemGroup],
+        latency_ms: float | None,
+    ) -> list[tuple[Variant, list[PackedBox] | Exception]]:
+        generation = self._generation.value
+        futures = [
+            self._executor.submit(_pack_variant, item_groups, variant, generation)
+            for variant in self.variants
+        ]
+        done, not_done = wait(futures, timeout=None if latency_ms is None else latency_ms / 1000)
+        if not done:
+            done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+        # Whatever's left of this order is dropped, and stops by itself
+        self._generation.value += 1
+        for future in not_done:
+            future.cancel()
+        return [
+            (variant, future.exception() or future.result())
+            for variant, future in zip(self.variants, futures)
+            if future in done
+        ]
@@ -0,0 +1,77 @@
+"""Reading boxes from CSV and writing packings as JSON-ready dicts"""
+import csv
+from typing import TextIO
+
+from public.pack import Box, Dimensions, PackedBox
+
+BOX_COLUMNS = ("name", "length", "width", "depth")
+
+
+class RowError(ValueError):
+    pass
+
+
+def parse_dimensions(row: dict[str, str]) -> Dimensions:
+    # Columns follow the frontend: length is across, width is up and depth is back
+    dimensions = []
+    for column in ("length", "width", "depth"):
+        try:
+            value = float(row[column])
+        except (TypeError, ValueError):
+            raise RowError(f"{column} is not a number: {row[column]!r}")
+        if not value > 0 or value == float("inf"):
+            raise RowError(f"{column} must be a positive number: {row[column]!r}")
+        dimensions.append(value)
+    return Dimensions(*dimensions)
+
+
+def parse_name(row: dict[str, str]) -> str:
+    name = (row["name"] or "").strip()
+    if not name:
+        raise RowError("name is empty")
+    return name
+
+
+def missing_columns(fieldnames: list[str] | None, columns: tuple[str, ...]) -> list[str]:
+    return [column for column in columns if column not in (fieldnames or [])]
+
+
+def read_boxes(f: TextIO) -> list[Box]:
+    reader = csv.DictReader(f)
+    missing = missing_columns(reader.fieldnames, BOX_COLUMNS)
+    if missing:
+        raise ValueError(f"Boxes are missing columns: {', '.join(missing)}")
+
+    boxes = []
+    for row in reader:
+        try:
+            name = parse_name(row)
+            boxes.append(Box(name, name, parse_dimensions(row)))
+        except RowError as e:
+            raise ValueError(f"Bad box on line {reader.line_num}: {e}")
+    if not boxes:
+        raise ValueError("There are no boxes")
+    return boxes
+
+
+def packed_box_to_dict(packed_box: PackedBox) -> dict:
+    box = packed_box.box
+    return {
+        "box": {"id": box.id, "name": box.name, "dimensions": dimensions_to_list(box.dimensions)},
+        "packed_items": [
+            {
+                "offset": [packed_items.offset.x, packed_items.offset.y, packed_items.offset.z],
+                "dimensions": dimensions_to_list(packed_items.dimensions),
+                "pattern": [int(packed_items.pattern.wide), int(packed_items.pattern.high), int(packed_items.pattern.deep)],
+                "items": [
+                    {"id": item_group.item.id, "name": item_group.item.name, "quantity": int(item_group.quantity)}
+                    for item_group in packed_items.item_groups
+                ],
+            }
+            for packed_items in packed_box.packed_items
+        ],
+    }
+
+
+def dimensions_to_list(dimensions: Dimensions) -> list[float]:
+    return [dimensions.width, dimensions.height, dimensions.depth]
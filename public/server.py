@@ -0,0 +1,458 @@
+"""Serve `pack` and `SolverService` over HTTP on localhost
+
+Run from the repository root:
+
+    python -m public.server data/boxes.csv --port 8080
+    python -m public.server data/boxes.csv --unix /tmp/pack.sock
+
+Endpoints:
+
+    POST /pack      {"items": [{"id": "a", "name": "A", "dimensions": [w, h, d], "quantity": 1}],
+                     "empty_space_ratio": 1.1}
+    POST /solve     {"box": {"name": "B", "dimensions": [w, h, d]}, "items": [...],
+                     "max_seconds": 1.0, "formulation": "reduced"}
+    GET  /metrics   Latencies, queue depth and request counts
+    GET  /health
+
+Orders are packed on a pool of worker processes, so a big order doesn't hold
+up the small ones behind it. Identical requests that arrive while one is
+already in flight share its result rather than being packed again. Once the
+queue is full, requests are turned away with a 503 until it drains.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+from public.pack import Box, BoxCatalog, Dimensions, DoesNotFitError, Item, ItemGroup, pack
+from public.serialize import packed_box_to_dict, read_boxes
+
+MAX_BODY_BYTES = 1 << 20
+LATENCY_WINDOW_SIZE = 4096
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+    503: "Service Unavailable",
+}
+
+
+class RequestError(ValueError):
+    def __init__(self, message: str, status: int = 400) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class LatencyWindow:
+    # The most recent latencies, to report percentiles without growing forever
+
+    def __init__(self, size: int = LATENCY_WINDOW_SIZE) -> None:
+        self.values: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self.values.append(seconds)
+
+    def to_dict(self) -> dict[str, float]:
+        values = sorted(self.values)
+        if not values:
+            return {"count": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+        def percentile(fraction: float) -> float:
+            return values[min(len(values) - 1, int(fraction * len(values)))] * 1000
+
+        return {
+            "count": len(values),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": values[-1] * 1000,
+        }
+
+
+@dataclass
+class ServerMetrics:
+    requests: int = 0
+    coalesced: int = 0
+    rejected: int = 0
+    errors: int = 0
+    # Jobs handed to the workers that haven't finished, and the most at once
+    pending: int = 0
+    max_pending: int = 0
+    # Per endpoint, from reading the request to writing the response
+    latency: dict[str, LatencyWindow] = field(default_factory=dict)
+    # From handing a job to the pool to a worker starting it
+    queue_wait: LatencyWindow = field(default_factory=LatencyWindow)
+    # From a worker starting a job to finishing it
+    service: LatencyWindow = field(default_factory=LatencyWindow)
+
+    def to_dict(self, workers: int, max_queue: int) -> dict:
+        return {
+            "workers": workers,
+            "max_queue": max_queue,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "in_flight": min(self.pending, workers),
+            "queue_depth": max(0, self.pending - workers),
+            "max_queue_depth": max(0, self.max_pending - workers),
+            "latency": {path: window.to_dict() for path, window in self.latency.items()},
+            "queue_wait": self.queue_wait.to_dict(),
+            "service": self.service.to_dict(),
+        }
+
+
+# Set once per worker process by `_init_worker` so the catalog is only shipped
+# to each worker once, rather than with every request
+_worker_catalog: BoxCatalog | None = None
+
+
+def _init_worker(catalog: BoxCatalog) -> None:
+    global _worker_catalog
+    _worker_catalog = catalog
+
+
+def _pack_job(item_groups: list[ItemGroup], empty_space_ratio: float) -> tuple[float, float, dict]:
+    # Times are wall clock so they can be compared across processes
+    started = time.time()
+    packed_boxes = pack(_worker_catalog, item_groups, empty_space_ratio)
+    response = {"packed_boxes": [packed_box_to_dict(packed_box) for packed_box in packed_boxes]}
+    return started, time.time(), response
+
+
+def _solve_job(
+    box: tuple[str, tuple[float, float, float]],
+    items: list[tuple[str, str, tuple[float, float, float]]],
+    max_seconds: float | None,
+    formulation: str,
+) -> tuple[float, float, dict]:
+    started = time.time()
+    from public.mip import Box as SolverBox, Item as SolverItem, SolverService
+
+    box_name, box_dims = box
+    service = SolverService(
+        SolverBox(box_name, *box_dims),
+        [SolverItem(name, *dims) for _, name, dims in items],
+        verbose=False,
+        formulation=formulation,
+    )
+    result = service.optimise(service.heuristic_start(), max_seconds)
+    response = {
+        "picked": result.picked,
+        "bound": result.bound,
+        "gap": result.gap if result.picked else None,
+        "optimal": result.optimal,
+        "placements": [
+            {
+                "item": placement.idx,
+                "id": items[placement.idx][0],
+                "origin": list(placement.origin),
+                "dimensions": list(placement.dims),
+            }
+            for placement in result.placements
+        ],
+    }
+    return started, time.time(), response
+
+
+def parse_dimensions(value, what: str) -> tuple[float, float, float]:
+    if not isinstance(value, list) or len(value) != 3:
+        raise RequestError(f"{what} dimensions must be a list of 3 numbers")
+    dims = []
+    for dim in value:
+        if isinstance(dim, bool) or not isinstance(dim, (int, float)) or not 0 < dim < float("inf"):
+            raise RequestError(f"{what} dimensions must be positive numbers: {value!r}")
+        dims.append(float(dim))
+    return tuple(dims)
+
+
+def parse_items(body: dict) -> list[tuple[str, str, tuple[float, float, float], int]]:
+    items = body.get("items")
+    if not isinstance(items, list) or not items:
+        raise RequestError("items must be a non-empty list")
+    parsed = []
+    for item_idx, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise RequestError(f"item {item_idx} must be an object")
+        item_id = str(item.get("id", item_idx))
+        name = str(item.get("name", item_id))
+        dims = parse_dimensions(item.get("dimensions"), f"item {item_idx}")
+        quantity = item.get("quantity", 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            raise RequestError(f"item {item_idx} quantity must be a whole number of at least 1")
+        parsed.append((item_id, name, dims, quantity))
+    return parsed
+
+
+def parse_optional_number(body: dict, key: str, default: float | None) -> float | None:
+    value = body.get(key, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+        raise RequestError(f"{key} must be a positive number")
+    return float(value)
+
+
+class PackingServer:
+    def __init__(self, boxes: list[Box], workers: int | None = None, max_queue: int = 256) -> None:
+        self.catalog = BoxCatalog(boxes)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.metrics = ServerMetrics()
+        self._executor = self._start_executor()
+        # Requests being worked on, by their canonical JSON
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.catalog,),
+        )
+        # Start the workers now, rather than forking them from inside the
+        # event loop on the first request
+        for future in [executor.submit(int) for _ in range(self.workers)]:
+            future.result()
+        return executor
+
+    def _restart_executor(self, broken: ProcessPoolExecutor) -> None:
+        # Every request that was on the broken pool fails with it, but only the
+        # first of them to get here replaces it
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._start_executor()
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+    async def submit(self, key: str, fn, *args) -> dict:
+        """Run `fn(*args)` on a worker, sharing the result with identical requests"""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.metrics.coalesced += 1
+            return await asyncio.shield(future)
+
+        if self.metrics.pending >= self.workers + self.max_queue:
+            self.metrics.rejected += 1
+            raise RequestError("Too many requests queued, try again shortly", 503)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._in_flight[key] = future
+        self.metrics.pending += 1
+        self.metrics.max_pending = max(self.metrics.max_pending, self.metrics.pending)
+        submitted = time.time()
+        executor = self._executor
+        try:
+            started, finished, response = await loop.run_in_executor(executor, fn, *args)
+        except Exception as e:
+            future.set_exception(e)
+            # Only retrieved by coalesced requests, if there were any
+            future.exception()
+            if isinstance(e, BrokenProcessPool):
+                # A worker died, so the pool won't run anything else
+                self._restart_executor(executor)
+            raise
+        else:
+            self.metrics.queue_wait.add(max(0.0, started - submitted))
+            self.metrics.service.add(finished - started)
+            future.set_result(response)
+            return response
+        finally:
+            # Cancelled, so coalesced requests aren't left waiting forever
+            if not future.done():
+                future.cancel()
+            self.metrics.pending -= 1
+            del self._in_flight[key]
+
+    async def pack(self, body: dict) -> dict:
+        items = parse_items(body)
+        empty_space_ratio = parse_optional_number(body, "empty_space_ratio", 1.1)
+        item_groups = [
+            ItemGroup(Item(item_id, name, Dimensions(*dims)), quantity)
+            for item_id, name, dims, quantity in items
+        ]
+        key = json.dumps(["pack", items, empty_space_ratio])
+        try:
+            return await self.submit(key, _pack_job, item_groups, empty_space_ratio)
+        except DoesNotFitError as e:
+            raise RequestError(str(e), 422)
+
+    async def solve(self, body: dict) -> dict:
+        box = body.get("box")
+        if not isinstance(box, dict):
+            raise RequestError("box must be an object")
+        box_dims = parse_dimensions(box.get("dimensions"), "box")
+        box_name = str(box.get("name", "Box"))
+        items = [
+            (item_id, name, dims)
+            for item_id, name, dims, quantity in parse_items(body)
+            for _ in range(quantity)
+        ]
+        max_seconds = parse_optional_number(body, "max_seconds", None)
+        formulation = body.get("formulation", "reduced")
+        if formulation not in ("full", "reduced"):
+            raise RequestError("formulation must be full or reduced")
+
+        key = json.dumps(["solve", box_name, box_dims, items, max_seconds, formulation])
+        try:
+            return await self.submit(key, _solve_job, (box_name, box_dims), items, max_seconds, formulation)
+        except ImportError:
+            raise RequestError("python-mip isn't installed", 501)
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        routes = {
+            "/pack": ("POST", self.pack),
+            "/solve": ("POST", self.solve),
+            "/metrics": ("GET", None),
+            "/health": ("GET", None),
+        }
+        if path not in routes:
+            raise RequestError(f"No such endpoint: {path}", 404)
+        route_method, handler = routes[path]
+        if method != route_method:
+            raise RequestError(f"{path} only accepts {route_method}", 405)
+
+        if path == "/metrics":
+            return 200, self.metrics.to_dict(self.workers, self.max_queue)
+        if path == "/health":
+            return 200, {"ok": True}
+
+        try:
+            request = json.loads(body)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise RequestError(f"Body isn't valid JSON: {e}")
+        if not isinstance(request, dict):
+            raise RequestError("Body must be a JSON object")
+        return 200, await handler(request)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                start = time.perf_counter()
+                self.metrics.requests += 1
+                try:
+                    status, payload = await self.dispatch(method, path, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                if status >= 500 and status != 503:
+                    self.metrics.errors += 1
+                self.metrics.latency.setdefault(path, LatencyWindow()).add(time.perf_counter() - start)
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except RequestError as e:
+            # The request couldn't be read, so the connection can't be reused
+            await write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080, unix_path: str | None = None) -> None:
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        async with server:
+            await stop.wait()
+
+
+async def read_line(reader: asyncio.StreamReader) -> bytes:
+    try:
+        return await reader.readline()
+    except ValueError:
+        # Over the stream's limit, with the rest of the line still unread
+        raise RequestError("Request line or header is too long", 431)
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str], bytes] | None:
+    request_line = await read_line(reader)
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise RequestError("Malformed request line")
+
+    headers = {}
+    while True:
+        line = await read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise RequestError("Malformed Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise RequestError(f"Body is over {MAX_BODY_BYTES} bytes", 413)
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+async def write_response(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool) -> None:
+    body = json.dumps(payload).encode()
+    headers = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("boxes", help="Boxes CSV")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", help="Listen on this Unix socket instead")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--max-queue", type=int, default=256, help="Requests waiting for a worker before 503s")
+    args = parser.parse_args()
+
+    with open(args.boxes, newline="") as f:
+        boxes = read_boxes(f)
+
+    server = PackingServer(boxes, args.workers, args.max_queue)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+from public.pack import (
+    Box,
+    BoxCatalog,
+    CongruencyGroup,
+    Dimensions,
+    DoesNotFitError,
+    FillOrder,
+    Item,
+    ItemGroup,
+    PackedBox,
+    PackedItems,
+    Pattern,
+    Point,
+    Space,
+    SpaceStore,
+    build_packed_boxes,
+    downsize_packed_boxes,
+    merge_spaces,
+    place_congruency_group,
+)
+from public.serialize import dimensions_to_list
+
+
+class PackingSession:
+    """Packs an order's items as they arrive, without repacking what's packed
+
+    Keeps the boxes opened so far and the spaces left in them, so each
+    arrival goes into a space in an open box and a box is only opened when
+    nothing open fits it. Boxes are picked for what's left of
+    `expected_volume` when the order's total item volume is known up front,
+    and otherwise for just the items being added.
+
+    `to_dict` and `from_dict` save and restore everything needed to carry on
+    adding and removing items later.
+    """
+
+    def __init__(
+        self,
+        boxes: list[Box] | BoxCatalog,
+        empty_space_ratio: float = 1.1,
+        fill_order: FillOrder = FillOrder.ALL,
+        expected_volume: float | None = None,
+    ) -> None:
+        self.catalog = boxes if isinstance(boxes, BoxCatalog) else BoxCatalog(boxes)
+        self.empty_space_ratio = empty_space_ratio
+        self.fill_order = fill_order
+        self.expected_volume = expected_volume
+        # Box indexes in packed items and spaces are into `used_boxes`, so
+        # boxes are never taken out, even once emptied
+        self.used_boxes: list[Box] = []
+        self.packed_items: list[PackedItems] = []
+        self.usable_spaces = SpaceStore()
+        self.packed_volume = 0.0
+
+    @property
+    def quantity(self) -> int:
+        return sum(packed_items.quantity for packed_items in self.packed_items)
+
+    def add(self, item_group: ItemGroup) -> list[PackedItems]:
+        """Pack newly arrived items, returning where they were placed
+
+        If they can't all be placed, none are, and the session is left as
+        it was.
+        """
+        if item_group.quantity < 1:
+            raise ValueError(f"Quantity must be at least 1: {item_group.quantity!r}")
+        dimensions = item_group.item.dimensions
+        if self.catalog.smallest_box_idx(dimensions) is None:
+            raise DoesNotFitError(f"Item {item_group.item.id} doesn't fit in any box")
+
+        congruency_group = CongruencyGroup(dimensions, [ItemGroup(item_group.item, int(item_group.quantity))])
+        placed = []
+        opened_boxes = len(self.used_boxes)
+        packed_volume = self.packed_volume
+        while congruency_group.quantity > 0:
+            space_to_use = self.usable_spaces.pop_first_fit(dimensions)
+            # Removed items leave room split into pieces, and placements
+            # split spaces apart, so merge before opening another box
+            if space_to_use is None and len(self.usable_spaces) > 1 and merge_spaces(self.usable_spaces):
+                space_to_use = self.usable_spaces.pop_first_fit(dimensions)
+            if space_to_use is None:
+                space_to_use = self._open_box(congruency_group)
+
+            try:
+                packed_items, new_spaces = place_congruency_group(congruency_group, space_to_use, fill_order=self.fill_order)
+            except Exception:
+                if space_to_use.box_idx < opened_boxes:
+                    self.usable_spaces.add(space_to_use)
+                self._undo_add(item_group.item.id, placed, opened_boxes)
+                self.packed_volume = packed_volume
+                raise
+            self.packed_items.append(packed_items)
+            self.packed_volume += dimensions.volume * packed_items.quantity
+            placed.append(packed_items)
+
+            # Anything could arrive next, so only empty spaces are dropped
+            for new_space in new_spaces:
+                if new_space.dimensions.volume > 0:
+                    self.usable_spaces.add(new_space)
+
+        return placed
+
+    def remove(self, item_id: str, quantity: int = 1) -> None:
+        """Take packed items back out, latest placed first
+
+        The room they took up is freed for later arrivals. Raises
+        `ValueError` without removing anything if fewer than `quantity` of
+        the item are packed.
+        """
+        packed_quantity = sum(
+            item_group.quantity
+            for packed_items in self.packed_items
+            for item_group in packed_items.item_groups
+            if item_group.item.id == item_id
+        )
+        if quantity < 1 or packed_quantity < quantity:
+            raise ValueError(f"Can't remove {quantity} of item {item_id}, {packed_quantity} packed")
+
+        for packed_items_idx in range(len(self.packed_items) - 1, -1, -1):
+            if quantity == 0:
+                break
+            packed_items = self.packed_items[packed_items_idx]
+            item_groups = []
+            removed = 0
+            for item_group in packed_items.item_groups:
+                if item_group.item.id == item_id and removed < quantity:
+                    item_removed = min(item_group.quantity, quantity - removed)
+                    removed += item_removed
+                    if item_group.quantity > item_removed:
+                        item_groups.append(ItemGroup(item_group.item, item_group.quantity - item_removed))
+                else:
+                    item_groups.append(item_group)
+            if not removed:
+                continue
+
+            kept_items, freed_spaces = shrink_packed_items(packed_items, item_groups)
+            self.packed_items[packed_items_idx:packed_items_idx+1] = kept_items
+            for freed_space in freed_spaces:
+                self.usable_spaces.add(freed_space)
+            self.packed_volume -= packed_items.dimensions.volume * removed / packed_items.quantity
+            quantity -= removed
+
+            if not any(other.box_idx == packed_items.box_idx for other in self.packed_items):
+                self._empty_box(packed_items.box_idx)
+
+    def snapshot(self, downsize: bool = False) -> list[PackedBox]:
+        """The boxes packed so far, leaving out any that have been emptied
+
+        With `downsize`, boxes are swapped for the smallest that fits what's
+        in them, as `pack` does. The session itself keeps its boxes.
+        """
+        # Items are numbered by the boxes kept, as `pack` numbers them
+        packed_boxes = []
+        for packed_box in build_packed_boxes(self.used_boxes, self.packed_items):
+            if not packed_box.packed_items:
+                continue
+            packed_boxes.append(PackedBox(packed_box.box, [
+                PackedItems(
+                    box_idx=len(packed_boxes),
+                    item_groups=packed_items.item_groups,
+                    offset=packed_items.offset,
+                    dimensions=packed_items.dimensions,
+                    pattern=packed_items.pattern,
+                )
+                for packed_items in packed_box.packed_items
+            ]))
+        if downsize:
+            downsize_packed_boxes(self.catalog, packed_boxes)
+        return packed_boxes
+
+    def to_dict(self) -> dict:
+        return {
+            "empty_space_ratio": self.empty_space_ratio,
+            "fill_order": str(self.fill_order),
+            "expected_volume": self.expected_volume,
+            "boxes": [
+                {"id": box.id, "name": box.name, "dimensions": dimensions_to_list(box.dimensions)}
+                for box in self.used_boxes
+            ],
+            "packed_items": [
+                {
+                    "box": packed_items.box_idx,
+                    "offset": point_to_list(packed_items.offset),
+                    "dimensions": dimensions_to_list(packed_items.dimensions),
+                    "pattern": [int(packed_items.pattern.wide), int(packed_items.pattern.high), int(packed_items.pattern.deep)],
+                    "items": [
+                        {
+                            "id": item_group.item.id,
+                            "name": item_group.item.name,
+                            "dimensions": dimensions_to_list(item_group.item.dimensions),
+                            "quantity": int(item_group.quantity),
+                        }
+                        for item_group in packed_items.item_groups
+                    ],
+                }
+                for packed_items in self.packed_items
+            ],
+            # In store order, so spaces are tried in the same order on resuming
+            "spaces": [
+                {
+                    "box": space.box_idx,
+                    "offset": point_to_list(space.offset),
+                    "dimensions": dimensions_to_list(space.dimensions),
+                }
+                for space in self.usable_spaces
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, boxes: list[Box] | BoxCatalog) -> "PackingSession":
+        """Resume a session saved with `to_dict`
+
+        `boxes` is the catalog to open new boxes from. Boxes that were
+        already open are restored as saved, even if no longer in it.
+        """
+        session = cls(
+            boxes,
+            data["empty_space_ratio"],
+            FillOrder(data["fill_order"]),
+            data["expected_volume"],
+        )
+        session.used_boxes = [
+            Box(box["id"], box["name"], Dimensions(*box["dimensions"]))
+            for box in data["boxes"]
+        ]
+        for packed_items in data["packed_items"]:
+            item_groups = [
+                ItemGroup(Item(item["id"], item["name"], Dimensions(*item["dimensions"])), item["quantity"])
+                for item in packed_items["items"]
+            ]
+            session.packed_items.append(PackedItems(
+                box_idx=packed_items["box"],
+                item_groups=item_groups,
+                offset=Point(*packed_items["offset"]),
+                dimensions=Dimensions(*packed_items["dimensions"]),
+                pattern=Pattern(*packed_items["pattern"]),
+            ))
+            session.packed_volume += Dimensions(*packed_items["dimensions"]).volume
+        for space in data["spaces"]:
+            session.usable_spaces.add(Space(space["box"], Dimensions(*space["dimensions"]), Point(*space["offset"])))
+        return session
+
+    def _open_box(self, congruency_group: CongruencyGroup) -> Space:
+        remaining_volume = congruency_group.dimensions.volume * congruency_group.quantity
+        if self.expected_volume is not None:
+            remaining_volume = max(remaining_volume, self.expected_volume - self.packed_volume)
+
+        box_idx = self.catalog.smallest_box_idx(congruency_group.dimensions, self.empty_space_ratio * remaining_volume)
+        if box_idx is None:
+            box_idx = self.catalog.smallest_box_idx(congruency_group.dimensions)
+        box = self.catalog.boxes[box_idx]
+        self.used_boxes.append(box)
+        return Space.from_box(box, len(self.used_boxes) - 1)
+
+    def _undo_add(self, item_id: str, placed: list[PackedItems], opened_boxes: int) -> None:
+        # Takes out what an arrival placed before failing, then closes the
+        # boxes opened for it, which are the last and now empty
+        if placed:
+            self.remove(item_id, sum(packed_items.quantity for packed_items in placed))
+        for space in [space for space in self.usable_spaces if space.box_idx >= opened_boxes]:
+            self.usable_spaces.remove(space)
+        del self.used_boxes[opened_boxes:]
+
+    def _empty_box(self, box_idx: int) -> None:
+        # Everything's been taken out, so the whole box is free again rather
+        # than the pieces its spaces were split into
+        for space in [space for space in self.usable_spaces if space.box_idx == box_idx]:
+            self.usable_spaces.remove(space)
+        self.usable_spaces.add(Space.from_box(self.used_boxes[box_idx], box_idx))
+
+
+def point_to_list(point: Point) -> list[float]:
+    return [point.x, point.y, point.z]
+
+
+def shrink_packed_items(packed_items: PackedItems, item_groups: list[ItemGroup]) -> tuple[list[PackedItems], list[Space]]:
+    # Packed items fill their pattern's cells along the width, then the
+    # height, then the depth. The first cells keep the items that are left,
+    # which takes up to three blocks: whole layers, whole rows, then what's
+    # left of the last row. The rest of the cells become spaces
+    pattern = packed_items.pattern
+    offset = packed_items.offset
+    item_axes = (
+        packed_items.dimensions.width / pattern.wide,
+        packed_items.dimensions.height / pattern.high,
+        packed_items.dimensions.depth / pattern.deep,
+    )
+    quantity = sum(item_group.quantity for item_group in item_groups)
+    if quantity == 0:
+        return [], [Space(packed_items.box_idx, packed_items.dimensions, offset)]
+
+    layers, layer_quantity = divmod(quantity, pattern.wide * pattern.high)
+    rows, row_quantity = divmod(layer_quantity, pattern.wide)
+    # (wide, high, deep) cells at (x, y, z) cells into the packed items
+    kept_blocks = [
+        ((pattern.wide, pattern.high, layers), (0, 0, 0)),
+        ((pattern.wide, rows, 1), (0, 0, layers)),
+        ((row_quantity, 1, 1), (0, rows, layers)),
+    ]
+    freed_blocks = [
+        ((pattern.wide - row_quantity, 1, 1), (row_quantity, rows, layers)),
+        ((pattern.wide, pattern.high - rows - 1, 1), (0, rows + 1, layers)),
+        ((pattern.wide, pattern.high, pattern.deep - layers - 1), (0, 0, layers + 1)),
+    ]
+    if layer_quantity == 0:
+        # Whole layers only, so the rest is a single block of layers
+        freed_blocks = [((pattern.wide, pattern.high, pattern.deep - layers), (0, 0, layers))]
+
+    kept_items = []
+    for cells, cell_offset in kept_blocks:
+        block_quantity = cells[0] * cells[1] * cells[2]
+        if not block_quantity:
+            continue
+        block_item_groups, item_groups = split_item_groups(item_groups, block_quantity)
+        kept_items.append(PackedItems(
+            box_idx=packed_items.box_idx,
+            item_groups=block_item_groups,
+            offset=cells_offset(offset, item_axes, cell_offset),
+            dimensions=cells_dimensions(item_axes, cells),
+            pattern=Pattern(*cells),
+        ))
+
+    freed_spaces = [
+        Space(packed_items.box_idx, cells_dimensions(item_axes, cells), cells_offset(offset, item_axes, cell_offset))
+        for cells, cell_offset in freed_blocks
+        if cells[0] > 0 and cells[1] > 0 and cells[2] > 0
+    ]
+    return kept_items, freed_spaces
+
+
+def split_item_groups(item_groups: list[ItemGroup], quantity: int) -> tuple[list[ItemGroup], list[ItemGroup]]:
+    # The first `quantity` items, then the rest
+    head = []
+    for item_group_idx, item_group in enumerate(item_groups):
+        if item_group.quantity >= quantity:
+            head.append(ItemGroup(item_group.item, quantity))
+            tail = item_groups[item_group_idx+1:]
+            if item_group.quantity > quantity:
+                tail = [ItemGroup(item_group.item, item_group.quantity - quantity)] + tail
+            return head, tail
+        head.append(item_group)
+        quantity -= item_group.quantity
+    return head, []
+
+
+def cells_dimensions(item_axes: tuple[float, float, float], cells: tuple[int, int, int]) -> Dimensions:
+    return Dimensions(item_axes[0] * cells[0], item_axes[1] * cells[1], item_axes[2] * cells[2])
+
+
+def cells_offset(offset: Point, item_axes: tuple[float, float, float], cells: tuple[int, int, int]) -> Point:
+    return Point(
+        offset.x + item_axes[0] * cells[0],
+        offset.y + item_axes[1] * cells[1],
+        offset.z + item_axes[2] * cells[2],
+    )
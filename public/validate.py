@@ -0,0 +1,282 @@
+import math
+import random
+from collections import Counter
+from dataclasses import dataclass
+from enum import StrEnum
+from heapq import heappop, heappush
+
+from public.pack import Dimensions, ItemGroup, PackedBox, PackedItems
+
+# Edges are sums of dimensions, so may be out by rounding
+EPSILON = 1e-6
+
+# Below this many, `overlapping_pairs` checks every cuboid the sweep is in
+MAX_UNFILED_CUBOIDS = 32
+
+# (x, y, z, width, height, depth)
+Cuboid = tuple[float, float, float, float, float, float]
+
+
+class ViolationKind(StrEnum):
+    OUTSIDE_BOX = "outside_box"
+    OVERLAP = "overlap"
+    PATTERN = "pattern"  # Items don't fit the cells of their pattern
+    QUANTITY = "quantity"  # Packed quantities don't match what was ordered
+
+
+@dataclass
+class Violation:
+    kind: ViolationKind
+    # Index of the box in the packing, or None for the whole order
+    box_idx: int | None
+    message: str
+
+
+class ValidationError(ValueError):
+    def __init__(self, violations: list[Violation]) -> None:
+        super().__init__("; ".join(violation.message for violation in violations))
+        self.violations = violations
+
+
+def cuboids_overlap(a: Cuboid, b: Cuboid) -> bool:
+    return (
+        a[0] < b[0] + b[3] - EPSILON and b[0] < a[0] + a[3] - EPSILON
+        and a[1] < b[1] + b[4] - EPSILON and b[1] < a[1] + a[4] - EPSILON
+        and a[2] < b[2] + b[5] - EPSILON and b[2] < a[2] + a[5] - EPSILON
+    )
+
+
+def overlapping_pairs(cuboids: list[Cuboid]) -> list[tuple[int, int]]:
+    # Sweeps along the width in order of where cuboids start, keeping those
+    # the sweep is still inside of. These are also filed under the rows of
+    # the height they span, so each is only checked against the few level
+    # with it along both, rather than every other one
+    if len(cuboids) <= MAX_UNFILED_CUBOIDS:
+        # Too few for filing into rows to pay off, so they share the one
+        cuboid_rows = [range(1)] * len(cuboids)
+    else:
+        heights = sorted(cuboid[4] for cuboid in cuboids)
+        row_height = heights[len(heights) // 2] or heights[-1] or 1.0
+        # Cuboids only overlap by more than EPSILON, so one ending on a
+        # row's edge needn't be in that row
+        cuboid_rows = []
+        for cuboid in cuboids:
+            first_row = math.floor(cuboid[1] / row_height)
+            cuboid_rows.append(range(first_row, max(first_row, math.floor((cuboid[1] + cuboid[4] - EPSILON) / row_height)) + 1))
+
+    order = sorted(range(len(cuboids)), key=lambda cuboid_idx: cuboids[cuboid_idx][0])
+    active_rows: dict[int, dict[int, Cuboid]] = {}
+    # Where along the width each active cuboid ends, soonest first
+    active_ends: list[tuple[float, int]] = []
+    pairs = []
+    for cuboid_idx in order:
+        cuboid = cuboids[cuboid_idx]
+        while active_ends and active_ends[0][0] <= cuboid[0] + EPSILON:
+            ended_idx = heappop(active_ends)[1]
+            for row in cuboid_rows[ended_idx]:
+                del active_rows[row][ended_idx]
+
+        rows = cuboid_rows[cuboid_idx]
+        # Only cuboids in several rows can meet the same one twice
+        checked = set() if len(rows) > 1 else None
+        for row in rows:
+            row_cuboids = active_rows.setdefault(row, {})
+            for active_idx, active_cuboid in row_cuboids.items():
+                if checked is not None:
+                    if active_idx in checked:
+                        continue
+                    checked.add(active_idx)
+                if cuboids_overlap(active_cuboid, cuboid):
+                    pairs.append((min(active_idx, cuboid_idx), max(active_idx, cuboid_idx)))
+            row_cuboids[cuboid_idx] = cuboid
+        heappush(active_ends, (cuboid[0] + cuboid[3], cuboid_idx))
+    return pairs
+
+
+def packed_items_cuboid(packed_items: PackedItems) -> Cuboid:
+    offset, dimensions = packed_items.offset, packed_items.dimensions
+    return (offset.x, offset.y, offset.z, dimensions.width, dimensions.height, dimensions.depth)
+
+
+def occupied_cells(packed_items: PackedItems) -> list[Cuboid]:
+    # Items fill a pattern's cells along the width, then the height, then
+    # the depth, so blocks with fewer items than cells leave the last empty
+    pattern = packed_items.pattern
+    wide, high, deep = int(pattern.wide), int(pattern.high), int(pattern.deep)
+    x, y, z, width, height, depth = packed_items_cuboid(packed_items)
+    cell_width, cell_height, cell_depth = width / wide, height / high, depth / deep
+    cells = []
+    for cell_idx in range(min(int(packed_items.quantity), wide * high * deep)):
+        layer, row_cell = divmod(cell_idx, wide * high)
+        row, column = divmod(row_cell, wide)
+        cells.append((
+            x + column * cell_width,
+            y + row * cell_height,
+            z + layer * cell_depth,
+            cell_width,
+            cell_height,
+            cell_depth,
+        ))
+    return cells
+
+
+def blocks_overlap(a: PackedItems, b: PackedItems) -> bool:
+    # Only blocks that aren't full can overlap without any items doing so,
+    # so the cells are only expanded for those
+    if a.quantity >= a.pattern.wide * a.pattern.high * a.pattern.deep and b.quantity >= b.pattern.wide * b.pattern.high * b.pattern.deep:
+        return True
+    b_cuboid = packed_items_cuboid(b)
+    a_cells = [cell for cell in occupied_cells(a) if cuboids_overlap(cell, b_cuboid)]
+    if not a_cells:
+        return False
+    return any(
+        cuboids_overlap(a_cell, b_cell)
+        for b_cell in occupied_cells(b)
+        for a_cell in a_cells
+    )
+
+
+def validate_packed_box(packed_box: PackedBox, box_idx: int = 0) -> list[Violation]:
+    violations = []
+    box_axes = packed_box.box.dimensions.axes
+    for packed_items in packed_box.packed_items:
+        cuboid = packed_items_cuboid(packed_items)
+        if any(cuboid[axis] < -EPSILON or cuboid[axis] + cuboid[axis + 3] > box_axes[axis] + EPSILON for axis in range(3)):
+            violations.append(Violation(
+                ViolationKind.OUTSIDE_BOX,
+                box_idx,
+                f"Items at {cuboid[:3]} sized {cuboid[3:]} are outside box {packed_box.box.id}",
+            ))
+
+        pattern = packed_items.pattern
+        cells = pattern.wide * pattern.high * pattern.deep
+        if packed_items.quantity > cells:
+            violations.append(Violation(
+                ViolationKind.PATTERN,
+                box_idx,
+                f"{packed_items.quantity} items packed into {cells:.0f} cells at {cuboid[:3]}",
+            ))
+        if cells:
+            cell = Dimensions(cuboid[3] / pattern.wide, cuboid[4] / pattern.high, cuboid[5] / pattern.deep).sorted_axes
+            for item_group in packed_items.item_groups:
+                item = item_group.item.dimensions.sorted_axes
+                if any(item[axis] > cell[axis] + EPSILON for axis in range(3)):
+                    violations.append(Violation(
+                        ViolationKind.PATTERN,
+                        box_idx,
+                        f"Item {item_group.item.id} doesn't fit the cells at {cuboid[:3]}",
+                    ))
+
+    cuboids = [packed_items_cuboid(packed_items) for packed_items in packed_box.packed_items]
+    for a_idx, b_idx in overlapping_pairs(cuboids):
+        if blocks_overlap(packed_box.packed_items[a_idx], packed_box.packed_items[b_idx]):
+            violations.append(Violation(
+                ViolationKind.OVERLAP,
+                box_idx,
+                f"Items at {cuboids[a_idx][:3]} and {cuboids[b_idx][:3]} overlap in box {packed_box.box.id}",
+            ))
+    return violations
+
+
+def validate_packed_boxes(
+    packed_boxes: list[PackedBox],
+    item_groups: list[ItemGroup] | None = None,
+) -> list[Violation]:
+    """Everything wrong with a packing, or nothing if it's valid
+
+    Checks every packed item is in its box and overlaps nothing else, and
+    with `item_groups`, that exactly the ordered quantities are packed.
+    """
+    violations = []
+    for box_idx, packed_box in enumerate(packed_boxes):
+        violations.extend(validate_packed_box(packed_box, box_idx))
+
+    if item_groups is not None:
+        ordered = Counter()
+        for item_group in item_groups:
+            ordered[item_group.item.id] += item_group.quantity
+        packed = Counter()
+        for packed_box in packed_boxes:
+            for packed_items in packed_box.packed_items:
+                for item_group in packed_items.item_groups:
+                    packed[item_group.item.id] += item_group.quantity
+        for item_id in ordered.keys() | packed.keys():
+            if ordered[item_id] != packed[item_id]:
+                violations.append(Violation(
+                    ViolationKind.QUANTITY,
+                    None,
+                    f"Item {item_id}: {packed[item_id]:g} packed, {ordered[item_id]:g} ordered",
+                ))
+    return violations
+
+
+def check_packed_boxes(packed_boxes: list[PackedBox], item_groups: list[ItemGroup] | None = None) -> None:
+    # For tests: raises with everything wrong with the packing, if anything
+    violations = validate_packed_boxes(packed_boxes, item_groups)
+    if violations:
+        raise ValidationError(violations)
+
+
+def validate_placements(
+    box_dims: tuple[float, float, float],
+    item_dims: list[tuple[float, float, float]],
+    placements: list,
+) -> list[Violation]:
+    """Everything wrong with a solver's placements of items in one box
+
+    Takes `mip.Placement`s, which have the index of the item, where it is
+    and how it's turned.
+    """
+    violations = []
+    seen = set()
+    for placement in placements:
+        if placement.idx in seen:
+            violations.append(Violation(ViolationKind.QUANTITY, 0, f"Item {placement.idx} is placed more than once"))
+        seen.add(placement.idx)
+        if sorted(placement.dims) != sorted(item_dims[placement.idx]):
+            violations.append(Violation(
+                ViolationKind.PATTERN,
+                0,
+                f"Item {placement.idx} is placed as {tuple(placement.dims)}, not a turn of {tuple(item_dims[placement.idx])}",
+            ))
+        if any(
+            placement.origin[axis] < -EPSILON or placement.origin[axis] + placement.dims[axis] > box_dims[axis] + EPSILON
+            for axis in range(3)
+        ):
+            violations.append(Violation(ViolationKind.OUTSIDE_BOX, 0, f"Item {placement.idx} is outside the box"))
+
+    cuboids = [(*placement.origin, *placement.dims) for placement in placements]
+    for a_idx, b_idx in overlapping_pairs(cuboids):
+        violations.append(Violation(
+            ViolationKind.OVERLAP,
+            0,
+            f"Items {placements[a_idx].idx} and {placements[b_idx].idx} overlap",
+        ))
+    return violations
+
+
+class SampledValidator:
+    """Validates a random sample of packings, as a cheap runtime guard
+
+    Call with each packing. Only `rate` of them are validated, and the
+    violations found are returned, or None if the packing wasn't sampled.
+    """
+
+    def __init__(self, rate: float = 0.01, seed: int | None = None) -> None:
+        self.rate = rate
+        self._rng = random.Random(seed)
+        self.checked = 0
+        self.invalid = 0
+
+    def __call__(
+        self,
+        packed_boxes: list[PackedBox],
+        item_groups: list[ItemGroup] | None = None,
+    ) -> list[Violation] | None:
+        if self._rng.random() >= self.rate:
+            return None
+        violations = validate_packed_boxes(packed_boxes, item_groups)
+        self.checked += 1
+        if violations:
+            self.invalid += 1
+        return violations